@@ -0,0 +1,224 @@
+"""
+OpenAI・Notion APIクライアントのプロセス共通プール。
+
+Streamlitはスクリプトを再実行するたびにモジュールレベルの変数を作り直しますが、
+インポートされたモジュールはプロセス内で保持されるため、ここで作成したクライアントは
+再実行やセッションをまたいで共有され、HTTPのキープアライブ接続（TLSハンドシェイク済み）が再利用されます。
+OpenAI・NotionのSDKはインポートに時間がかかるため、最初にクライアントを作成するときにインポートします
+（アプリの起動時には読み込まない）。
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+import httpx
+
+# 接続プールとタイムアウトの設定
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", "600"))  # 読み込みタイムアウト（秒）。音声のアップロードを考慮して長め
+API_CONNECT_TIMEOUT = float(os.environ.get("API_CONNECT_TIMEOUT", "10"))  # 接続タイムアウト（秒）
+NOTION_TIMEOUT = float(os.environ.get("NOTION_TIMEOUT", "60"))  # Notion APIのタイムアウト（秒）
+API_MAX_CONNECTIONS = int(os.environ.get("API_MAX_CONNECTIONS", "20"))  # サービスごとの最大接続数
+API_MAX_KEEPALIVE = int(os.environ.get("API_MAX_KEEPALIVE", "10"))  # 保持するキープアライブ接続数
+API_KEEPALIVE_EXPIRY = 60  # キープアライブ接続を保持する秒数
+API_MAX_CONCURRENCY = int(os.environ.get("API_MAX_CONCURRENCY", "16"))  # サービスごとの同時リクエスト数の上限
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None  # 接続先の変更（ベンチマーク用の代替サーバーなど）
+NOTION_BASE_URL = os.environ.get("NOTION_BASE_URL") or "https://api.notion.com"
+
+class ClientStats:
+    """
+    サービスごとのリクエスト数・新規接続数・レイテンシの集計
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, new_connection, error=False):
+        with self._lock:
+            self.requests += 1
+            self.new_connections += 1 if new_connection else 0
+            self.errors += 1 if error else 0
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.requests - self.new_connections,
+                "errors": self.errors,
+                "avg_latency": self.total_latency / self.requests if self.requests else 0.0,
+                "max_latency": self.max_latency,
+            }
+
+_stats = {"openai": ClientStats(), "notion": ClientStats()}
+
+def get_client_stats():
+    """
+    サービスごとの接続再利用とレイテンシの統計を返します
+    """
+    return {name: stats.snapshot() for name, stats in _stats.items()}
+
+def _limits():
+    return httpx.Limits(
+        max_connections=API_MAX_CONNECTIONS,
+        max_keepalive_connections=API_MAX_KEEPALIVE,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY,
+    )
+
+class _InstrumentedTransport(httpx.HTTPTransport):
+    """
+    同時リクエスト数を制限し、新規接続の有無と応答ヘッダーまでのレイテンシを記録するトランスポート
+    """
+    def __init__(self, stats, max_concurrency=API_MAX_CONCURRENCY, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def handle_request(self, request):
+        connected = []
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                connected.append(True)
+        request.extensions = {**request.extensions, "trace": trace}
+
+        with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = super().handle_request(request)
+            except Exception:
+                self._stats.record(time.perf_counter() - started, bool(connected), error=True)
+                raise
+            self._stats.record(time.perf_counter() - started, bool(connected))
+            return response
+
+class _AsyncInstrumentedTransport(httpx.AsyncHTTPTransport):
+    """
+    _InstrumentedTransport の非同期版
+    """
+    def __init__(self, stats, max_concurrency=API_MAX_CONCURRENCY, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def handle_async_request(self, request):
+        connected = []
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                connected.append(True)
+        request.extensions = {**request.extensions, "trace": trace}
+
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = await super().handle_async_request(request)
+            except Exception:
+                self._stats.record(time.perf_counter() - started, bool(connected), error=True)
+                raise
+            self._stats.record(time.perf_counter() - started, bool(connected))
+            return response
+
+def _http_client(service, timeout):
+    return httpx.Client(
+        transport=_InstrumentedTransport(_stats[service], limits=_limits()),
+        timeout=httpx.Timeout(timeout, connect=API_CONNECT_TIMEOUT),
+    )
+
+def _async_http_client(service, timeout):
+    return httpx.AsyncClient(
+        transport=_AsyncInstrumentedTransport(_stats[service], limits=_limits()),
+        timeout=httpx.Timeout(timeout, connect=API_CONNECT_TIMEOUT),
+    )
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_or_create(key, factory):
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+        return client
+
+def get_openai_client(api_key):
+    """
+    APIキーごとに共有されるOpenAIクライアントを返します。
+    再試行は呼び出し側（call_with_retries）で行うため、SDKの自動再試行は無効にしています。
+    """
+    from openai import OpenAI
+
+    return _get_or_create(("openai", api_key), lambda: OpenAI(
+        api_key=api_key,
+        base_url=OPENAI_BASE_URL,
+        http_client=_http_client("openai", API_TIMEOUT),
+        max_retries=0,
+    ))
+
+def get_notion_client(api_key):
+    """
+    APIキーごとに共有されるNotionクライアントを返します
+    """
+    from notion_client import Client
+
+    return _get_or_create(("notion", api_key), lambda: Client(
+        auth=api_key,
+        base_url=NOTION_BASE_URL,
+        client=_http_client("notion", NOTION_TIMEOUT),
+        timeout_ms=int(NOTION_TIMEOUT * 1000),
+    ))
+
+# 非同期クライアントはイベントループをまたいで使用できないため、ループごとに保持する。
+# ループをキーにした弱参照の辞書のため、ループが破棄されるとそのループのクライアントも解放される
+_async_clients = weakref.WeakKeyDictionary()
+
+def _get_or_create_async(key, factory):
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = factory()
+        return client
+
+def get_async_openai_client(api_key):
+    """
+    実行中のイベントループとAPIキーごとに共有される非同期OpenAIクライアントを返します
+    """
+    from openai import AsyncOpenAI
+
+    return _get_or_create_async(("openai", api_key), lambda: AsyncOpenAI(
+        api_key=api_key,
+        base_url=OPENAI_BASE_URL,
+        http_client=_async_http_client("openai", API_TIMEOUT),
+        max_retries=0,
+    ))
+
+def get_async_notion_client(api_key):
+    """
+    実行中のイベントループとAPIキーごとに共有される非同期Notionクライアントを返します
+    """
+    from notion_client import AsyncClient
+
+    return _get_or_create_async(("notion", api_key), lambda: AsyncClient(
+        auth=api_key,
+        base_url=NOTION_BASE_URL,
+        client=_async_http_client("notion", NOTION_TIMEOUT),
+        timeout_ms=int(NOTION_TIMEOUT * 1000),
+    ))
+
+async def aclose_async_clients():
+    """
+    実行中のイベントループの非同期クライアントの接続を閉じます（ループを終了する前に呼び出します）
+    """
+    with _clients_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        # OpenAIのクライアントは close()、Notionのクライアントは aclose() で接続を閉じる
+        close = getattr(client, "aclose", None) or client.close
+        await close()
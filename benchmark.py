@@ -0,0 +1,368 @@
+"""
+文字起こし・要約・Notion保存のベンチマーク。
+
+ローカルの代替サーバー（mock_api_server.py）をOpenAI・Notion APIの代わりに使用し、
+合成した音声ファイルをコマンドライン版と同じ処理（minutes_cli.process_batch）で処理して、
+シナリオごとに全体の所要時間・段階ごとの所要時間・ピークRSS・一時ディスク使用量を計測します。
+各シナリオは別プロセスで実行するため、ピークRSSやキャッシュの状態はシナリオ間で影響しません
+（文字起こし・要約のキャッシュは無効にして計測します）。
+
+使用例:
+    python benchmark.py                                  # すべてのシナリオ
+    python benchmark.py --scenario 10min --scenario concurrent-10
+    python benchmark.py --rate-limit 5 --error-rate 0.02 --output bench.json
+    python benchmark.py --startup 5                      # アプリのインポート（起動時間）のみ
+    python benchmark.py --scenario 10min --backend local # ローカルの faster-whisper で文字起こし（APIとの比較）
+"""
+import argparse
+import array
+import importlib.util
+import json
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import mock_api_server
+
+# シナリオ: 音声の長さ（秒）・形式・ファイル数・同時に処理するファイル数
+SCENARIOS = {
+    "10min": {"duration": 600, "format": "m4a", "files": 1, "concurrency": 1},
+    "10min-wav": {"duration": 600, "format": "wav", "files": 1, "concurrency": 1},
+    "2h": {"duration": 7200, "format": "m4a", "files": 1, "concurrency": 1},
+    "concurrent-10": {"duration": 600, "format": "m4a", "files": 10, "concurrency": 10},
+}
+
+# 形式ごとのエンコード設定（wav は標準ライブラリで直接書き出す）
+FIXTURE_FORMATS = {
+    "wav": {"sample_rate": 44100, "channels": 2},
+    "m4a": {"sample_rate": 16000, "channels": 1, "ffmpeg": ["-c:a", "aac", "-b:a", "64k"]},
+    "mp4": {"sample_rate": 16000, "channels": 1, "ffmpeg": ["-c:a", "aac", "-b:a", "128k"]},
+}
+
+FIXTURES_DIR = os.path.expanduser(os.environ.get("BENCH_FIXTURES_DIR", "~/.cache/minutes_webapp/bench_fixtures"))
+TONE_SECONDS = 10.0  # 発話を模した音の長さ
+SILENCE_SECONDS = 1.5  # 発話の間の無音（無音検出による分割を計測するため）
+SAMPLE_INTERVAL = 0.25  # 一時ディスク使用量を確認する間隔（秒）
+STARTUP_TOP_MODULES = 10  # 起動時間の計測で表示するインポートの遅いモジュールの数
+
+def _write_wav(path, duration, sample_rate, channels, frequency):
+    """
+    発話（正弦波）と無音を交互に繰り返すWAVファイルを書き出します
+    """
+    tone = array.array("h", (
+        int(8000 * math.sin(2 * math.pi * frequency * i / sample_rate))
+        for i in range(int(TONE_SECONDS * sample_rate))
+        for _ in range(channels)
+    ))
+    silence = array.array("h", [0] * int(SILENCE_SECONDS * sample_rate) * channels)
+    pattern = tone.tobytes() + silence.tobytes()
+    total = int(duration * sample_rate) * channels * 2
+    with wave.open(path, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        written = 0
+        while written < total:
+            block = pattern[:total - written]
+            out.writeframes(block)
+            written += len(block)
+
+def make_fixture(duration, fmt, variant=0, fixtures_dir=FIXTURES_DIR):
+    """
+    合成音声ファイルを作成します（作成済みなら再利用）。
+    variant ごとに音の高さを変え、同じ長さでも内容（ハッシュ）の異なるファイルにします。
+    :return: ファイルのパス
+    """
+    os.makedirs(fixtures_dir, exist_ok=True)
+    path = os.path.join(fixtures_dir, f"bench_{duration}s_{variant}.{fmt}")
+    if os.path.exists(path):
+        return path
+
+    spec = FIXTURE_FORMATS[fmt]
+    frequency = 220 + 20 * variant
+    tmp_path = path + ".tmp.wav"
+    try:
+        _write_wav(tmp_path, duration, spec["sample_rate"], spec["channels"], frequency)
+        if "ffmpeg" in spec:
+            subprocess.run(
+                ["ffmpeg", "-y", "-v", "error", "-i", tmp_path, *spec["ffmpeg"], "-f", "mp4", path + ".part"],
+                check=True
+            )
+            os.replace(path + ".part", path)
+        else:
+            os.replace(tmp_path, path)
+    finally:
+        for leftover in (tmp_path, path + ".part"):
+            if os.path.exists(leftover):
+                os.unlink(leftover)
+    return path
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class DiskUsageSampler:
+    """
+    ディレクトリの合計サイズを定期的に確認し、最大値を記録します
+    """
+    def __init__(self, path, interval=SAMPLE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, _dir_size(self.path))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _dir_size(self.path))
+        return False
+
+def _aggregate_stages(records):
+    """
+    ファイルごとの段階別所要時間を合計します
+    """
+    stages = {}
+    for record in records:
+        for stage, entry in (record.get("telemetry") or {}).get("stages", {}).items():
+            total = stages.setdefault(stage, {"seconds": 0.0, "count": 0, "max_seconds": 0.0})
+            total["seconds"] += entry["seconds"]
+            total["count"] += entry["count"]
+            total["max_seconds"] = max(total["max_seconds"], entry["max_seconds"])
+    return stages
+
+def run_scenario(name, paths, concurrency, notion, result_file, backend="openai"):
+    """
+    （子プロセス内で実行）シナリオの音声ファイルを処理し、計測結果をJSONで書き出します
+    :param backend: 文字起こしエンジンの名前（"openai", "local"）
+    """
+    import minutes_cli
+
+    minutes_cli._silence_streamlit_logs()
+    started = time.perf_counter()
+    with DiskUsageSampler(tempfile.gettempdir()) as disk:
+        records = minutes_cli.process_batch(
+            paths, os.environ["OPENAI_API_KEY"],
+            concurrency=concurrency,
+            manifest_path=None,
+            skip_processed=False,
+            notion_api_key=os.environ["NOTION_API_KEY"] if notion else None,
+            notion_database_id=os.environ["NOTION_DATABASE_ID"] if notion else None,
+            backend=backend,
+        )
+    wall_seconds = time.perf_counter() - started
+
+    # Linuxの ru_maxrss はKB単位（子プロセスはffmpegなどのうち最大のもの）
+    result = {
+        "scenario": name,
+        "backend": backend,
+        "wall_seconds": wall_seconds,
+        "files": len(records),
+        "ok": sum(1 for r in records if r["status"] == "ok"),
+        "errors": [r.get("error") for r in records if r["status"] == "error"],
+        "per_file_seconds": [r.get("timings", {}).get("total") for r in records if r["status"] == "ok"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "peak_temp_mb": disk.peak_bytes / 1024 / 1024,
+        "stages": _aggregate_stages(records),
+    }
+    with open(result_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+def benchmark(name, spec, mock_config, notion=True, fixtures_dir=FIXTURES_DIR, backend="openai"):
+    """
+    代替サーバーを起動し、シナリオを別プロセスで実行して結果を返します
+    :param backend: 文字起こしエンジンの名前（"local" の場合、代替サーバーは要約とNotionだけに使用）
+    """
+    paths = [make_fixture(spec["duration"], spec["format"], variant=i, fixtures_dir=fixtures_dir)
+             for i in range(spec["files"])]
+    server, state = mock_api_server.start_server(mock_config)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    work_dir = tempfile.mkdtemp(prefix="minutes_bench_")
+    result_file = os.path.join(work_dir, "result.json")
+    tmp_dir = os.path.join(work_dir, "tmp")
+    os.makedirs(tmp_dir)
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"{url}/v1",
+        "NOTION_BASE_URL": url,
+        "OPENAI_API_KEY": "sk-bench",
+        "NOTION_API_KEY": "secret_bench",
+        "NOTION_DATABASE_ID": "bench-database",
+        "MINUTES_CACHE_ENABLED": "0",
+        # チェックポイント・検索インデックス・ジョブは実行ごとの作業ディレクトリに書き込み、利用者のデータと混ぜない
+        "MINUTES_CHECKPOINT_DIR": os.path.join(work_dir, "checkpoints"),
+        "MINUTES_INDEX_PATH": os.path.join(work_dir, "meetings.sqlite3"),
+        "MINUTES_JOBS_DIR": os.path.join(work_dir, "jobs"),
+        "TMPDIR": tmp_dir,
+    }
+    try:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-scenario", name,
+             "--concurrency", str(spec["concurrency"]), "--result-file", result_file, "--backend", backend,
+             *(["--no-notion"] if not notion else []), "--", *paths],
+            env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+        )
+        with open(result_file, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result["audio_seconds"] = spec["duration"] * spec["files"]
+    result["fixture_mb"] = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+    result["mock"] = state.snapshot()
+    return result
+
+def measure_startup(runs=5, module="minutes_webapp"):
+    """
+    新しいプロセスでアプリのモジュールをインポートする時間（起動時間のうちスクリプトの読み込み分）を計測します。
+    python -X importtime の出力から、アプリが直接インポートしたモジュールのうち時間がかかったものも集計します。
+    :return: 計測結果の辞書
+    """
+    wall = []
+    modules = {}
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            text=True, check=True,
+        )
+        wall.append(time.perf_counter() - started)
+        for line in completed.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            parts = line.split("|")
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            name = parts[2].rstrip()
+            # アプリのモジュールが直接インポートしたもの（字下げ1段）だけを集計する
+            if len(name) - len(name.lstrip()) != 3:
+                continue
+            modules.setdefault(name.strip(), []).append(int(parts[1]) / 1e6)
+    wall.sort()
+    top = sorted(((name, sorted(times)[len(times) // 2]) for name, times in modules.items()), key=lambda item: -item[1])
+    return {
+        "module": module,
+        "runs": runs,
+        "median_seconds": wall[len(wall) // 2],
+        "min_seconds": wall[0],
+        "top_imports": top[:STARTUP_TOP_MODULES],
+    }
+
+def format_startup_report(result):
+    lines = [
+        f"== 起動時間（import {result['module']}、{result['runs']}回）",
+        f"  中央値: {result['median_seconds']:.2f}秒 / 最小: {result['min_seconds']:.2f}秒（Pythonの起動を含む）",
+    ]
+    for name, seconds in result["top_imports"]:
+        lines.append(f"    {name:<24} {seconds:.3f}秒")
+    return "\n".join(lines)
+
+def format_report(result):
+    lines = [
+        f"== {result['scenario']} [{result.get('backend', 'openai')}]（音声 {result['audio_seconds'] / 60:.0f}分 / {result['files']}ファイル / {result['fixture_mb']:.1f}MB）",
+        f"  全体: {result['wall_seconds']:.1f}秒（成功 {result['ok']}/{result['files']}、"
+        f"実時間比 {result['audio_seconds'] / max(result['wall_seconds'], 1e-9):.0f}倍速）",
+        f"  ピークRSS: {result['peak_rss_mb']:.0f}MB（子プロセス最大 {result['peak_child_rss_mb']:.0f}MB） / "
+        f"一時ディスク最大: {result['peak_temp_mb']:.1f}MB",
+        f"  APIリクエスト: {result['mock']['total_requests']}件（429: {result['mock']['rate_limited']}件、"
+        f"500: {result['mock']['errors']}件、送信 {result['mock']['bytes_received'] / 1024 / 1024:.1f}MB、"
+        f"キャッシュ済み入力 {result['mock']['cached_tokens']}トークン）",
+    ]
+    for stage, entry in sorted(result["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        lines.append(
+            f"    {stage:<14} 合計 {entry['seconds']:8.2f}秒 / {entry['count']:4d}回 / 最大 {entry['max_seconds']:.2f}秒"
+        )
+    for error in result["errors"]:
+        lines.append(f"  エラー: {error}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="代替サーバーを使って処理時間・メモリ・一時ディスク使用量を計測します")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="実行するシナリオ（複数指定可。省略時はすべて）")
+    parser.add_argument("--whisper-latency", type=float, default=0.5, help="Whisperの基本応答時間（秒）")
+    parser.add_argument("--whisper-seconds-per-mb", type=float, default=0.5, help="音声1MBあたりの追加応答時間（秒）")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="チャット補完の基本応答時間（秒）")
+    parser.add_argument("--notion-latency", type=float, default=0.2, help="Notion APIの応答時間（秒）")
+    parser.add_argument("--rate-limit", type=int, default=0, help="サービスごとの1秒あたりのリクエスト数の上限（0で無制限）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500エラーを返す確率")
+    parser.add_argument("--seed", type=int, default=0, help="エラー注入の乱数シード")
+    parser.add_argument("--no-notion", action="store_true", help="Notionへの保存を計測に含めない")
+    parser.add_argument("--backend", choices=["openai", "local"], default="openai",
+                        help="文字起こしエンジン（local は faster-whisper が必要。APIとの比較用）")
+    parser.add_argument("--fixtures-dir", default=FIXTURES_DIR, help="合成音声ファイルの保存先")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    parser.add_argument("--startup", type=int, metavar="N", help="アプリのインポート時間をN回計測する（シナリオは実行しない）")
+    # 以下は子プロセスの実行用
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        run_scenario(args.run_scenario, args.paths, args.concurrency, not args.no_notion, args.result_file,
+                     backend=args.backend)
+        return 0
+
+    if args.startup:
+        result = measure_startup(args.startup)
+        print(format_startup_report(result), flush=True)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"startup": result}, f, ensure_ascii=False, indent=2)
+        return 0
+
+    if shutil.which("ffmpeg") is None:
+        parser.error("ベンチマークにはFFmpegが必要です（音声の作成と分割に使用します）。")
+    if args.backend == "local" and importlib.util.find_spec("faster_whisper") is None:
+        parser.error("--backend local には faster-whisper が必要です（pip install faster-whisper）。")
+
+    mock_config = mock_api_server.MockConfig(
+        whisper_latency=args.whisper_latency,
+        whisper_seconds_per_mb=args.whisper_seconds_per_mb,
+        chat_latency=args.chat_latency,
+        notion_latency=args.notion_latency,
+        rate_limit=args.rate_limit,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        result = benchmark(name, SCENARIOS[name], mock_config, notion=not args.no_notion,
+                           fixtures_dir=args.fixtures_dir, backend=args.backend)
+        print(format_report(result), flush=True)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": mock_config.to_dict(), "results": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+長い音声の文字起こしのチャンク単位のチェックポイント。
+
+分割した音声の文字起こしごとに、各チャンクの状態（完了・失敗）と結果をディスクに記録します。
+- 途中で中断・失敗した文字起こしを再実行すると、完了済みのチャンクは記録から読み込み、未完了のチャンクだけを送信します
+- 失敗したチャンクは音声を保存しておき、元の音声ファイルがなくても失敗分だけを再試行できます
+チェックポイントはキャッシュの設定（MINUTES_CACHE_ENABLED）とは関係なく記録し、一定期間で削除します
+（キャッシュを無効にした場合、記録済みのチェックポイントを読み込むのは再試行・中断したジョブの再開のときだけです）。
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+CHECKPOINT_DIR = os.environ.get(
+    "MINUTES_CHECKPOINT_DIR", os.path.join(Path.home(), ".cache", "minutes_webapp", "checkpoints")
+)
+CHECKPOINT_MAX_AGE = int(os.environ.get("MINUTES_CHECKPOINT_MAX_DAYS", "14")) * 24 * 60 * 60  # 秒
+
+# チャンクの状態
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+def _chunk_key(chunk):
+    # 同じ分割結果かどうかはチャンクの時刻と形式で判定する
+    return f"{chunk['format']}:{chunk['start']:.3f}-{chunk['end']:.3f}"
+
+def _write_json(path, value):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+class ChunkCheckpoint:
+    """
+    1回の文字起こし（音声・エンジン・言語の組み合わせ）のチャンクごとの状態と結果。
+    状態は manifest.json に、チャンクの結果は chunk_0000.json に、失敗したチャンクの音声は chunk_0000.<拡張子> に保存します。
+    """
+    def __init__(self, checkpoint_id, checkpoint_dir=CHECKPOINT_DIR):
+        self.checkpoint_id = checkpoint_id
+        self.dir = os.path.join(checkpoint_dir, checkpoint_id)
+        self._lock = threading.Lock()
+        self.manifest = self._load()
+
+    def _manifest_path(self):
+        return os.path.join(self.dir, "manifest.json")
+
+    def _load(self):
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self.manifest["updated_at"] = time.time()
+        _write_json(self._manifest_path(), self.manifest)
+
+    def exists(self):
+        return self.manifest is not None
+
+    def begin(self, chunks, **info):
+        """
+        分割結果を記録します。以前の記録と時刻・形式が同じチャンクは状態と結果を引き継ぎます。
+        :param chunks: split_audio_ffmpeg が返すチャンクのリスト
+        :param info: 再試行に必要な情報（エンジン名・モデル・言語など）
+        """
+        previous = {}
+        if self.manifest is not None:
+            previous = {_chunk_key(c): c for c in self.manifest["chunks"]}
+        entries = []
+        for i, chunk in enumerate(chunks):
+            entry = {"start": chunk["start"], "end": chunk["end"], "format": chunk["format"],
+                     "status": STATUS_PENDING, "error": None, "audio": None, "result": None}
+            old = previous.get(_chunk_key(chunk))
+            if old is not None and old["status"] == STATUS_DONE:
+                entry.update(status=STATUS_DONE, result=old["result"])
+            elif old is not None and old["status"] == STATUS_FAILED:
+                entry.update(status=STATUS_FAILED, error=old["error"], audio=old["audio"])
+            entries.append(entry)
+        with self._lock:
+            self.manifest = {"info": info, "chunks": entries, "created_at": time.time()}
+            self._save()
+
+    @property
+    def chunks(self):
+        return self.manifest["chunks"] if self.manifest else []
+
+    @property
+    def info(self):
+        return self.manifest["info"] if self.manifest else {}
+
+    def result(self, index):
+        """
+        完了したチャンクの文字起こし結果（オフセット調整前の辞書）を返します（未完了ならNone）
+        """
+        entry = self.chunks[index]
+        if entry["status"] != STATUS_DONE or not entry["result"]:
+            return None
+        try:
+            with open(os.path.join(self.dir, entry["result"]), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def mark_done(self, index, result):
+        """
+        チャンクの完了を記録します。失敗時に保存した音声は不要になるため削除します。
+        :param result: オフセット調整前の文字起こし結果の辞書
+        """
+        with self._lock:
+            entry = self.chunks[index]
+            name = f"chunk_{index:04d}.json"
+            os.makedirs(self.dir, exist_ok=True)
+            _write_json(os.path.join(self.dir, name), result)
+            if entry["audio"]:
+                try:
+                    os.unlink(os.path.join(self.dir, entry["audio"]))
+                except OSError:
+                    pass
+            entry.update(status=STATUS_DONE, result=name, error=None, audio=None)
+            self._save()
+
+    def mark_failed(self, index, error, audio_path=None):
+        """
+        チャンクの失敗を記録し、再試行できるようにチャンクの音声を保存します
+        :param audio_path: チャンクの音声ファイル（一時ディレクトリにあるもの）
+        """
+        with self._lock:
+            entry = self.chunks[index]
+            if audio_path and os.path.exists(audio_path) and not entry["audio"]:
+                os.makedirs(self.dir, exist_ok=True)
+                name = f"chunk_{index:04d}{Path(audio_path).suffix}"
+                shutil.copyfile(audio_path, os.path.join(self.dir, name))
+                entry["audio"] = name
+            entry.update(status=STATUS_FAILED, error=str(error))
+            self._save()
+
+    def audio_path(self, index):
+        """
+        保存した失敗チャンクの音声のパス（保存していなければNone）
+        """
+        entry = self.chunks[index]
+        return os.path.join(self.dir, entry["audio"]) if entry["audio"] else None
+
+    def failed(self):
+        """
+        完了していないチャンクの番号のリスト
+        """
+        return [i for i, entry in enumerate(self.chunks) if entry["status"] != STATUS_DONE]
+
+    def is_complete(self):
+        return self.exists() and bool(self.chunks) and not self.failed()
+
+    def remove(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def reset(self):
+        """
+        記録済みの状態と結果を削除し、最初から記録し直せるようにします
+        """
+        with self._lock:
+            self.remove()
+            self.manifest = None
+
+_evicted = False
+
+def open_checkpoint(checkpoint_id, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    チェックポイントを開きます（存在しなければ新規）。プロセスで最初の呼び出し時に期限切れのものを削除します。
+    """
+    global _evicted
+    if not _evicted:
+        _evicted = True
+        evict(checkpoint_dir)
+    return ChunkCheckpoint(checkpoint_id, checkpoint_dir)
+
+def evict(checkpoint_dir=CHECKPOINT_DIR, max_age=CHECKPOINT_MAX_AGE):
+    """
+    最終更新から max_age 秒を過ぎたチェックポイントを削除します
+    """
+    now = time.time()
+    for manifest in Path(checkpoint_dir).glob("*/manifest.json"):
+        try:
+            if now - manifest.stat().st_mtime > max_age:
+                shutil.rmtree(manifest.parent, ignore_errors=True)
+        except OSError:
+            continue
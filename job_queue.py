@@ -0,0 +1,516 @@
+"""
+会議録作成ジョブのキュー（SQLite）とワーカープロセス。
+
+Streamlitのスクリプト実行とは別のプロセスで文字起こし・サマリー生成・Notionへの保存を行うため、
+ページの再読み込みやブラウザの切断があっても処理が継続します。
+ワーカーが異常終了した場合は、ハートビートが途絶えたジョブを別のワーカーが再開します
+（チャンク単位のチェックポイントにより、文字起こし済みのチャンクは再送信されません）。
+一部のチャンクの文字起こしに失敗して完了したジョブは、失敗したチャンクだけを再試行できます。
+
+ワーカーの起動: python job_queue.py --workers 2
+"""
+import argparse
+import contextlib
+import fcntl
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+import telemetry
+from segment_store import SegmentStore
+
+# ジョブの保存先とワーカーの設定
+JOBS_DIR = os.environ.get("MINUTES_JOBS_DIR", os.path.join(Path.home(), ".cache", "minutes_webapp", "jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))  # ワーカープロセス数
+JOB_MAX_ATTEMPTS = 3  # ジョブの最大試行回数
+JOB_HEARTBEAT_INTERVAL = 10  # ハートビートの間隔（秒）
+JOB_STALE_SECONDS = 120  # この秒数ハートビートがない実行中ジョブは再実行する
+JOB_POLL_INTERVAL = 2  # ワーカーとUIのポーリング間隔（秒）
+
+# ジョブの状態
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+STATUS_LABELS = {
+    STATUS_QUEUED: "待機中",
+    STATUS_RUNNING: "処理中",
+    STATUS_DONE: "完了",
+    STATUS_FAILED: "失敗",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    title TEXT NOT NULL,
+    file_date TEXT,
+    params TEXT NOT NULL DEFAULT '{}',
+    progress TEXT NOT NULL DEFAULT '',
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+def _connect():
+    """
+    ジョブデータベースに接続します（自動コミット、WALモード）
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(JOBS_DIR, "jobs.sqlite3"), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _job_dir(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"] or "{}")
+    return job
+
+def submit_job(source_path, filename, title, file_date, save_to_notion=False, backend="openai",
+               upload_seconds=None, trim_silence=False, extra_files=None, multi=None):
+    """
+    ジョブを登録します。音声ファイルはジョブ用のディレクトリに移動し、ジョブ終了まで保持します。
+    :param source_path: ディスクに書き出し済みの音声ファイルのパス（移動されます）
+    :param backend: 文字起こしエンジンの名前（"openai", "local"）
+    :param upload_seconds: アップロードの書き出しにかかった秒数（処理時間の内訳に含める）
+    :param trim_silence: Trueの場合は長い無音区間を除去してから送信する
+    :param extra_files: 同じ会議として一緒に処理する2つ目以降の音声ファイルの (パス, ファイル名) のリスト（移動されます）
+    :param multi: 複数ファイルの扱い（{"mode": ..., "order": ..., "speakers": [...]}、minutes_webapp.transcribe_multiple の引数）
+    :return: ジョブID
+    """
+    job_id = uuid.uuid4().hex
+    job_dir = _job_dir(job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    # 拡張子は書き出し済みのファイルから取る（複数ファイルの表示名「○○ 他n件」からは拡張子を取れないため）
+    file_path = os.path.join(job_dir, "source" + Path(source_path).suffix.lower())
+    shutil.move(source_path, file_path)
+    params = {"save_to_notion": save_to_notion, "backend": backend, "upload_seconds": upload_seconds,
+              "trim_silence": trim_silence}
+    if extra_files:
+        params["files"] = []
+        for i, (path, name) in enumerate(extra_files, start=1):
+            extra_path = os.path.join(job_dir, f"source_{i}" + Path(path).suffix.lower())
+            shutil.move(path, extra_path)
+            params["files"].append({"path": extra_path, "filename": name})
+        params["multi"] = multi or {}
+
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, status, filename, file_path, title, file_date, params, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, STATUS_QUEUED, filename, file_path, title, file_date, json.dumps(params), now, now)
+        )
+    finally:
+        conn.close()
+    return job_id
+
+def get_job(job_id, with_result=True):
+    """
+    ジョブの情報を取得します。完了したジョブには "result" が含まれます。
+    :param with_result: Falseの場合は結果のファイルを読み込まない（結果は read_result で別に取得）
+    """
+    conn = _connect()
+    try:
+        job = _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+    if job and job["status"] == STATUS_DONE and with_result:
+        job["result"] = _read_result(job_id)
+    return job
+
+def read_result(job_id):
+    """
+    完了したジョブの結果（result.json とセグメント）を読み込みます（見つからない場合はNone）
+    """
+    return _read_result(job_id)
+
+def _read_result(job_id):
+    try:
+        with open(os.path.join(_job_dir(job_id), "result.json"), "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # セグメントは別ファイル（バイナリ形式）に保存している。以前のジョブは result.json の辞書のリストのまま
+    try:
+        with open(os.path.join(_job_dir(job_id), "segments.bin"), "rb") as f:
+            result["segments"] = SegmentStore.from_bytes(f.read())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        result["segments"] = None
+    return result
+
+def list_jobs(limit=20):
+    """
+    最近のジョブを新しい順に返します
+    """
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+    return [_row_to_job(row) for row in rows]
+
+def retry_job(job_id):
+    """
+    失敗したジョブを待機中に戻します（完了済みのチャンクはチェックポイントから読み込む）
+    """
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, params = json_set(params, '$.resume', json('true')), attempts = 0, "
+            "error = NULL, updated_at = ? WHERE id = ? AND status = ?",
+            (STATUS_QUEUED, time.time(), job_id, STATUS_FAILED)
+        )
+    finally:
+        conn.close()
+
+def retry_failed_chunks(job_id):
+    """
+    文字起こしに失敗したチャンクがある完了済みのジョブを、失敗したチャンクだけを再試行するジョブとして待機中に戻します。
+    複数ファイルのジョブは音声を保持しているため全ファイルを処理し直します（完了済みのチャンクはチェックポイントから読み込む）。
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT params FROM jobs WHERE id = ? AND status = ?", (job_id, STATUS_DONE)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return
+        params = {**json.loads(row["params"] or "{}"), "retry_chunks": True}
+        conn.execute(
+            "UPDATE jobs SET status = ?, params = ?, attempts = 0, error = NULL, progress = '', updated_at = ? WHERE id = ?",
+            (STATUS_QUEUED, json.dumps(params), time.time(), job_id)
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def update_progress(job_id, message):
+    """
+    ジョブの進捗メッセージとハートビートを更新します
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET progress = ?, updated_at = ?, heartbeat_at = ? WHERE id = ?",
+            (message, now, now, job_id)
+        )
+    finally:
+        conn.close()
+
+def _heartbeat(job_id):
+    conn = _connect()
+    try:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+    finally:
+        conn.close()
+
+def claim_job(worker_id):
+    """
+    最も古い待機中のジョブを1件取得して実行中にします。
+    ハートビートが途絶えた実行中のジョブ（ワーカーの異常終了など）は先に待機中に戻します。
+    試行回数が上限に達したジョブは、ワーカーを繰り返し異常終了させないように失敗にします（fail_job と同じ上限）。
+    :return: ジョブの辞書、または待機中のジョブがなければNone
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, worker = NULL, "
+            "progress = CASE WHEN attempts < ? THEN '前回の処理が中断されたため再開します' ELSE progress END, "
+            "error = CASE WHEN attempts < ? THEN error ELSE '処理中にワーカーが異常終了しました' END, updated_at = ? "
+            "WHERE status = ? AND COALESCE(heartbeat_at, updated_at) < ?",
+            (JOB_MAX_ATTEMPTS, STATUS_QUEUED, STATUS_FAILED, JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, now,
+             STATUS_RUNNING, now - JOB_STALE_SECONDS)
+        )
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (STATUS_QUEUED,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, updated_at = ?, heartbeat_at = ? "
+            "WHERE id = ?",
+            (STATUS_RUNNING, worker_id, now, now, row["id"])
+        )
+        conn.execute("COMMIT")
+        job = _row_to_job(row)
+        job["attempts"] += 1
+        return job
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def complete_job(job_id, result):
+    """
+    ジョブの結果を保存して完了にします。音声ファイルは不要になるため削除します
+    （複数ファイルのジョブで失敗したチャンクがある場合は、再試行のために保持します）。
+    セグメント（SegmentStore）は result.json とは別に segments.bin にバイナリ形式で保存します。
+    """
+    job_dir = _job_dir(job_id)
+    result = dict(result)
+    segments = result.pop("segments", None)
+    if segments is not None:
+        tmp_path = os.path.join(job_dir, "segments.bin.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(SegmentStore.from_value(segments).to_bytes())
+        os.replace(tmp_path, os.path.join(job_dir, "segments.bin"))
+    tmp_path = os.path.join(job_dir, "result.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(job_dir, "result.json"))
+
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT file_path, params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.execute(
+            "UPDATE jobs SET status = ?, progress = '完了', error = NULL, updated_at = ? WHERE id = ?",
+            (STATUS_DONE, time.time(), job_id)
+        )
+    finally:
+        conn.close()
+    if row is None:
+        return
+    extra_files = json.loads(row["params"] or "{}").get("files") or []
+    if extra_files and result.get("failed_chunks"):
+        return
+    for path in [row["file_path"]] + [f["path"] for f in extra_files]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def fail_job(job_id, error):
+    """
+    ジョブの失敗を記録します。試行回数が上限未満なら待機中に戻して再実行します。
+    """
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+            "error = ?, worker = NULL, updated_at = ? WHERE id = ?",
+            (JOB_MAX_ATTEMPTS, STATUS_QUEUED, STATUS_FAILED, error, time.time(), job_id)
+        )
+    finally:
+        conn.close()
+
+def process_job(job):
+    """
+    ジョブを1件処理します（文字起こし → サマリー生成 → 必要に応じてNotionへ保存）。
+    失敗したチャンクの再試行（params の retry_chunks）では、チェックポイントに保存した失敗チャンクだけを送信します。
+    :return: 結果の辞書
+    """
+    # Streamlitアプリのモジュールはワーカー内でだけ読み込む（循環インポートを避ける）
+    import minutes_webapp as app
+
+    config = app.load_config()
+    api_key = config["openai"]["api_key"]
+    if not api_key:
+        raise RuntimeError("OpenAI APIキーが設定されていません。")
+
+    job_id = job["id"]
+    update_progress(job_id, "文字起こし中...")
+
+    def on_partial_text(text):
+        update_progress(job_id, f"文字起こし中...（{len(text)}文字）")
+
+    # 段階ごとの所要時間はジョブの結果に保存し、画面に内訳として表示する
+    with telemetry.job(job_id) as metrics:
+        if job["params"].get("upload_seconds") is not None:
+            metrics.add_time("upload_write", job["params"]["upload_seconds"])
+
+        transcribe_stats = {}
+        # 再試行と、中断したジョブの再開ではキャッシュの設定にかかわらず完了済みのチャンクを読み込む
+        resume = (True if job["params"].get("retry_chunks") or job["params"].get("resume") or job["attempts"] > 1
+                  else None)
+        if job["params"].get("files"):
+            # 複数ファイル（連続した録音・参加者ごとのトラック）を並列に文字起こしし、1つの会議として要約する
+            paths = [job["file_path"]] + [f["path"] for f in job["params"]["files"]]
+            multi = job["params"].get("multi") or {}
+            with contextlib.ExitStack() as stack:
+                uploads = [stack.enter_context(app.ingest_upload(path)) for path in paths]
+                text, segments, summary, summary_stats = app.run_multi_pipeline(
+                    uploads, api_key, mode=multi.get("mode", app.MULTI_MODE_SEQUENTIAL),
+                    order=multi.get("order", app.MULTI_ORDER_FILE), speakers=multi.get("speakers"),
+                    backend=job["params"].get("backend", "openai"), stats=transcribe_stats,
+                    trim_silence=job["params"].get("trim_silence", app.TRIM_SILENCE), resume=resume
+                )
+                meeting_id = app.multi_meeting_id(uploads, multi.get("mode", app.MULTI_MODE_SEQUENTIAL))
+        elif job["params"].get("retry_chunks"):
+            # 元の音声は完了時に削除済みのため、前回の結果のチェックポイントから再試行する
+            previous = _read_result(job_id) or {}
+            if not previous.get("checkpoint_id"):
+                raise RuntimeError("再試行するチャンクの記録が見つかりません。")
+            update_progress(job_id, "失敗したチャンクを再試行中...")
+            text, segments = app.retry_failed_chunks(previous["checkpoint_id"], api_key, stats=transcribe_stats)
+            update_progress(job_id, "サマリーを作成中...")
+            summary_stats = {}
+            with telemetry.timer("summary"):
+                summary = app.generate_summary(text, api_key, segments=segments, stats=summary_stats)
+            meeting_id = previous.get("meeting_id") or job_id
+        else:
+            with app.ingest_upload(job["file_path"]) as upload:
+                text, segments, summary, summary_stats = app.run_pipeline(
+                    upload, api_key, on_partial_text=on_partial_text,
+                    backend=job["params"].get("backend", "openai"), stats=transcribe_stats,
+                    trim_silence=job["params"].get("trim_silence", app.TRIM_SILENCE), resume=resume
+                )
+                meeting_id = upload.sha256()
+
+        # 完了した会議は検索インデックスに登録する（ジョブの結果から開けるようにジョブIDも記録）
+        app.record_meeting(meeting_id, job["title"], summary, text, segments, job["file_date"], job["filename"],
+                           source={"job": job_id})
+
+        result = {
+            "meeting_id": meeting_id,
+            "transcription": text,
+            "segments": app.to_segment_store(segments),
+            "summary": summary,
+            "summary_stats": summary_stats,
+            "checkpoint_id": transcribe_stats.get("checkpoint_id"),
+            "failed_chunks": transcribe_stats.get("failed_chunks", []),
+            "notion_result": None,
+        }
+
+        # 文字起こしに欠落がある場合は自動保存せず、再試行で揃ってから保存する
+        notion_config = config["notion"]
+        if (job["params"].get("save_to_notion") and notion_config["api_key"] and notion_config["database_id"]
+                and not result["failed_chunks"]):
+            update_progress(job_id, "Notionに保存中...")
+            result["notion_result"] = app.write_to_notion(
+                notion_config["api_key"],
+                notion_config["database_id"],
+                job["title"],
+                text,
+                summary,
+                job["filename"],
+                job["file_date"],
+                meeting_id=result["meeting_id"],
+                segments=segments
+            )
+    result["telemetry"] = metrics.snapshot()
+    return result
+
+def worker_loop(worker_id=None, stop_event=None, metrics_port=None):
+    """
+    待機中のジョブを取得して処理し続けます
+    :param metrics_port: このワーカーの /metrics を公開するポート（Noneなら公開しない）
+    """
+    worker_id = worker_id or f"worker:{os.getpid()}"
+    telemetry.start_metrics_server(metrics_port)
+    while stop_event is None or not stop_event.is_set():
+        job = claim_job(worker_id)
+        if job is None:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+
+        # 処理中はハートビートを送り続け、他のワーカーに再取得されないようにする
+        done = threading.Event()
+        def beat():
+            while not done.wait(JOB_HEARTBEAT_INTERVAL):
+                _heartbeat(job["id"])
+        beat_thread = threading.Thread(target=beat, daemon=True)
+        beat_thread.start()
+        try:
+            complete_job(job["id"], process_job(job))
+        except Exception as e:
+            traceback.print_exc()
+            fail_job(job["id"], f"{type(e).__name__}: {e}")
+        finally:
+            done.set()
+            beat_thread.join()
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+def ensure_workers(num_workers=JOB_WORKERS):
+    """
+    ワーカープロセスが起動していなければバックグラウンドで起動します。
+    ワーカーはStreamlitのプロセスから切り離して起動するため、アプリの再起動後も処理を継続します。
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    pid_file = os.path.join(JOBS_DIR, "workers.pid")
+    # 複数のセッションが同時に確認して重複して起動しないよう、確認から記録までを排他ロックの中で行う
+    with open(os.path.join(JOBS_DIR, "workers.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(pid_file, "r") as f:
+                if _pid_alive(int(f.read().strip())):
+                    return
+        except (OSError, ValueError):
+            pass
+
+        log = open(os.path.join(JOBS_DIR, "workers.log"), "ab")
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--workers", str(num_workers)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+        log.close()
+        with open(pid_file, "w") as f:
+            f.write(str(process.pid))
+
+def main():
+    parser = argparse.ArgumentParser(description="会議録作成ジョブのワーカーを起動します")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="ワーカープロセス数")
+    parser.add_argument("--metrics-port", type=int, default=telemetry.METRICS_PORT + 1 if telemetry.METRICS_PORT else 0,
+                        help="ワーカーの /metrics を公開する最初のポート（ワーカーごとに1ずつずらす。0で無効）")
+    args = parser.parse_args()
+
+    def port_for(i):
+        return args.metrics_port + i if args.metrics_port else None
+
+    if args.workers <= 1:
+        worker_loop(metrics_port=port_for(0))
+        return
+
+    processes = [
+        multiprocessing.Process(target=worker_loop, name=f"minutes-worker-{i}", daemon=True,
+                                kwargs={"metrics_port": port_for(i)})
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+faster-whisper（CTranslate2）を使用したローカルCPUでの文字起こし。
+
+faster-whisper は任意の依存関係です（pip install faster-whisper）。
+モデルの読み込みには時間がかかるため、読み込んだモデルはプロセス内で保持して再利用します。
+faster-whisper（CTranslate2）のインポート自体にも時間がかかるため、ローカルで文字起こしするときに初めてインポートします。
+"""
+import importlib.util
+import os
+import threading
+from types import SimpleNamespace
+
+# ローカル文字起こしの設定
+LOCAL_WHISPER_MODEL = os.environ.get("LOCAL_WHISPER_MODEL", "small")  # モデルサイズ（tiny, base, small, medium, large-v3など）
+LOCAL_WHISPER_COMPUTE_TYPE = os.environ.get("LOCAL_WHISPER_COMPUTE_TYPE", "int8")  # CPUではint8量子化が最速
+LOCAL_WHISPER_WORKERS = int(os.environ.get("LOCAL_WHISPER_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))  # 同時に処理するチャンク数
+LOCAL_WHISPER_BATCH_SIZE = int(os.environ.get("LOCAL_WHISPER_BATCH_SIZE", "8"))  # バッチ推論のバッチサイズ
+
+_models = {}
+_lock = threading.Lock()
+_available = None
+
+def is_available():
+    """
+    faster-whisper がインストールされているかを返します（インポートせずに確認し、結果はプロセス内で保持）
+    """
+    global _available
+    if _available is None:
+        _available = importlib.util.find_spec("faster_whisper") is not None
+    return _available
+
+def load_model(model_size=LOCAL_WHISPER_MODEL, compute_type=LOCAL_WHISPER_COMPUTE_TYPE,
+               num_workers=LOCAL_WHISPER_WORKERS):
+    """
+    モデルを読み込みます（同じ設定のモデルはプロセス内で共有）。
+    CPUコアは同時に処理するチャンク数で等分して割り当てます。
+    """
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError:
+        raise RuntimeError("faster-whisper がインストールされていません（pip install faster-whisper）。")
+    key = (model_size, compute_type, num_workers)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = WhisperModel(
+                model_size,
+                device="cpu",
+                compute_type=compute_type,
+                cpu_threads=max(1, (os.cpu_count() or 1) // max(1, num_workers)),
+                num_workers=num_workers,
+            )
+            _models[key] = model
+        return model
+
+def transcribe(path, language="ja", model_size=LOCAL_WHISPER_MODEL, compute_type=LOCAL_WHISPER_COMPUTE_TYPE,
+               batch_size=LOCAL_WHISPER_BATCH_SIZE):
+    """
+    音声ファイルを文字起こしし、Whisper APIの verbose_json と同じ属性（text, segments）を持つ結果を返します。
+    バッチ推論（BatchedInferencePipeline）が使える場合は、ファイル内の区間をまとめてデコードします。
+    """
+    model = load_model(model_size, compute_type)
+    try:
+        from faster_whisper import BatchedInferencePipeline
+    except ImportError:
+        BatchedInferencePipeline = None
+    if BatchedInferencePipeline is not None and batch_size > 1:
+        segments, _ = BatchedInferencePipeline(model=model).transcribe(path, language=language, batch_size=batch_size)
+    else:
+        segments, _ = model.transcribe(path, language=language, vad_filter=True)
+
+    # segments はジェネレーターで、反復したときに推論が実行される
+    results = [SimpleNamespace(start=seg.start, end=seg.end, text=seg.text) for seg in segments]
+    return SimpleNamespace(text="".join(seg.text for seg in results).strip(), segments=results)
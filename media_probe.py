@@ -0,0 +1,107 @@
+"""
+FFmpeg/FFprobeの検出と音声ファイルの解析。
+
+ツールの有無はプロセスごとに一度だけ確認し、ファイルの解析（ffprobe）は1ファイル1回にまとめて結果をキャッシュします。
+Streamlitの再実行ではメインスクリプトのモジュール変数が作り直されるため、キャッシュはこのモジュールに保持します。
+"""
+import json
+import os
+import subprocess
+import threading
+
+import telemetry
+
+_tool_cache = {}
+_probe_cache = {}
+_lock = threading.Lock()
+PROBE_CACHE_SIZE = 128  # 保持する解析結果の数
+
+class MediaInfo:
+    """
+    ffprobeで取得した音声・動画ファイルの情報
+    """
+    def __init__(self, data):
+        fmt = data.get("format", {})
+        streams = data.get("streams", [])
+        audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+
+        self.format_name = fmt.get("format_name", "")
+        self.duration = _to_float(fmt.get("duration")) or _to_float(audio.get("duration"))
+        self.bit_rate = _to_int(fmt.get("bit_rate"))
+        self.size = _to_int(fmt.get("size"))
+        self.tags = fmt.get("tags", {})
+        self.audio_codec = audio.get("codec_name")
+        self.audio_bit_rate = _to_int(audio.get("bit_rate"))
+        self.channels = _to_int(audio.get("channels"))
+        self.sample_rate = _to_int(audio.get("sample_rate"))
+        self.has_video = any(
+            s.get("codec_type") == "video" and not s.get("disposition", {}).get("attached_pic")
+            for s in streams
+        )
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "N/A") else None
+    except (TypeError, ValueError):
+        return None
+
+def _to_int(value):
+    number = _to_float(value)
+    return int(number) if number is not None else None
+
+def tool_available(name):
+    """
+    コマンド（ffmpeg / ffprobe）が利用可能かを返します（プロセスごとに一度だけ確認）
+    """
+    with _lock:
+        if name in _tool_cache:
+            return _tool_cache[name]
+    try:
+        subprocess.run([name, "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        available = True
+    except (subprocess.SubprocessError, FileNotFoundError):
+        available = False
+    with _lock:
+        _tool_cache[name] = available
+    return available
+
+def ffmpeg_available():
+    return tool_available("ffmpeg")
+
+def ffprobe_available():
+    return tool_available("ffprobe")
+
+def probe(path):
+    """
+    ffprobeを1回だけ実行してファイルの長さ・コーデック・チャンネル数・ビットレート・タグを取得します。
+    同じファイル（パス・サイズ・更新日時が同じ）の結果はキャッシュから返します。
+    :return: MediaInfo、またはffprobeが利用できない・解析に失敗した場合はNone
+    """
+    if not ffprobe_available():
+        return None
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if key in _probe_cache:
+            return _probe_cache[key]
+
+    cmd = [
+        "ffprobe",
+        "-v", "quiet",
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        path
+    ]
+    try:
+        with telemetry.timer("ffprobe"):
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        info = MediaInfo(json.loads(result.stdout))
+    except (subprocess.SubprocessError, ValueError):
+        info = None
+
+    with _lock:
+        if len(_probe_cache) >= PROBE_CACHE_SIZE:
+            _probe_cache.pop(next(iter(_probe_cache)))
+        _probe_cache[key] = info
+    return info
@@ -0,0 +1,386 @@
+"""
+処理済みの会議の全文検索インデックス（SQLite FTS5）。
+
+会議ごとにタイトル・会議日付・サマリー・セグメント（時刻付きの発言）を登録し、
+「いつ〇〇を決めたか」を全会議から検索できるようにします。
+日本語は単語の区切りがないため、部分一致で検索できる trigram トークナイザーを使用します。
+日本語の単語の多くは2文字のため、2文字以下の検索語は2文字ずつに区切ったテキストの索引（bigram）で検索します。
+テキストは通常のテーブル（segments）に保持し、全文検索のテーブルはその索引だけを持ちます（external content / contentless）。
+同じ会議（音声のハッシュが同じもの）を再登録した場合は会議IDの索引で既存の行だけを置き換えるため、
+会議の数が増えてもジョブの完了ごとに追加で登録できます。
+
+検索: python meeting_index.py 予算
+過去のジョブの結果を登録: python meeting_index.py --backfill
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+INDEX_PATH = os.environ.get(
+    "MINUTES_INDEX_PATH", os.path.join(Path.home(), ".cache", "minutes_webapp", "meetings.sqlite3")
+)
+SEARCH_LIMIT = 50  # 検索結果の最大件数
+TRIGRAM_MIN_CHARS = 3  # trigram インデックスで検索できる最小の文字数（これより短い語は bigram の索引で検索）
+SCHEMA_VERSION = 2  # 索引の構成を変更したら更新する（古い構成のインデックスは開いたときに移行）
+SNIPPET_TOKENS = 24  # 検索結果の抜粋の長さ（trigram では概ね文字数）
+
+# 登録するテキストの種類
+KIND_TITLE = "title"
+KIND_SUMMARY = "summary"
+KIND_SEGMENT = "segment"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meetings (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    filename TEXT,
+    meeting_date TEXT,
+    summary TEXT NOT NULL DEFAULT '',
+    segment_count INTEGER NOT NULL DEFAULT 0,
+    sources TEXT NOT NULL DEFAULT '{}',
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS meetings_date ON meetings (meeting_date);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    meeting_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start REAL,
+    end REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_meeting ON segments (meeting_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5(
+    text,
+    content = 'segments',
+    content_rowid = 'id',
+    tokenize = 'trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_bigram USING fts5(
+    text,
+    content = '',
+    prefix = '1',
+    tokenize = 'unicode61'
+);
+"""
+
+_available = None
+_available_lock = threading.Lock()
+
+def is_available():
+    """
+    SQLiteが FTS5 の trigram トークナイザー（SQLite 3.34以降）に対応しているかを返します
+    """
+    global _available
+    with _available_lock:
+        if _available is None:
+            try:
+                conn = sqlite3.connect(":memory:")
+                conn.execute("CREATE VIRTUAL TABLE t USING fts5(text, tokenize = 'trigram')")
+                conn.close()
+                _available = True
+            except sqlite3.Error:
+                _available = False
+        return _available
+
+def _connect(path=None):
+    """
+    インデックスのデータベースに接続します（自動コミット、WALモード）
+    """
+    path = path or INDEX_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        _migrate(conn)
+    return conn
+
+def _migrate(conn):
+    """
+    古い構成（テキストと会議IDを全文検索のテーブルに保持）のインデックスを、segments テーブルと索引に移行します
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            conn.execute("ROLLBACK")
+            return
+        old = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'entries'").fetchone()
+        rows = []
+        if old is not None and "meeting_id" in old["sql"]:
+            rows = conn.execute("SELECT text, kind, meeting_id, start, end FROM entries ORDER BY rowid").fetchall()
+            conn.execute("DROP TABLE entries")
+        for statement in _SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        _insert_rows(conn, [tuple(row) for row in rows])
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _bigram_text(text):
+    """
+    テキストを2文字ずつ（末尾は1文字）の語に区切った、bigram の索引に登録するテキストを返します
+    （「予算決定」→「予算 算決 決定 定」。1文字の検索語は前方一致で、2文字の検索語は一致で検索できる）
+    """
+    tokens = []
+    for word in text.lower().split():
+        tokens.extend(word[i:i + 2] for i in range(len(word)))
+    return " ".join(tokens)
+
+def _insert_rows(conn, rows):
+    """
+    (text, kind, meeting_id, start, end) の行を segments テーブルと両方の索引に登録します
+    """
+    for text, kind, meeting_id, start, end in rows:
+        row_id = conn.execute(
+            "INSERT INTO segments (meeting_id, kind, start, end, text) VALUES (?, ?, ?, ?, ?)",
+            (meeting_id, kind, start, end, text)
+        ).lastrowid
+        conn.execute("INSERT INTO entries (rowid, text) VALUES (?, ?)", (row_id, text))
+        conn.execute("INSERT INTO entries_bigram (rowid, text) VALUES (?, ?)", (row_id, _bigram_text(text)))
+
+def _delete_meeting_rows(conn, meeting_id):
+    """
+    会議の行を segments テーブルと両方の索引から削除します（会議IDの索引で対象の行だけを取得）
+    """
+    rows = conn.execute("SELECT id, text FROM segments WHERE meeting_id = ?", (meeting_id,)).fetchall()
+    # external content / contentless の索引は、登録したときと同じテキストを渡して削除する
+    conn.executemany("INSERT INTO entries (entries, rowid, text) VALUES ('delete', ?, ?)",
+                     [(row["id"], row["text"]) for row in rows])
+    conn.executemany("INSERT INTO entries_bigram (entries_bigram, rowid, text) VALUES ('delete', ?, ?)",
+                     [(row["id"], _bigram_text(row["text"])) for row in rows])
+    conn.execute("DELETE FROM segments WHERE meeting_id = ?", (meeting_id,))
+
+def _segment_fields(seg):
+    if isinstance(seg, dict):
+        start, end, text, speaker = seg.get("start", 0), seg.get("end", 0), seg.get("text", ""), seg.get("speaker")
+    else:
+        start, end, text = getattr(seg, "start", 0), getattr(seg, "end", 0), getattr(seg, "text", "")
+        speaker = getattr(seg, "speaker", None)
+    # 話者（参加者ごとのトラックの名前）があれば発言に含め、話者名でも検索できるようにする
+    if speaker and text and text.strip():
+        text = f"{speaker}: {text.strip()}"
+    return start, end, text
+
+def index_meeting(meeting_id, title, summary, transcription="", segments=None, meeting_date=None,
+                  filename=None, source=None, path=None):
+    """
+    会議をインデックスに登録します（同じIDの会議は置き換え）。
+    :param meeting_id: 会議のID（音声ファイルのSHA-256ハッシュ）
+    :param segments: 時刻付きのセグメント（オブジェクトまたは辞書）のリスト。なければ文字起こしテキストを1件として登録
+    :param meeting_date: 会議の日付（YYYY-MM-DD）
+    :param source: 保存先の情報（{"notion": URL} など）。既存の情報に追加されます
+    """
+    rows = []
+    for seg in segments or []:
+        start, end, text = _segment_fields(seg)
+        if text and text.strip():
+            rows.append((text.strip(), KIND_SEGMENT, meeting_id, start, end))
+    if not rows and transcription:
+        rows.append((transcription, KIND_SEGMENT, meeting_id, 0, None))
+    rows.append((title, KIND_TITLE, meeting_id, None, None))
+    if summary:
+        rows.append((summary, KIND_SUMMARY, meeting_id, None, None))
+
+    conn = _connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = conn.execute("SELECT sources FROM meetings WHERE id = ?", (meeting_id,)).fetchone()
+            sources = json.loads(existing["sources"]) if existing else {}
+            sources.update(source or {})
+            if existing is not None:
+                _delete_meeting_rows(conn, meeting_id)
+            _insert_rows(conn, rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO meetings (id, title, filename, meeting_date, summary, segment_count, sources, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (meeting_id, title, filename, meeting_date, summary or "",
+                 sum(1 for r in rows if r[1] == KIND_SEGMENT), json.dumps(sources, ensure_ascii=False), time.time())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def _like_pattern(term):
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _make_snippet(text, term, width=SNIPPET_TOKENS):
+    """
+    インデックスを使わずに絞り込んだ結果の抜粋（検索語の前後）を作成します
+    """
+    position = text.lower().find(term.lower())
+    if position < 0:
+        return text[:width * 2]
+    begin = max(0, position - width)
+    end = min(len(text), position + len(term) + width)
+    return (
+        ("…" if begin > 0 else "") + text[begin:position] + "**" + text[position:position + len(term)] + "**" +
+        text[position + len(term):end] + ("…" if end < len(text) else "")
+    )
+
+def _bigram_query(term):
+    """
+    2文字以下の検索語を bigram の索引の検索式にします（2文字は一致、1文字は前方一致）
+    """
+    phrase = _fts_phrase(term.lower())
+    return phrase if len(term) >= 2 else phrase + " *"
+
+def search(query, limit=SEARCH_LIMIT, date_from=None, date_to=None, kinds=None, path=None):
+    """
+    全会議の発言・サマリー・タイトルを検索します（空白区切りの語はすべて含むものを検索）。
+    3文字以上の語は trigram の索引、2文字以下の語は bigram の索引で絞り込みます。
+    :param date_from: 会議日付の下限（YYYY-MM-DD、任意）
+    :param date_to: 会議日付の上限（YYYY-MM-DD、任意）
+    :param kinds: 対象にする種類（KIND_SEGMENT など）のリスト。Noneならすべて
+    :return: 検索結果の辞書のリスト（関連度の高い順）
+    """
+    terms = [term for term in query.split() if term]
+    if not terms:
+        return []
+    long_terms = [t for t in terms if len(t) >= TRIGRAM_MIN_CHARS]
+    short_terms = [t for t in terms if len(t) < TRIGRAM_MIN_CHARS]
+
+    conditions = []
+    params = []
+    if long_terms:
+        conditions.append("entries MATCH ?")
+        params.append(" AND ".join(_fts_phrase(t) for t in long_terms))
+    if short_terms:
+        bigram_match = " AND ".join(_bigram_query(t) for t in short_terms)
+        if long_terms:
+            conditions.append("segments.id IN (SELECT rowid FROM entries_bigram WHERE entries_bigram MATCH ?)")
+        else:
+            conditions.append("entries_bigram MATCH ?")
+        params.append(bigram_match)
+    # bigram の索引は句読点などで語が区切られるため、索引で絞り込んだ行だけを部分一致で確かめる
+    for term in short_terms:
+        conditions.append("segments.text LIKE ? ESCAPE '\\'")
+        params.append(_like_pattern(term))
+    if date_from:
+        conditions.append("meetings.meeting_date >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("meetings.meeting_date <= ?")
+        params.append(date_to)
+    if kinds:
+        conditions.append(f"segments.kind IN ({', '.join('?' for _ in kinds)})")
+        params += list(kinds)
+
+    if long_terms:
+        snippet = f"snippet(entries, 0, '**', '**', '…', {SNIPPET_TOKENS})"
+        source = "entries JOIN segments ON segments.id = entries.rowid"
+        order = "bm25(entries)"
+    else:
+        snippet = "segments.text"
+        source = "entries_bigram JOIN segments ON segments.id = entries_bigram.rowid"
+        order = "meetings.meeting_date DESC, segments.start"
+    sql = (
+        f"SELECT segments.meeting_id, segments.kind, segments.start, segments.end, {snippet} AS snippet, "
+        "meetings.title, meetings.filename, meetings.meeting_date, meetings.sources "
+        f"FROM {source} JOIN meetings ON meetings.id = segments.meeting_id "
+        f"WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT ?"
+    )
+    params.append(limit)
+
+    conn = _connect(path)
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        result["sources"] = json.loads(result["sources"] or "{}")
+        if not long_terms:
+            result["snippet"] = _make_snippet(result["snippet"], short_terms[0])
+        results.append(result)
+    return results
+
+def get_meeting(meeting_id, path=None):
+    """
+    会議の情報とセグメントを取得します（見つからない場合はNone）
+    """
+    conn = _connect(path)
+    try:
+        row = conn.execute("SELECT * FROM meetings WHERE id = ?", (meeting_id,)).fetchone()
+        if row is None:
+            return None
+        meeting = dict(row)
+        meeting["sources"] = json.loads(meeting["sources"] or "{}")
+        meeting["segments"] = [
+            dict(r) for r in conn.execute(
+                "SELECT start, end, text FROM segments WHERE meeting_id = ? AND kind = ? ORDER BY id",
+                (meeting_id, KIND_SEGMENT)
+            )
+        ]
+    finally:
+        conn.close()
+    return meeting
+
+def stats(path=None):
+    """
+    登録済みの会議数と発言数を返します
+    """
+    conn = _connect(path)
+    try:
+        row = conn.execute("SELECT COUNT(*) AS meetings, COALESCE(SUM(segment_count), 0) AS segments FROM meetings").fetchone()
+    finally:
+        conn.close()
+    return dict(row)
+
+def backfill_from_jobs(path=None):
+    """
+    完了済みのバックグラウンドジョブの結果をインデックスに登録します（インデックス追加前のジョブの取り込み用）
+    :return: 登録した会議の数
+    """
+    import job_queue
+
+    count = 0
+    for job in job_queue.list_jobs(limit=-1):
+        if job["status"] != job_queue.STATUS_DONE:
+            continue
+        result = job_queue.get_job(job["id"]).get("result") or {}
+        if not result.get("transcription"):
+            continue
+        index_meeting(
+            result.get("meeting_id") or job["id"], job["title"], result.get("summary", ""),
+            result.get("transcription", ""), result.get("segments"), job["file_date"], job["filename"],
+            source={"job": job["id"]}, path=path,
+        )
+        count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="会議の全文検索インデックスを検索します")
+    parser.add_argument("query", nargs="*", help="検索語（空白区切りですべてを含むものを検索）")
+    parser.add_argument("--backfill", action="store_true", help="完了済みのジョブの結果をインデックスに登録する")
+    parser.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    args = parser.parse_args()
+
+    if args.backfill:
+        print(f"{backfill_from_jobs()}件の会議を登録しました。")
+    if args.query:
+        started = time.perf_counter()
+        results = search(" ".join(args.query), limit=args.limit)
+        for r in results:
+            at = time.strftime(" %H:%M:%S", time.gmtime(r["start"])) if r["start"] is not None else ""
+            print(f"{r['meeting_date'] or '----------'}{at} [{r['title']}] {r['snippet']}")
+        print(f"{len(results)}件（{(time.perf_counter() - started) * 1000:.0f}ms）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+会議録作成のコマンドライン（バッチ処理）エントリーポイント。
+
+Streamlitの画面を使わずに、ディレクトリやglobパターンで指定した複数の音声ファイルを並列に処理します。
+処理結果は1ファイル1行のJSONLマニフェストに記録し、処理済みのファイル（音声のハッシュが同じもの）はスキップします。
+一部のチャンクの文字起こしに失敗したファイルは "partial" として記録し、再実行すると失敗したチャンクだけを送信します。
+APIキーは環境変数または .streamlit/secrets.toml から読み込みます。
+
+使用例:
+    python minutes_cli.py recordings/ --concurrency 4 --manifest manifest.jsonl --output-dir minutes/
+    python minutes_cli.py "archive/**/*.m4a" --notion
+    python minutes_cli.py recordings/ --backend local --manifest manifest_local.jsonl
+    python minutes_cli.py recordings/ --trim-silence --tempo 1.25
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import minutes_webapp as app
+import telemetry
+
+AUDIO_EXTENSIONS = (".mp4", ".m4a", ".wav")
+
+def _silence_streamlit_logs():
+    """
+    Streamlitの外で st.* を呼び出したときの警告（ScriptRunContextがない等）を抑制します
+    """
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+def find_audio_files(inputs):
+    """
+    ディレクトリ・globパターン・ファイルパスのリストから、対象の音声ファイルを列挙します
+    """
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = [str(p) for p in Path(pattern).rglob("*") if p.is_file()]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        paths += [p for p in matches if p.lower().endswith(AUDIO_EXTENSIONS)]
+    # 重複を除き、ファイル名順に処理する
+    return sorted(set(paths))
+
+def load_processed_hashes(manifest_path, backend=None):
+    """
+    マニフェストから処理に成功したファイルのハッシュを読み込みます
+    :param backend: 指定した場合はその文字起こしエンジンで処理した記録だけを対象にする
+        （同じマニフェストで複数のエンジンの結果を比較できる）
+    """
+    hashes = set()
+    if not manifest_path or not os.path.exists(manifest_path):
+        return hashes
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if backend and record.get("backend", "openai") != backend:
+                continue
+            if record.get("status") == "ok" and record.get("sha256"):
+                hashes.add(record["sha256"])
+    return hashes
+
+def meeting_date_for(path):
+    """
+    会議の日付をファイル名から取得し、なければファイルの更新日時を使用します
+    """
+    return app.extract_date_from_filename(Path(path).name) or \
+        datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d")
+
+def process_recording(path, api_key, notion_api_key=None, notion_database_id=None, title=None,
+                      output_dir=None, sha256=None, backend="openai", trim_silence=app.TRIM_SILENCE,
+                      tempo=app.AUDIO_TEMPO):
+    """
+    1つの音声ファイルを文字起こし・要約し、必要に応じてMarkdown出力とNotionへの保存を行います
+    :return: マニフェストに記録する辞書
+    """
+    filename = Path(path).name
+    title = title or Path(path).stem
+    file_date = meeting_date_for(path)
+    record = {
+        "file": os.path.abspath(path),
+        "sha256": sha256,
+        "title": title,
+        "meeting_date": file_date,
+        "backend": backend,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "timings": {},
+    }
+    started = time.perf_counter()
+
+    with telemetry.job() as metrics:
+        with app.ingest_upload(path, sha256=sha256) as upload:
+            record["sha256"] = upload.sha256()
+            stage_started = time.perf_counter()
+            transcribe_stats = {}
+            text, segments, summary, summary_stats = app.run_pipeline(
+                upload, api_key, backend=backend, stats=transcribe_stats, trim_silence=trim_silence, tempo=tempo
+            )
+            record["timings"]["transcribe_and_summarize"] = time.perf_counter() - stage_started
+        record["summary_stats"] = summary_stats
+        record["failed_chunks"] = transcribe_stats.get("failed_chunks", [])
+        if "sent_audio_seconds" in transcribe_stats:
+            # 無音区間の除去・速度変更による送信した音声の短縮
+            record["audio_seconds"] = transcribe_stats["audio_seconds"]
+            record["sent_audio_seconds"] = transcribe_stats["sent_audio_seconds"]
+        app.record_meeting(record["sha256"], title, summary, text, segments, file_date, filename,
+                           source={"file": record["file"]})
+        record["segments"] = len(segments)
+        record["transcript_chars"] = len(text)
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, f"{Path(path).stem}.md")
+            with open(output_path, "wb") as f:
+                app.write_markdown(f, app.iter_minutes_markdown(title, summary, text))
+            record["output"] = output_path
+            # セグメントがあれば字幕（SRT・WebVTT）も出力する
+            if segments:
+                record["subtitles"] = []
+                for _, extension, _, render in app.SUBTITLE_FORMATS:
+                    subtitle_path = os.path.join(output_dir, f"{Path(path).stem}.{extension}")
+                    with open(subtitle_path, "wb") as f:
+                        app.write_markdown(f, render(segments))
+                    record["subtitles"].append(subtitle_path)
+
+        # 文字起こしに欠落がある場合はNotionに保存せず、再実行で揃ってから保存する
+        if notion_api_key and notion_database_id and not record["failed_chunks"]:
+            stage_started = time.perf_counter()
+            notion_stats = {}
+            record["notion_result"] = app.write_to_notion(
+                notion_api_key, notion_database_id, title, text, summary, filename, file_date,
+                stats=notion_stats, meeting_id=record["sha256"], segments=segments
+            )
+            record["notion_error"] = notion_stats.get("error")
+            record["timings"]["notion"] = time.perf_counter() - stage_started
+
+    record["timings"]["total"] = time.perf_counter() - started
+    # 段階ごとの所要時間（ffprobe・分割・Whisper呼び出しなど）と送信バイト数・トークン数・再試行・キャッシュヒット
+    record["telemetry"] = metrics.snapshot()
+    if record["failed_chunks"]:
+        record["status"] = "partial"
+        record["error"] = f"{len(record['failed_chunks'])}個のチャンクの文字起こしに失敗しました（再実行で失敗分だけを再試行）"
+    elif record.get("notion_error"):
+        # Notionへの保存に失敗した場合は処理済みとして扱わず、再実行で保存し直す（文字起こし・要約はキャッシュを使用）
+        record["status"] = "partial"
+        record["error"] = record["notion_result"]
+    else:
+        record["status"] = "ok"
+    return record
+
+def process_batch(paths, api_key, concurrency=2, manifest_path=None, skip_processed=True,
+                  notion_api_key=None, notion_database_id=None, output_dir=None, on_record=None,
+                  backend="openai", trim_silence=app.TRIM_SILENCE, tempo=app.AUDIO_TEMPO):
+    """
+    複数の音声ファイルを並列に処理し、結果をマニフェスト（JSONL）に追記します
+    :param on_record: 1ファイルの処理が終わるたびに記録の辞書を受け取るコールバック
+    :param backend: 文字起こしエンジンの名前（"openai", "local"）
+    :param trim_silence: Trueの場合は長い無音区間を除去してから送信する
+    :param tempo: 送信する音声の再生速度
+    :return: 記録の辞書のリスト
+    """
+    processed = load_processed_hashes(manifest_path, backend) if skip_processed else set()
+    manifest_lock = threading.Lock()
+    records = []
+
+    def write_record(record):
+        with manifest_lock:
+            records.append(record)
+            if manifest_path:
+                with open(manifest_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if on_record:
+            on_record(record)
+
+    def run(path):
+        sha256 = app.hash_file(path)
+        if sha256 in processed:
+            return {"file": os.path.abspath(path), "sha256": sha256, "backend": backend, "status": "skipped"}
+        try:
+            return process_recording(path, api_key, notion_api_key, notion_database_id,
+                                     output_dir=output_dir, sha256=sha256, backend=backend,
+                                     trim_silence=trim_silence, tempo=tempo)
+        except Exception as e:
+            return {"file": os.path.abspath(path), "sha256": sha256, "backend": backend, "status": "error",
+                    "error": f"{type(e).__name__}: {e}"}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(run, path) for path in paths]
+        for future in as_completed(futures):
+            write_record(future.result())
+    return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="音声ファイルをまとめて文字起こし・要約します")
+    parser.add_argument("inputs", nargs="+", help="音声ファイル・ディレクトリ・globパターン")
+    parser.add_argument("--concurrency", type=int, default=2, help="同時に処理するファイル数")
+    parser.add_argument("--manifest", default="manifest.jsonl", help="結果を記録するJSONLファイル")
+    parser.add_argument("--output-dir", help="Markdown・字幕（SRT・WebVTT）を出力するディレクトリ")
+    parser.add_argument("--notion", action="store_true", help="Notionデータベースに保存する")
+    parser.add_argument("--no-skip", action="store_true", help="処理済みのファイルも再処理する")
+    parser.add_argument("--backend", choices=list(app.TRANSCRIPTION_BACKENDS), default="openai",
+                        help="文字起こしエンジン（local は faster-whisper が必要）")
+    parser.add_argument("--trim-silence", action=argparse.BooleanOptionalAction, default=app.TRIM_SILENCE,
+                        help="長い無音区間を除去してから送信する（時刻は元の録音の時刻で出力。"
+                             "--no-trim-silence で環境変数 TRIM_SILENCE=1 の設定を打ち消す）")
+    parser.add_argument("--tempo", type=float, default=app.AUDIO_TEMPO,
+                        help="送信する音声の再生速度（1.0〜2.0。上げすぎると認識精度が下がる）")
+    args = parser.parse_args(argv)
+
+    _silence_streamlit_logs()
+    config = app.load_config()
+    api_key = config["openai"]["api_key"]
+    if not api_key:
+        parser.error("OpenAI APIキーが見つかりません（OPENAI_API_KEY を設定してください）。")
+    notion_api_key = notion_database_id = None
+    if args.notion:
+        notion_api_key = config["notion"]["api_key"]
+        notion_database_id = config["notion"]["database_id"]
+        if not (notion_api_key and notion_database_id):
+            parser.error("Notionの設定が見つかりません（NOTION_API_KEY と NOTION_DATABASE_ID を設定してください）。")
+
+    paths = find_audio_files(args.inputs)
+    if not paths:
+        print("対象の音声ファイルが見つかりませんでした。", file=sys.stderr)
+        return 1
+
+    def report(record):
+        total = record.get("timings", {}).get("total")
+        elapsed = f" {total:.1f}秒" if total is not None else ""
+        print(f"[{record['status']}]{elapsed} {record['file']}" + (f" - {record['error']}" if record.get("error") else ""))
+
+    records = process_batch(
+        paths, api_key,
+        concurrency=args.concurrency,
+        manifest_path=args.manifest,
+        skip_processed=not args.no_skip,
+        notion_api_key=notion_api_key,
+        notion_database_id=notion_database_id,
+        output_dir=args.output_dir,
+        on_record=report,
+        backend=args.backend,
+        trim_silence=args.trim_silence,
+        tempo=min(2.0, max(1.0, args.tempo)),
+    )
+    failed = sum(1 for r in records if r["status"] in ("error", "partial"))
+    print(f"完了: {len(records)}件（失敗 {failed}件）")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,130 @@
+import time
+_RUN_STARTED = time.perf_counter()  # 起動・再実行の所要時間の計測開始（インポートを含む）
+
 import streamlit as st
 import tempfile
 import os
 import subprocess
 import json
+import csv
+import bisect
+import functools
+import hashlib
+import io
+import math
+import random
+import re
+import shutil
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from datetime import datetime, timedelta
-from openai import OpenAI
-from notion_client import Client
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+
+import checkpoints
+import local_whisper
+import media_probe
+import meeting_index
+import telemetry
+from segment_store import SegmentStore, iter_srt, iter_vtt
+from api_clients import get_client_stats, get_notion_client, get_openai_client
+
+import job_queue
+
+# OpenAI・NotionのSDKと tiktoken はインポートに時間がかかるため、使用するときに初めてインポートする
+# （Streamlitの起動と、アップロード前の画面表示を速くするため）
+_IMPORT_SECONDS = time.perf_counter() - _RUN_STARTED
 
 # サイズ制限（バイト単位）
 MAX_SIZE = 25 * 1024 * 1024  # 25MB (Whisper APIの制限)
 
-def check_password():
+# 文字起こしの並列実行設定
+TRANSCRIBE_MAX_WORKERS = int(os.environ.get("TRANSCRIBE_MAX_WORKERS", "4"))  # 同時リクエスト数
+TRANSCRIBE_MAX_RETRIES = 3  # チャンクごとの最大再試行回数
+TRANSCRIBE_RETRY_BASE_DELAY = 2.0  # 再試行の基本待機時間（秒）
+
+# 分割時のエンコード設定（音声のみ・モノラル・16kHz）
+CHUNK_CODECS = {
+    "opus": {"ext": "ogg", "args": ["-c:a", "libopus", "-b:a", "32k", "-application", "voip"], "bitrate": 32000},
+    "mp3": {"ext": "mp3", "args": ["-c:a", "libmp3lame", "-b:a", "48k"], "bitrate": 48000},
+    "wav": {"ext": "wav", "args": ["-c:a", "pcm_s16le"], "bitrate": 16000 * 16},
+}
+CHUNK_CODEC = os.environ.get("CHUNK_CODEC", "opus")
+CHUNK_TARGET_BYTES = int(os.environ.get("CHUNK_TARGET_MB", "20")) * 1024 * 1024  # チャンクあたりの目標サイズ
+CHUNK_SIZE_MARGIN = 0.9  # コンテナのオーバーヘッドやビットレートの揺らぎを考慮した余裕
+
+# 再エンコードせずに音声トラックをそのまま切り出せるコーデック（Whisper APIが受け付ける形式）と出力の拡張子
+SPLIT_STREAM_COPY = os.environ.get("SPLIT_STREAM_COPY", "1") != "0"
+STREAM_COPY_CODECS = {
+    "aac": "m4a",
+    "mp3": "mp3",
+    "flac": "flac",
+    "opus": "ogg",
+    "vorbis": "ogg",
+}
+
+# 無音区間での分割設定
+SPLIT_ON_SILENCE = os.environ.get("SPLIT_ON_SILENCE", "1") != "0"
+SILENCE_NOISE_DB = -35  # これより小さい音量を無音とみなす（dB）
+SILENCE_MIN_DURATION = 0.4  # 無音とみなす最小の長さ（秒）
+SILENCE_SEARCH_WINDOW = 30  # 目標の分割時刻の何秒前までの無音区間を分割点の候補にするか
+CHUNK_OVERLAP = 2.0  # 無音区間がなく途中で分割する場合のチャンク間の重なり（秒）
+
+# 単語を空白で区切らない言語（文字起こし全体のテキストはセグメントごとに改行して組み立てる）
+NO_SPACE_LANGUAGES = {"ja", "zh"}
+
+# 送信前の前処理（無音区間の除去と再生速度の変更）。セグメントの時刻は元の録音の時刻に戻します
+TRIM_SILENCE = os.environ.get("TRIM_SILENCE", "0") == "1"  # 1で長い無音区間を除去してから送信
+TRIM_SILENCE_MIN_DURATION = 1.0  # これより長い無音区間を除去する（秒）
+TRIM_SILENCE_PADDING = 0.3  # 除去する無音区間の前後に残す長さ（秒）。発話の頭と末尾を切らないため
+TRIM_FRAME_SAMPLES = 1600  # 除去する単位（16kHzで0.1秒）。区間をこの単位にそろえて時刻の対応を正確に保つ
+AUDIO_TEMPO = min(2.0, max(1.0, float(os.environ.get("AUDIO_TEMPO", "1.0"))))  # 送信する音声の再生速度（1.0〜2.0）
+
+# Notionへの書き込み設定
+NOTION_MAX_CHILDREN = 100  # 1リクエストあたりの子ブロック数の上限（Notion APIの制限）
+NOTION_REQUESTS_PER_SECOND = 3  # Notion APIの平均レート制限
+NOTION_MAX_WORKERS = 3  # ブロック追加の同時リクエスト数
+NOTION_SCHEMA_TTL = 600  # データベースのプロパティ情報のキャッシュ期間（秒）
+
+# アップロードファイルをディスクに書き出す際のブロックサイズ
+INGEST_BLOCK_SIZE = 1024 * 1024  # 1MB
+
+# 文字起こし・サマリーのディスクキャッシュ設定
+CACHE_ENABLED = os.environ.get("MINUTES_CACHE_ENABLED", "1") != "0"
+CACHE_DIR = os.environ.get("MINUTES_CACHE_DIR", os.path.join(Path.home(), ".cache", "minutes_webapp"))
+CACHE_MAX_BYTES = int(os.environ.get("MINUTES_CACHE_MAX_MB", "500")) * 1024 * 1024
+CACHE_MAX_AGE = int(os.environ.get("MINUTES_CACHE_MAX_DAYS", "30")) * 24 * 60 * 60  # 秒
+SUMMARY_MODEL = "gpt-4o"
+SUMMARY_PROMPT_VERSION = "3"  # サマリーのプロンプトを変更したら更新する（キャッシュの無効化）
+SUMMARY_FORMAT = os.environ.get("SUMMARY_FORMAT", "text")  # "text": 自由形式 / "structured": JSONで取得して整形
+SUMMARY_WINDOW_TOKENS = int(os.environ.get("SUMMARY_WINDOW_TOKENS", "12000"))  # 1回の要約に渡す文字起こしの上限
+SUMMARY_MAX_WORKERS = int(os.environ.get("SUMMARY_MAX_WORKERS", "4"))  # 部分要約の同時リクエスト数
+
+# 複数ファイル（連続した録音の分割ファイル・参加者ごとの録音トラック）の設定
+MULTI_FILE_MAX_WORKERS = int(os.environ.get("MULTI_FILE_MAX_WORKERS", "4"))  # 同時に文字起こしするファイル数
+MULTI_MODE_SEQUENTIAL = "sequential"  # 1つの会議を分割して録音したファイル（時刻を順につなげる）
+MULTI_MODE_TRACKS = "tracks"  # 同じ会議を参加者ごとに録音したトラック（時刻を重ねる）
+MULTI_MODES = {
+    MULTI_MODE_SEQUENTIAL: "連続した録音（ファイルを順につなげる）",
+    MULTI_MODE_TRACKS: "参加者ごとの録音トラック（同時刻に重ねる）",
+}
+MULTI_ORDER_FILE = "file"  # アップロードした順
+MULTI_ORDER_RECORDED = "recorded"  # ファイルのメタデータの録音開始時刻の順
+MULTI_ORDERS = {
+    MULTI_ORDER_FILE: "アップロードした順",
+    MULTI_ORDER_RECORDED: "録音開始時刻の順（メタデータがない場合はアップロードした順）",
+}
+
+# 文字起こしビューアーの設定（表示中のページだけをブラウザに送る）
+TRANSCRIPT_PAGE_SIZE = 100  # 1ページあたりのセグメント数
+TRANSCRIPT_PAGE_CHARS = 5000  # セグメントがない場合の1ページあたりの文字数
+
+def check_password(correct_password):
     """
     パスワードによるアクセス制御機能
+    :param correct_password: 正しいパスワード（load_app_config で読み込んだもの）
     """
     # セッションステートを初期化
     if "password_correct" not in st.session_state:
@@ -23,9 +134,6 @@ def check_password():
     if st.session_state["password_correct"]:
         return True
     
-    # 正しいパスワード (st.secrets から読み込み)
-    correct_password = st.secrets.get("APP_PASSWORD", "")
-    
     # デバッグ情報を表示 - f-string内でエスケープシーケンスを避けるため変数を先に定義
     auth_status = "認証済み" if st.session_state["password_correct"] else "未認証"
     st.write(f"現在の認証状態: {auth_status}")  # デバッグ用
@@ -46,21 +154,52 @@ def check_password():
     
     return False
 
+def get_secret(name, default=""):
+    """
+    st.secrets から設定値を読み込みます。見つからない場合は環境変数を参照します
+    （バックグラウンドのワーカーなど、secrets.toml がない環境でも動作させるため）。
+    """
+    try:
+        value = st.secrets.get(name)
+    except Exception:
+        value = None
+    return value if value else os.environ.get(name, default)
+
 def load_config():
     """
-    st.secrets から設定情報（APIキーなど）を読み込みます。
+    st.secrets（または環境変数）から設定情報（APIキーなど）を読み込みます。
     """
     # 設定
     config = {
-        "openai": {"api_key": st.secrets.get("OPENAI_API_KEY", "")},
+        "openai": {"api_key": get_secret("OPENAI_API_KEY")},
         "notion": {
-            "api_key": st.secrets.get("NOTION_API_KEY", ""),
-            "database_id": st.secrets.get("NOTION_DATABASE_ID", "")
-        }
+            "api_key": get_secret("NOTION_API_KEY"),
+            "database_id": get_secret("NOTION_DATABASE_ID")
+        },
+        "app": {"password": get_secret("APP_PASSWORD")},
     }
     
     return config
 
+@st.cache_resource(show_spinner=False)
+def load_app_config():
+    """
+    画面表示用の設定情報。プロセスごとに一度だけ読み込み、再実行やセッションをまたいで共有します
+    （secrets.toml を変更した場合はアプリを再起動してください）。
+    """
+    return load_config()
+
+@st.cache_resource(show_spinner=False)
+def detect_tools():
+    """
+    FFmpeg・FFprobe・faster-whisper の有無を確認します（プロセスごとに一度だけ）
+    """
+    return {
+        "ffmpeg": media_probe.ffmpeg_available(),
+        "ffprobe": media_probe.ffprobe_available(),
+        "local_whisper": local_whisper.is_available(),
+    }
+
 def extract_date_from_filename(filename):
     """
     ファイル名から日付情報を抽出しようとします（例: 会議_20250406.m4a）
@@ -82,14 +221,248 @@ def extract_date_from_filename(filename):
             return None
     return None
 
-def get_file_metadata(file):
+class IngestedUpload:
+    """
+    ディスクに一度だけ書き出されたアップロードファイルと、ジョブ用の作業ディレクトリ。
+    後続の処理（メタデータ取得・分割・文字起こし）はすべてこのパスを共有します。
+    with文で使用すると、処理の成否にかかわらず作業ディレクトリを削除します。
+    セッションに保持した場合も、参照されなくなった時点（セッション終了時）で作業ディレクトリを削除します。
+    """
+    def __init__(self, name, path, work_dir, sha256=None):
+        self.name = name
+        self.path = path
+        self.work_dir = work_dir
+        self._sha256 = sha256
+        self._media_info = None
+        self._probed = False
+        self.ingest_seconds = 0.0
+        self._finalizer = weakref.finalize(self, shutil.rmtree, work_dir, ignore_errors=True)
+    
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+    
+    def sha256(self):
+        """
+        音声ファイルのSHA-256ハッシュ（一度だけ計算してキャッシュ）
+        """
+        if self._sha256 is None:
+            self._sha256 = hash_file(self.path)
+        return self._sha256
+    
+    def media_info(self):
+        """
+        ffprobeによる解析結果（一度だけ実行してキャッシュ。ffprobeがない場合はNone）
+        """
+        if not self._probed:
+            self._media_info = media_probe.probe(self.path)
+            self._probed = True
+        return self._media_info
+    
+    def make_temp_dir(self, prefix="tmp_"):
+        """
+        作業ディレクトリ内に一時ディレクトリを作成します（クリーンアップ時に一緒に削除されます）
+        """
+        return tempfile.mkdtemp(prefix=prefix, dir=self.work_dir)
+    
+    def cleanup(self):
+        self._finalizer()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+def ingest_upload(file, block_size=INGEST_BLOCK_SIZE, sha256=None):
+    """
+    アップロードファイルを固定サイズのブロック単位でジョブ用の作業ディレクトリに一度だけ書き出します。
+    :param file: アップロードされたファイルオブジェクト、またはローカルファイルのパス
+    :param block_size: 書き込み時のブロックサイズ（バイト）
+    :param sha256: 計算済みの音声ファイルのハッシュ（あれば再計算しない）
+    :return: IngestedUpload
+    """
+    work_dir = tempfile.mkdtemp(prefix="minutes_job_")
+    
+    # ローカルファイルのパスが渡された場合はコピーせずにそのまま参照する
+    if isinstance(file, (str, os.PathLike)):
+        return IngestedUpload(Path(file).name, os.fspath(file), work_dir, sha256)
+    
+    name = Path(file.name).name
+    path = os.path.join(work_dir, "source" + Path(name).suffix.lower())
+    try:
+        with telemetry.timer("upload_write") as timer:
+            file.seek(0)
+            with open(path, "wb") as out:
+                shutil.copyfileobj(file, out, block_size)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    upload = IngestedUpload(name, path, work_dir, sha256)
+    upload.ingest_seconds = timer.seconds
+    return upload
+
+def hash_file(path, block_size=INGEST_BLOCK_SIZE):
+    """
+    ファイルの内容をブロック単位で読み込み、SHA-256ハッシュを計算します
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_cache_key(*parts):
+    """
+    複数の要素（音声ハッシュ・モデル・言語・プロンプトバージョンなど）からキャッシュキーを作成します
+    """
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+def segments_to_dicts(segments):
+    """
+    セグメントをJSONで保存できる列ごとの辞書（SegmentStore.to_dict の形式）に変換します
+    """
+    return to_segment_store(segments).to_dict()
+
+def segments_from_dicts(data):
+    """
+    保存したセグメント（列ごとの辞書、または以前の形式の辞書のリスト）を SegmentStore に戻します。
+    要素は Whisper APIのセグメントと同じく start / end / text で参照できます
+    """
+    return SegmentStore.from_value(data or [])
+
+def to_segment_store(segments):
+    """
+    Whisper APIのセグメントのリストなどを SegmentStore に変換します（SegmentStore はそのまま返す）
+    """
+    if isinstance(segments, SegmentStore):
+        return segments
+    return SegmentStore.from_segments(segments)
+
+def _normalize_transcript(transcript):
+    """
+    文字起こしエンジンのレスポンスを、セグメントを SegmentStore で持つオブジェクトに変換します
+    """
+    return SimpleNamespace(
+        text=getattr(transcript, "text", "") or "",
+        segments=to_segment_store(getattr(transcript, "segments", None)),
+    )
+
+def _transcript_to_dict(transcript):
+    """
+    Whisper APIのレスポンスをキャッシュ保存用の辞書に変換します
+    """
+    return {
+        "text": getattr(transcript, "text", ""),
+        "segments": segments_to_dicts(getattr(transcript, "segments", None)),
+    }
+
+def _transcript_from_dict(data):
+    """
+    キャッシュの辞書をWhisper APIのレスポンスと同じ属性アクセスができるオブジェクトに戻します
+    """
+    return SimpleNamespace(
+        text=data.get("text", ""),
+        segments=segments_from_dicts(data.get("segments")),
+    )
+
+class TranscriptionCache:
+    """
+    文字起こし結果・チャンク結果・サマリーを保存するディスクキャッシュ。
+    キーは内容のハッシュから作成し、サイズと経過時間に基づいて古いエントリを削除します。
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+    
+    def _path(self, namespace, key):
+        return self.cache_dir / namespace / f"{key}.json"
+    
+    def get(self, namespace, key):
+        """
+        キャッシュからエントリを取得します（存在しない・期限切れの場合はNone）
+        """
+        path = self._path(namespace, key)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                telemetry.record_cache(namespace, hit=False)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # 最終利用時刻を更新（サイズ超過時の削除順に使用）
+            os.utime(path, None)
+            telemetry.record_cache(namespace, hit=True)
+            return value
+        except (OSError, ValueError):
+            telemetry.record_cache(namespace, hit=False)
+            return None
+    
+    def put(self, namespace, key, value):
+        """
+        エントリをアトミックに書き込み、必要に応じて古いエントリを削除します
+        """
+        path = self._path(namespace, key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            # キャッシュの書き込みに失敗しても処理は継続する
+            return
+        self.evict()
+    
+    def evict(self):
+        """
+        期限切れのエントリを削除し、合計サイズが上限を超える場合は最終利用が古い順に削除します
+        """
+        with self._lock:
+            now = time.time()
+            entries = []
+            total = 0
+            for path in self.cache_dir.glob("*/*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    path.unlink(missing_ok=True)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+            
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+_cache = None
+
+def get_cache():
+    """
+    プロセス共通のキャッシュを返します（無効化されている場合はNone）
+    """
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = TranscriptionCache()
+    return _cache
+
+def get_file_metadata(upload):
     """
     ファイルのメタデータを取得します
-    :param file: アップロードされたファイルオブジェクト
+    :param upload: ingest_upload で書き出したアップロードファイル
     :return: ファイル名と作成日時のタプル
     """
     # ファイル名を取得（拡張子も含む）
-    filename = Path(file.name).name
+    filename = Path(upload.name).name
     
     # ファイル名から日付を抽出してみる
     filename_date = extract_date_from_filename(filename)
@@ -118,48 +491,19 @@ def get_file_metadata(file):
     # 日付を文字列形式（YYYY-MM-DD）に変換
     file_date = meeting_date.strftime('%Y-%m-%d')
     
-    # 一時ファイルを作成して保存（メタデータ抽出用 - FFmpegがある場合）
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.name).suffix) as tmp_file:
-        tmp_file.write(file.getvalue())
-        tmp_path = tmp_file.name
-    
-    # FFmpegがあるかどうかチェック
-    ffmpeg_available = False
-    try:
-        subprocess.run(["ffprobe", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        ffmpeg_available = True
-    except (subprocess.SubprocessError, FileNotFoundError):
-        # FFmpegがなくても選択した日付を使用するので警告は不要
-        pass
-    
-    # FFmpegが利用可能な場合は詳細メタデータも抽出を試みる（参考情報として）
-    if ffmpeg_available:
-        try:
-            # FFmpegを使用して作成日時のメタデータを取得
-            cmd = [
-                "ffprobe",
-                "-v", "quiet",
-                "-print_format", "json",
-                "-show_format",
-                tmp_path
-            ]
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-            metadata = json.loads(result.stdout)
-            
-            # メタデータ情報を表示（オプション）
-            if 'format' in metadata and 'tags' in metadata['format']:
-                tags = metadata['format']['tags']
-                if st.checkbox("ファイルのメタデータを表示", value=False):
-                    st.json(tags)
-        except Exception as e:
-            # メタデータ取得に失敗しても、ユーザーが選択した日付を使用するので問題なし
-            pass
-    
-    # 一時ファイルを削除
-    try:
-        os.unlink(tmp_path)
-    except:
-        pass
+    # FFprobeが利用可能な場合は詳細メタデータも表示する（参考情報として）
+    # 解析結果は分割の計画にも使うため、ファイルごとに一度だけ取得してキャッシュする
+    # FFmpegがなくても、メタデータ取得に失敗しても、選択した日付を使用するので問題なし
+    media_info = upload.media_info()
+    if media_info is not None and media_info.tags:
+        if st.checkbox("ファイルのメタデータを表示", value=False):
+            st.json({
+                "duration": media_info.duration,
+                "codec": media_info.audio_codec,
+                "channels": media_info.channels,
+                "bit_rate": media_info.bit_rate,
+                "tags": media_info.tags,
+            })
     
     return filename, file_date
 
@@ -180,189 +524,960 @@ def split_text_for_notion(text, max_length=2000):
     
     return chunks
 
-def split_audio_ffmpeg(input_file, chunk_duration=300, output_dir=None):
+def compute_chunk_duration(codec=CHUNK_CODEC, target_bytes=CHUNK_TARGET_BYTES, bitrate=None):
     """
-    FFmpegを使用して音声ファイルを指定された長さのチャンクに分割します（デフォルト5分）
+    エンコード後のビットレートから、目標サイズに収まるチャンクの長さ（秒）を計算します
+    :param bitrate: ビットレート（bps）。Noneの場合は codec の出力ビットレートを使用
     """
-    if output_dir is None:
-        output_dir = tempfile.mkdtemp()
+    bitrate = bitrate or CHUNK_CODECS[codec]["bitrate"]
+    budget = min(target_bytes, MAX_SIZE) * CHUNK_SIZE_MARGIN
+    return max(1, int(budget * 8 / bitrate))
+
+def detect_silences(input_file, noise_db=SILENCE_NOISE_DB, min_duration=SILENCE_MIN_DURATION):
+    """
+    FFmpegのsilencedetectフィルタで無音区間を検出します
+    :return: (音声の長さ（秒）またはNone, 無音区間 (開始, 終了) のリスト)
+    """
+    cmd = [
+        "ffmpeg",
+        "-i", input_file,
+        "-vn",
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_duration}",
+        "-f", "null", "-"
+    ]
+    result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    log = result.stderr.decode("utf-8", errors="replace")
     
-    # ファイル形式を取得
-    file_ext = os.path.splitext(input_file)[1].lower()
-    output_format = "wav"  # 出力は常にWAV形式
+    duration = None
+    duration_match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", log)
+    if duration_match:
+        h, m, sec = duration_match.groups()
+        duration = int(h) * 3600 + int(m) * 60 + float(sec)
     
-    # FFmpegコマンドを構築
+    silences = []
+    silence_start = None
+    for line in log.splitlines():
+        start_match = re.search(r"silence_start:\s*(-?\d+(?:\.\d+)?)", line)
+        if start_match:
+            silence_start = max(0.0, float(start_match.group(1)))
+            continue
+        end_match = re.search(r"silence_end:\s*(\d+(?:\.\d+)?)", line)
+        if end_match and silence_start is not None:
+            silences.append((silence_start, float(end_match.group(1))))
+            silence_start = None
+    return duration, silences
+
+def plan_chunks(duration, silences, target_duration, search_window=SILENCE_SEARCH_WINDOW, overlap=CHUNK_OVERLAP):
+    """
+    目標の長さに近い無音区間を分割点として、チャンクの (開始, 終了) を計画します。
+    目標の長さを超えないよう、目標時刻より前の search_window 秒以内で最も遅い無音区間の中央で分割します。
+    無音区間が見つからない場合は目標時刻で分割し、次のチャンクを overlap 秒だけ前から開始します。
+    :raises ValueError: target_duration が overlap 以下の場合（チャンクの開始時刻が進まないため）
+    """
+    if target_duration <= overlap:
+        raise ValueError(f"チャンクの長さ（{target_duration}秒）は重なり（{overlap}秒）より長くしてください。")
+    midpoints = sorted((s + e) / 2 for s, e in silences)
+    chunks = []
+    start = 0.0
+    while duration - start > target_duration:
+        ideal = start + target_duration
+        candidates = [m for m in midpoints if max(start, ideal - search_window) < m <= ideal]
+        if candidates:
+            cut = candidates[-1]
+            chunks.append((start, cut))
+            start = cut
+        else:
+            chunks.append((start, ideal))
+            start = ideal - overlap
+    chunks.append((start, duration))
+    return chunks
+
+def _encode_chunk(input_file, output_path, start, duration, codec):
+    """
+    入力ファイルの指定区間を切り出してエンコードします
+    """
+    cmd = [
+        "ffmpeg", "-y",
+        "-ss", f"{start:.3f}",
+        "-t", f"{duration:.3f}",
+        "-i", input_file,
+        "-vn",
+        "-ac", "1",
+        "-ar", "16000",
+        *CHUNK_CODECS[codec]["args"],
+        output_path
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def _split_fixed(input_file, chunk_duration, output_dir, codec):
+    """
+    segmentマルチプレクサで固定長に分割し、実際の分割時刻をセグメントリストから取得します
+    """
+    output_format = CHUNK_CODECS[codec]["ext"]
+    segment_list = os.path.join(output_dir, "segments.csv")
     cmd = [
         "ffmpeg",
         "-i", input_file,
+        "-vn",
+        "-ac", "1",
+        "-ar", "16000",       # サンプルレート16kHz
+        *CHUNK_CODECS[codec]["args"],
         "-f", "segment",
         "-segment_time", str(chunk_duration),
-        "-c:a", "pcm_s16le",  # 16-bit PCM
-        "-ar", "16000",       # サンプルレート16kHz
+        "-segment_list", segment_list,
+        "-segment_list_type", "csv",
         f"{output_dir}/chunk_%03d.{output_format}"
     ]
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    chunks = []
+    with open(segment_list, "r", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) >= 3:
+                chunks.append({
+                    "path": os.path.join(output_dir, row[0]),
+                    "start": float(row[1]),
+                    "end": float(row[2]),
+                    "format": codec,
+                })
+    return chunks
+
+def plan_chunk_duration(media_info, codec=CHUNK_CODEC, target_bytes=CHUNK_TARGET_BYTES, bitrate=None):
+    """
+    音声の長さからチャンクの目標の長さを決めます。
+    エンコード後に1チャンクに収まる場合は分割せず、収まらない場合は必要最小限のチャンク数で均等な長さにします
+    （無音区間を探すために分割点が前倒しになる分の余裕を加えます）。
+    :param media_info: media_probe.probe の結果（Noneの場合は目標サイズから計算した最大の長さ）
+    :param bitrate: チャンクのビットレート（bps）。Noneの場合は codec の出力ビットレートを使用
+    :return: チャンクの目標の長さ（秒）
+    """
+    max_duration = compute_chunk_duration(codec, target_bytes, bitrate)
+    if media_info is None or not media_info.duration:
+        return max_duration
+    if media_info.duration <= max_duration:
+        return max_duration
+    num_chunks = math.ceil(media_info.duration / max_duration)
+    return min(max_duration, math.ceil(media_info.duration / num_chunks) + SILENCE_SEARCH_WINDOW)
+
+def _copy_chunk(input_file, output_path, start, duration):
+    """
+    入力ファイルの指定区間の音声トラックを再エンコードせずに切り出します
+    """
+    cmd = [
+        "ffmpeg", "-y",
+        "-ss", f"{start:.3f}",
+        "-t", f"{duration:.3f}",
+        "-i", input_file,
+        "-vn",
+        "-map", "0:a:0",
+        "-c:a", "copy",
+        output_path
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def _split_stream_copy(input_file, media_info, output_dir):
+    """
+    音声トラックをそのまま時間で切り出して分割します（デコード・再エンコードを行わない）。
+    無音検出にはデコードが必要になるため行わず、チャンク間を重ねて境界の重複は結合時に取り除きます。
+    :return: チャンクのリスト。条件を満たさない場合はNone
+    """
+    output_format = STREAM_COPY_CODECS.get(media_info.audio_codec or "")
+    bitrate = media_info.audio_bit_rate or media_info.bit_rate
+    if not output_format or not bitrate or not media_info.duration:
+        return None
+    
+    chunk_duration = plan_chunk_duration(media_info, bitrate=bitrate)
+    plan = plan_chunks(media_info.duration, [], chunk_duration)
+    chunks = [
+        {"path": os.path.join(output_dir, f"copy_{i:03d}.{output_format}"), "start": start, "end": end, "format": "copy"}
+        for i, (start, end) in enumerate(plan)
+    ]
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        list(executor.map(
+            lambda c: _copy_chunk(input_file, c["path"], c["start"], c["end"] - c["start"]),
+            chunks
+        ))
+    
+    # 可変ビットレートなどで上限を超えたチャンクがあれば、再エンコードに切り替える
+    if any(os.path.getsize(c["path"]) > MAX_SIZE for c in chunks):
+        for c in chunks:
+            os.remove(c["path"])
+        return None
+    return chunks
+
+def split_audio_ffmpeg(input_file, chunk_duration=None, output_dir=None, codec=CHUNK_CODEC,
+                       silence_aware=SPLIT_ON_SILENCE, media_info=None, stream_copy=SPLIT_STREAM_COPY):
+    """
+    FFmpegを使用して音声ファイルをチャンクに分割します。
+    音声トラックがWhisper APIの受け付けるコーデックであれば、再エンコードせずにそのまま切り出します。
+    :param chunk_duration: チャンクの目標の長さ（秒）。Noneの場合は音声の長さと目標サイズから計算
+    :param codec: 再エンコードする場合の出力形式（"opus", "mp3", "wav"）
+    :param silence_aware: Trueの場合は無音区間で分割する（再エンコードする場合のみ）
+    :param media_info: media_probe.probe の結果（あれば長さの取得や分割方法の判定に使用）
+    :param stream_copy: Trueの場合は可能であれば再エンコードせずに切り出す
+    :return: チャンクのリスト（各要素は "path", "start", "end", "format" を持つ辞書。時刻は元の音声での秒数）
+    """
+    if output_dir is None:
+        output_dir = tempfile.mkdtemp()
     
     try:
-        # FFmpegを実行（出力を非表示）
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if stream_copy and media_info is not None:
+            try:
+                chunks = _split_stream_copy(input_file, media_info, output_dir)
+                if chunks:
+                    return chunks
+            except subprocess.CalledProcessError:
+                # 切り出しに失敗した場合は再エンコードで分割する
+                pass
+        
+        if chunk_duration is None:
+            chunk_duration = plan_chunk_duration(media_info, codec)
+        plan = None
+        duration = media_info.duration if media_info is not None else None
+        if duration and duration <= chunk_duration:
+            # 1チャンクに収まる場合は無音検出を行わずに再エンコードだけ行う
+            plan = [(0.0, duration)]
+        elif silence_aware:
+            try:
+                detected_duration, silences = detect_silences(input_file)
+                duration = duration or detected_duration
+                if duration:
+                    plan = plan_chunks(duration, silences, chunk_duration)
+            except subprocess.CalledProcessError:
+                # 無音検出に失敗した場合は固定長で分割する
+                plan = None
         
-        # 生成されたチャンクファイルをリストアップ
-        chunk_files = sorted([
-            os.path.join(output_dir, f) for f in os.listdir(output_dir)
-            if f.startswith("chunk_") and f.endswith(f".{output_format}")
-        ])
+        if plan is None:
+            return _split_fixed(input_file, chunk_duration, output_dir, codec)
         
-        return chunk_files
+        output_format = CHUNK_CODECS[codec]["ext"]
+        chunks = [
+            {"path": os.path.join(output_dir, f"chunk_{i:03d}.{output_format}"), "start": start, "end": end, "format": codec}
+            for i, (start, end) in enumerate(plan)
+        ]
+        # 各区間の切り出しは独立しているため並列に実行する
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+            list(executor.map(
+                lambda c: _encode_chunk(input_file, c["path"], c["start"], c["end"] - c["start"], codec),
+                chunks
+            ))
+        return chunks
     except subprocess.CalledProcessError as e:
         st.error(f"FFmpegによる音声分割中にエラーが発生しました: {e}")
         if e.stderr:
             st.error(f"FFmpeg エラーメッセージ: {e.stderr.decode()}")
         raise e
 
-def transcribe_audio(file, api_key, model="whisper-1", language="ja"):
+class TimeMap:
+    """
+    前処理（無音区間の除去・再生速度の変更）後の音声の時刻と、元の録音の時刻の対応。
+    残した区間を前から順に詰め、再生速度を上げた音声を送信するため、逆の順に変換します。
+    """
+    def __init__(self, intervals, tempo=1.0, original_seconds=None):
+        """
+        :param intervals: 元の録音で残した区間 (開始, 終了) のリスト（時刻順・重なりなし）
+        :param tempo: 再生速度
+        :param original_seconds: 元の録音の長さ（秒）
+        """
+        self.intervals = [(float(start), float(end)) for start, end in intervals]
+        self.tempo = tempo
+        self._compact_starts = []
+        position = 0.0
+        for start, end in self.intervals:
+            self._compact_starts.append(position)
+            position += end - start
+        self.kept_seconds = position
+        self.original_seconds = original_seconds or (self.intervals[-1][1] if self.intervals else 0.0)
+    
+    @property
+    def sent_seconds(self):
+        """
+        送信する音声の長さ（秒）
+        """
+        return self.kept_seconds / self.tempo
+    
+    def to_original(self, t, is_end=False):
+        """
+        前処理後の音声の時刻 t（秒）を元の録音の時刻に変換します
+        :param is_end: 区間の終了時刻の場合はTrue（除去した無音区間の境界では前の区間の終わりとする）
+        """
+        if not self.intervals:
+            return t
+        position = max(0.0, t * self.tempo)
+        find = bisect.bisect_left if is_end else bisect.bisect_right
+        i = max(0, find(self._compact_starts, position) - 1)
+        start, end = self.intervals[i]
+        return min(start + position - self._compact_starts[i], end)
+    
+    def to_dict(self):
+        return {"intervals": self.intervals, "tempo": self.tempo, "original_seconds": self.original_seconds}
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["intervals"], data.get("tempo", 1.0), data.get("original_seconds"))
+
+def plan_kept_intervals(duration, silences, min_silence=TRIM_SILENCE_MIN_DURATION,
+                        padding=TRIM_SILENCE_PADDING, frame=TRIM_FRAME_SAMPLES / 16000):
+    """
+    無音区間を除いて残す区間を計画します。
+    min_silence 秒以上の無音区間から前後 padding 秒を残した部分を除き、区間の境界は frame 秒単位にそろえます。
+    :return: 残す区間 (開始, 終了) のリスト
+    """
+    kept = []
+    position = 0.0
+    for silence_start, silence_end in sorted(silences):
+        if silence_end - silence_start < min_silence:
+            continue
+        # 残す区間は広げる方向に丸める（発話を削らない）
+        cut_start = math.ceil((silence_start + padding) / frame) * frame
+        cut_end = math.floor((min(silence_end, duration) - padding) / frame) * frame
+        if cut_end - cut_start < frame:
+            continue
+        if cut_start > position:
+            kept.append((position, cut_start))
+        position = max(position, cut_end)
+    end = math.ceil(duration / frame) * frame
+    if end > position:
+        kept.append((position, end))
+    return [(round(start, 3), round(end, 3)) for start, end in kept]
+
+def preprocess_signature(trim_silence=TRIM_SILENCE, tempo=AUDIO_TEMPO):
+    """
+    前処理の設定を表す文字列（キャッシュキーに使用）。前処理を行わない場合は空文字列
+    """
+    if not trim_silence and tempo == 1.0:
+        return ""
+    trim = f"trim{TRIM_SILENCE_MIN_DURATION}/{TRIM_SILENCE_PADDING}/{TRIM_FRAME_SAMPLES}" if trim_silence else "notrim"
+    return f"{trim}:tempo{tempo}"
+
+def compact_audio(input_file, output_dir, media_info=None, trim_silence=TRIM_SILENCE, tempo=AUDIO_TEMPO,
+                  codec=CHUNK_CODEC):
+    """
+    送信前の前処理として、長い無音区間を除去し、再生速度を変更した音声を作成します。
+    音声を一定の長さのフレームに区切り、残す区間のフレームだけを選んでつなげるため、時刻の対応は TimeMap で正確に戻せます。
+    :param media_info: media_probe.probe の結果（あれば音声の長さに使用）
+    :return: (前処理後の音声のパス, TimeMap)
+    """
+    duration = media_info.duration if media_info is not None else None
+    silences = []
+    if trim_silence or not duration:
+        detected_duration, silences = detect_silences(input_file, min_duration=TRIM_SILENCE_MIN_DURATION)
+        duration = duration or detected_duration
+    if not duration:
+        raise ValueError("音声の長さを取得できませんでした。")
+    frame = TRIM_FRAME_SAMPLES / 16000
+    intervals = plan_kept_intervals(duration, silences if trim_silence else [], frame=frame)
+    time_map = TimeMap(intervals, tempo, duration)
+    
+    # 区間の数が多いとコマンドラインの長さの上限を超えるため、フィルタはファイルで渡す
+    # フレームの開始時刻が区間内にあるものを選ぶ（浮動小数点の誤差を避けるため、境界は半フレームずらす）
+    selection = "+".join(f"between(t,{start - frame / 2:.3f},{end - frame / 2:.3f})" for start, end in intervals)
+    filters = [
+        "aresample=16000",
+        "aformat=channel_layouts=mono",
+        f"asetnsamples=n={TRIM_FRAME_SAMPLES}:p=1",
+        "asetpts=N/SR/TB",
+        f"aselect='{selection}'",
+        "asetpts=N/SR/TB",
+    ]
+    if tempo != 1.0:
+        filters.append(f"atempo={tempo}")
+    filter_path = os.path.join(output_dir, "compact_filter.txt")
+    with open(filter_path, "w", encoding="utf-8") as f:
+        f.write(",".join(filters))
+    
+    output_path = os.path.join(output_dir, f"compact.{CHUNK_CODECS[codec]['ext']}")
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", input_file,
+        "-vn",
+        "-filter_script:a", filter_path,
+        "-ac", "1",
+        "-ar", "16000",
+        *CHUNK_CODECS[codec]["args"],
+        output_path
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return output_path, time_map
+
+def _retry_after_seconds(error):
+    """
+    APIエラーのレスポンスヘッダーから Retry-After 秒数を取得します（なければNone）
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _is_retryable_error(error):
+    """
+    再試行すべき一時的なエラー（レート制限、タイムアウト、サーバーエラー）かどうかを判定します
+    """
+    from notion_client.errors import RequestTimeoutError
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+    if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError,
+                          RequestTimeoutError)):
+        return True
+    # OpenAIのエラーは status_code、Notionのエラーは status にHTTPステータスを持つ
+    status_code = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return status_code in (408, 409, 429) or (status_code is not None and status_code >= 500)
+
+def call_with_retries(fn, max_retries=TRANSCRIBE_MAX_RETRIES, base_delay=TRANSCRIBE_RETRY_BASE_DELAY):
+    """
+    API呼び出しを実行し、レート制限や一時的なエラーの場合は指数バックオフで再試行します
+    :param fn: 引数なしで呼び出す関数
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable_error(e):
+                raise
+            # Retry-Afterヘッダーがあれば優先し、なければ指数バックオフ＋ジッター
+            delay = _retry_after_seconds(e)
+            if delay is None:
+                delay = base_delay * (2 ** attempt) + random.uniform(0, base_delay)
+            telemetry.record_retry(type(e).__name__)
+            time.sleep(delay)
+            attempt += 1
+
+class RateLimiter:
+    """
+    スレッド間で共有できる単純なレート制限（一定間隔でリクエストを許可する）
+    """
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+def transcribe_chunk(client, chunk_file, model="whisper-1", language="ja",
+                     max_retries=TRANSCRIBE_MAX_RETRIES, base_delay=TRANSCRIBE_RETRY_BASE_DELAY):
+    """
+    1つのチャンクを文字起こしします。レート制限や一時的なエラーの場合は指数バックオフで再試行します。
+    :param client: OpenAIクライアント
+    :param chunk_file: チャンクファイルのパス
+    :return: Whisper APIのレスポンス
+    """
+    def request():
+        with open(chunk_file, "rb") as audio_file:
+            return client.audio.transcriptions.create(
+                model=model,
+                file=audio_file,
+                language=language,
+                response_format="verbose_json"
+            )
+    return call_with_retries(request, max_retries=max_retries, base_delay=base_delay)
+
+class OpenAIWhisperBackend:
+    """
+    OpenAI Whisper APIによる文字起こし
+    """
+    name = "openai"
+    label = "OpenAI Whisper API"
+    max_upload_bytes = MAX_SIZE  # これを超える音声は分割して送信する
+
+    def __init__(self, api_key, model="whisper-1"):
+        self.api_key = api_key
+        self.model = model
+        self.model_id = model
+        self.max_workers = TRANSCRIBE_MAX_WORKERS
+
+    def transcribe(self, path, language="ja"):
+        size = os.path.getsize(path)
+        with telemetry.timer("whisper_api", bytes=size):
+            transcript = transcribe_chunk(get_openai_client(self.api_key), path, model=self.model, language=language)
+        telemetry.record_bytes_uploaded("openai", size)
+        return transcript
+
+class LocalWhisperBackend:
+    """
+    faster-whisper によるローカルCPUでの文字起こし（APIの利用料金がかからない）
+    """
+    name = "local"
+    label = "ローカル（faster-whisper）"
+    max_upload_bytes = None  # アップロードの上限がないため分割せずにファイル全体を渡す（区間の並列処理はバッチ推論で行う）
+
+    def __init__(self, model_size=None, compute_type=None):
+        self.model_size = model_size or local_whisper.LOCAL_WHISPER_MODEL
+        self.compute_type = compute_type or local_whisper.LOCAL_WHISPER_COMPUTE_TYPE
+        self.model_id = f"local-{self.model_size}-{self.compute_type}"
+        self.max_workers = local_whisper.LOCAL_WHISPER_WORKERS
+
+    def transcribe(self, path, language="ja"):
+        with telemetry.timer("whisper_local", model=self.model_id):
+            return local_whisper.transcribe(path, language=language, model_size=self.model_size,
+                                            compute_type=self.compute_type)
+
+TRANSCRIPTION_BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend.label,
+    LocalWhisperBackend.name: LocalWhisperBackend.label,
+}
+
+def get_transcription_backend(name, api_key=None, model="whisper-1"):
+    """
+    名前から文字起こしエンジンを作成します
+    :param name: "openai" または "local"
+    """
+    if name == LocalWhisperBackend.name:
+        if not local_whisper.is_available():
+            raise RuntimeError("faster-whisper がインストールされていません（pip install faster-whisper）。")
+        return LocalWhisperBackend()
+    if name == OpenAIWhisperBackend.name:
+        return OpenAIWhisperBackend(api_key, model)
+    raise ValueError(f"不明な文字起こしエンジンです: {name}")
+
+def _transcribe_chunk_cached(backend, chunk_file, language, cache=None, cache_key=None):
+    """
+    チャンクのキャッシュがあればそれを返し、なければ文字起こししてキャッシュに保存します
+    """
+    if cache is not None and cache_key is not None:
+        cached = cache.get("chunks", cache_key)
+        if cached is not None:
+            return _transcript_from_dict(cached)
+    transcript = _normalize_transcript(backend.transcribe(chunk_file, language))
+    if cache is not None and cache_key is not None:
+        # オフセット調整前の結果を保存する
+        cache.put("chunks", cache_key, _transcript_to_dict(transcript))
+    return transcript
+
+def _normalize_text(text):
+    return re.sub(r"\s+", "", text or "")
+
+def stitch_chunk_segments(chunk_results):
+    """
+    チャンクごとのセグメント（オフセット調整済み）を1つのタイムラインに結合します。
+    チャンクが重なっている区間は中点で区切り、境界で重複したセグメントを取り除きます。
+    :param chunk_results: (チャンク, セグメント) のリスト（チャンクの順序）。各チャンクのセグメントは開始時刻の順
+    :return: SegmentStore
+    """
+    merged = SegmentStore()
+    prev_end = None
+    for chunk, segments in chunk_results:
+        prev_end = _stitch_chunk(merged, prev_end, chunk, segments)
+    return merged
+
+def _stitch_chunk(merged, prev_end, chunk, segments):
+    """
+    1つのチャンクのセグメントを、結合済みのセグメントの末尾に重なりを除いて追加します（merged をその場で変更）
+    :param prev_end: 直前に追加したチャンクの終了時刻（最初のチャンクはNone）
+    :return: このチャンクの終了時刻（次の呼び出しの prev_end）
+    """
+    segments = to_segment_store(segments)
+    if prev_end is not None and chunk["start"] < prev_end:
+        # 重なり区間の中点より前のセグメントは前のチャンク、以降は次のチャンクを採用する
+        midpoint = (chunk["start"] + prev_end) / 2
+        merged.truncate(bisect.bisect_left(merged.starts, midpoint))
+        segments = segments[bisect.bisect_left(segments.starts, midpoint):]
+    # 境界をまたいで同じ内容が重複した場合は取り除く
+    if merged and segments and _normalize_text(merged.text(len(merged) - 1)) == _normalize_text(segments.text(0)):
+        segments = segments[1:]
+    merged.extend(segments)
+    return chunk["end"]
+
+def _offset_segments(transcript, time_offset, time_map=None):
+    # 実際のチャンク開始時刻でセグメントのオフセットを調整し、前処理した場合は元の録音の時刻に戻す
+    transcript.segments = to_segment_store(getattr(transcript, "segments", None)).shift(time_offset)
+    if time_map is not None:
+        transcript.segments.map_times(time_map.to_original, lambda t: time_map.to_original(t, is_end=True))
+    return transcript
+
+def transcribe_chunks_concurrently(backend, chunks, language="ja",
+                                   max_workers=TRANSCRIBE_MAX_WORKERS, on_chunk_done=None,
+                                   cache=None, chunk_keys=None, checkpoint=None, time_map=None):
+    """
+    複数のチャンクを並列に文字起こしし、元の順序でテキストとセグメントを再構成します。
+    :param backend: 文字起こしエンジン（OpenAIWhisperBackend / LocalWhisperBackend）
+    :param chunks: split_audio_ffmpeg が返すチャンクのリスト
+    :param max_workers: 同時に実行するリクエスト数
+    :param on_chunk_done: チャンク完了時に (index, error, transcript) で呼ばれるコールバック（メインスレッドで実行）。
+        transcript のセグメントはオフセット調整済みで、transcript.chunk に結合に使うチャンクの境界（"start", "end"）を持つ
+    :param cache: チャンク単位の結果を保存するキャッシュ（Noneならキャッシュしない）
+    :param chunk_keys: 各チャンクのキャッシュキーのリスト
+    :param checkpoint: チャンクごとの状態を記録する checkpoints.ChunkCheckpoint。
+        完了済みのチャンクは記録から読み込み、送信しません
+    :param time_map: 前処理した音声を分割した場合の TimeMap（セグメントの時刻を元の録音の時刻に戻す）
+    :return: (全体テキスト, セグメント（SegmentStore）, 失敗したチャンク番号のリスト)
+    """
+    results = [None] * len(chunks)
+    failed = []
+    # 結合時のチャンクの境界も元の録音の時刻で比較する
+    bounds = [
+        {"start": time_map.to_original(c["start"]), "end": time_map.to_original(c["end"], is_end=True)} if time_map else c
+        for c in chunks
+    ]
+    
+    def finish_chunk(i, transcript, error):
+        if error is None:
+            if checkpoint is not None:
+                # オフセット調整前の結果を記録する
+                checkpoint.mark_done(i, _transcript_to_dict(transcript))
+            results[i] = _offset_segments(transcript, chunks[i]["start"], time_map)
+            results[i].chunk = bounds[i]
+        else:
+            failed.append(i)
+            if checkpoint is not None:
+                checkpoint.mark_failed(i, error, chunks[i].get("path"))
+        if on_chunk_done:
+            on_chunk_done(i, error, results[i])
+    
+    pending = []
+    for i, chunk in enumerate(chunks):
+        saved = checkpoint.result(i) if checkpoint is not None else None
+        if saved is not None:
+            results[i] = _offset_segments(_transcript_from_dict(saved), chunk["start"], time_map)
+            results[i].chunk = bounds[i]
+            if on_chunk_done:
+                on_chunk_done(i, None, results[i])
+        elif not chunk.get("path"):
+            finish_chunk(i, None, FileNotFoundError("チャンクの音声が保存されていません"))
+        else:
+            pending.append(i)
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(
+                telemetry.bind(_transcribe_chunk_cached), backend, chunks[i]["path"], language,
+                cache, chunk_keys[i] if chunk_keys else None
+            ): i
+            for i in pending
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                transcript, error = future.result(), None
+            except Exception as e:
+                transcript, error = None, e
+            finish_chunk(i, transcript, error)
+    
+    # 元の順序でセグメントを結合
+    chunk_results = []
+    texts = []
+    for i, transcript in enumerate(results):
+        if transcript is None:
+            continue
+        chunk_results.append((bounds[i], transcript.segments))
+        texts.append(getattr(transcript, 'text', ""))
+    
+    all_segments = stitch_chunk_segments(chunk_results)
+    
+    # セグメントがあれば重複除去後のセグメントから全体テキストを組み立てる
+    # （日本語などの単語を空白で区切らない言語はセグメントごとに改行し、それ以外は空白で区切る）
+    if all_segments:
+        separator = "\n" if language in NO_SPACE_LANGUAGES else " "
+        full_text = all_segments.joined_text(separator) + "\n"
+    else:
+        full_text = "\n".join(texts) + "\n" if texts else ""
+    return full_text, all_segments, sorted(failed)
+
+def _report_failed_chunks(failed, stats, checkpoint):
+    if stats is not None:
+        stats["checkpoint_id"] = checkpoint.checkpoint_id
+        stats["chunks"] = len(checkpoint.chunks)
+        stats["failed_chunks"] = failed
+    if failed:
+        st.warning(f"{len(failed)}個のチャンクの文字起こしに失敗しました: " +
+                   ", ".join(str(i + 1) for i in failed) +
+                   "。完了したチャンクは保存されているため、再試行すると失敗したチャンクだけを送信します。")
+
+def _report_audio_reduction(time_map, stats):
+    original, sent = time_map.original_seconds, time_map.sent_seconds
+    telemetry.record_audio_seconds(original, sent)
+    if stats is not None:
+        stats["audio_seconds"] = original
+        stats["sent_audio_seconds"] = sent
+    st.info(
+        f"無音区間の除去・速度変更により、送信する音声を {original / 60:.1f}分 → {sent / 60:.1f}分 に短縮しました"
+        f"（{1 - sent / max(original, 1e-9):.0%}削減）"
+    )
+
+def transcribe_audio(upload, api_key, model="whisper-1", language="ja", max_workers=None,
+                     codec=CHUNK_CODEC, on_chunk=None, backend="openai", stats=None,
+                     trim_silence=TRIM_SILENCE, tempo=AUDIO_TEMPO, resume=None):
     """
-    OpenAI Whisper APIを使用して音声を文字起こしする
+    音声を文字起こしする（OpenAI Whisper API またはローカルの faster-whisper）
+    :param upload: ingest_upload で書き出したアップロードファイル
+    :param max_workers: 同時に処理するチャンク数（Noneならエンジンごとの既定値）
+    :param codec: 分割時のエンコード形式（"opus", "mp3", "wav"）
+    :param backend: 文字起こしエンジンの名前（"openai", "local"）またはエンジンのインスタンス
+    :param on_chunk: チャンクの文字起こし完了ごとに (index, transcript) で呼ばれるコールバック。
+        失敗したチャンクは transcript=None。キャッシュから全体を取得した場合は呼ばれない
+    :param stats: 分割して処理した場合に、チェックポイントのID・チャンク数・失敗したチャンク番号を書き込む辞書（任意）。
+        前処理した場合は元の音声と送信した音声の長さ（秒）も書き込みます
+    :param trim_silence: Trueの場合は長い無音区間を除去してから送信する
+    :param tempo: 送信する音声の再生速度（1.0で変更しない）。
+        前処理した場合もセグメントの時刻は元の録音の時刻で返します
+    :param resume: 記録済みのチェックポイントから完了済みのチャンクを読み込むか。
+        Noneならキャッシュの設定（MINUTES_CACHE_ENABLED）に従う（無効の場合は再試行・再開のときだけTrueを渡す）
     """
+    if resume is None:
+        resume = CACHE_ENABLED
     try:
-        # OpenAIクライアントの初期化
-        client = OpenAI(api_key=api_key)
+        # 文字起こしエンジンの取得（OpenAIクライアントはプロセス内で共有し、接続を再利用する）
+        if isinstance(backend, str):
+            backend = get_transcription_backend(backend, api_key, model)
+        if max_workers is None:
+            max_workers = backend.max_workers
         
-        # 一時ファイルを作成して保存
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.name).suffix) as tmp_file:
-            tmp_file.write(file.getvalue())
-            tmp_path = tmp_file.name
+        tmp_path = upload.path
+        file_size = upload.size
+        
+        # 前処理の設定はキャッシュとチェックポイントのキーに含める
+        signature = preprocess_signature(trim_silence, tempo)
+        if signature and not media_probe.ffmpeg_available():
+            st.warning("無音区間の除去・速度変更にはFFmpegが必要なため、前処理を行わずに送信します。")
+            signature = ""
+        key_parts = [signature] if signature else []
+        
+        # 同じ音声・モデル・言語の文字起こし結果がキャッシュにあれば再利用する
+        cache = get_cache()
+        cache_key = make_cache_key(upload.sha256(), backend.model_id, language, *key_parts) if cache else None
+        if cache is not None:
+            cached = cache.get("transcripts", cache_key)
+            if cached is not None:
+                st.info("キャッシュ済みの文字起こし結果を使用します。")
+                transcript = _transcript_from_dict(cached)
+                return transcript.text, transcript.segments
+        
+        # チャンクごとの状態と結果を記録し、中断・失敗した文字起こしは未完了のチャンクだけを送信する
+        checkpoint = checkpoints.open_checkpoint(
+            make_cache_key(upload.sha256(), backend.model_id, language, codec, *key_parts)
+        )
+        if not resume:
+            # キャッシュを無効にした場合は以前の記録を使わず、すべてのチャンクを送信する（ベンチマークの再現性のため）
+            checkpoint.reset()
+        if checkpoint.is_complete():
+            st.info("チェックポイントに記録済みの文字起こし結果を使用します。")
+            def on_saved_chunk(i, error, transcript):
+                if on_chunk:
+                    on_chunk(i, transcript)
+            saved_map = checkpoint.info.get("time_map")
+            full_text, all_segments, failed = transcribe_chunks_concurrently(
+                backend, checkpoint.chunks, language=language, checkpoint=checkpoint,
+                on_chunk_done=on_saved_chunk, time_map=TimeMap.from_dict(saved_map) if saved_map else None
+            )
+            _report_failed_chunks(failed, stats, checkpoint)
+            return full_text, all_segments
         
-        file_size = os.path.getsize(tmp_path)
+        # 無音区間の除去・速度変更を行い、以降は前処理後の音声を送信する
+        time_map = None
+        if signature:
+            with telemetry.timer("preprocess"):
+                tmp_path, time_map = compact_audio(
+                    upload.path, upload.make_temp_dir("compact_"), upload.media_info(),
+                    trim_silence=trim_silence, tempo=tempo, codec=codec
+                )
+            file_size = os.path.getsize(tmp_path)
+            _report_audio_reduction(time_map, stats)
         
-        # ファイルサイズが制限を超える場合は分割して処理
-        if file_size > MAX_SIZE:
+        # ファイルサイズがエンジンの送信上限を超える場合は分割して処理（ローカルの文字起こしは分割しない）
+        if backend.max_upload_bytes is not None and file_size > backend.max_upload_bytes:
             st.info(f"ファイルサイズが大きいため（{file_size/1024/1024:.2f}MB）、分割して処理します。")
             
-            # FFmpegが利用可能か確認
-            ffmpeg_available = False
-            try:
-                subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-                ffmpeg_available = True
-            except (subprocess.SubprocessError, FileNotFoundError):
+            # FFmpegが利用可能か確認（プロセスごとに一度だけ確認）
+            if not media_probe.ffmpeg_available():
                 st.error("音声分割にはFFmpegが必要です。Streamlit Cloudではファイルサイズが25MB以下の音声ファイルだけが対応可能です。")
                 raise Exception("FFmpegが見つかりません。より小さなファイルで試してください。")
             
-            if not ffmpeg_available:
-                raise Exception("FFmpegが見つかりません。より小さなファイルで試してください。")
-            
-            # 音声ファイルを複数のチャンクに分割
-            temp_dir = tempfile.mkdtemp()
+            # 音声の長さから分割方法を決め、音声ファイルを複数のチャンクに分割
+            media_info = media_probe.probe(tmp_path) if time_map else upload.media_info()
+            temp_dir = upload.make_temp_dir("chunks_")
             try:
-                chunk_files = split_audio_ffmpeg(tmp_path, output_dir=temp_dir)
+                with telemetry.timer("ffmpeg_split") as split_timer:
+                    chunks = split_audio_ffmpeg(tmp_path, output_dir=temp_dir, codec=codec, media_info=media_info)
+                split_seconds = split_timer.seconds
+                checkpoint.begin(chunks, backend=backend.name, model=model, language=language,
+                                 time_map=time_map.to_dict() if time_map else None)
+                resumed = len(chunks) - len(checkpoint.failed())
+                if resumed:
+                    st.info(f"{resumed}個のチャンクはチェックポイントに記録済みのため、残りのチャンクだけを送信します。")
+                chunk_keys = [
+                    make_cache_key(upload.sha256(), "chunk", c["format"], f"{c['start']:.3f}", f"{c['end']:.3f}",
+                                   backend.model_id, language, *key_parts)
+                    for c in chunks
+                ]
                 
-                full_text = ""
-                all_segments = []
+                # ジョブごとのチャンク数と送信サイズを表示
+                chunk_sizes = [os.path.getsize(c["path"]) for c in chunks]
+                total_bytes = sum(chunk_sizes)
+                chunk_format = "再エンコードなし" if chunks and chunks[0]["format"] == "copy" else codec
+                st.info(
+                    f"{len(chunks)}個のチャンクに分割しました（形式: {chunk_format}、分割 {split_seconds:.1f}秒、"
+                    f"最長チャンク: {max((c['end'] - c['start'] for c in chunks), default=0):.0f}秒、"
+                    f"合計 {total_bytes/1024/1024:.2f}MB、平均 {total_bytes/max(1, len(chunks))/1024/1024:.2f}MB/チャンク、"
+                    f"最大 {max(chunk_sizes, default=0)/1024/1024:.2f}MB）"
+                )
+                total = len(chunks)
                 
-                # 各チャンクを処理
-                for i, chunk_file in enumerate(chunk_files):
-                    st.info(f"チャンク {i+1}/{len(chunk_files)} を処理中...")
-                    
-                    # ファイルサイズを確認（デバッグ用）
-                    chunk_size = os.path.getsize(chunk_file)
-                    st.info(f"チャンクサイズ: {chunk_size/1024/1024:.2f}MB")
-                    
-                    with open(chunk_file, "rb") as audio_file:
-                        try:
-                            transcript = client.audio.transcriptions.create(
-                                model=model,
-                                file=audio_file,
-                                language=language,
-                                response_format="verbose_json"
-                            )
-                            
-                            # テキスト部分を結合
-                            if hasattr(transcript, 'text'):
-                                full_text += transcript.text + "\n"
-                            
-                            # セグメント情報があれば追加
-                            if hasattr(transcript, 'segments'):
-                                # セグメントの時間オフセットを調整
-                                time_offset = (i * 300)  # 5分（300秒）ごとのオフセット
-                                for segment in transcript.segments:
-                                    if hasattr(segment, 'start'):
-                                        segment.start += time_offset
-                                    if hasattr(segment, 'end'):
-                                        segment.end += time_offset
-                                all_segments.extend(transcript.segments)
-                        except Exception as e:
-                            st.error(f"チャンク {i+1} の処理中にエラーが発生: {str(e)}")
-                            continue
-                    
-                    # 処理済みのチャンクを削除
-                    try:
-                        os.remove(chunk_file)
-                    except:
-                        pass
+                # チャンクごとの完了状況を到着順に表示
+                progress_bar = st.progress(0.0, text=f"チャンク 0/{total} 完了")
+                completed = []
                 
-                # 一時ディレクトリのクリーンアップ
-                try:
-                    os.rmdir(temp_dir)
-                except:
-                    pass
+                def on_chunk_done(i, error, transcript):
+                    completed.append(i)
+                    if error is not None:
+                        st.error(f"チャンク {i+1} の処理中にエラーが発生: {str(error)}")
+                    if on_chunk:
+                        on_chunk(i, transcript)
+                    progress_bar.progress(
+                        len(completed) / total,
+                        text=f"チャンク {len(completed)}/{total} 完了（直近: チャンク {i+1}）"
+                    )
                 
-                # 元の一時ファイルも削除
-                try:
-                    os.unlink(tmp_path)
-                except:
-                    pass
+                full_text, all_segments, failed = transcribe_chunks_concurrently(
+                    backend, chunks,
+                    language=language,
+                    max_workers=max_workers, on_chunk_done=on_chunk_done,
+                    cache=cache, chunk_keys=chunk_keys, checkpoint=checkpoint, time_map=time_map
+                )
+                
+                _report_failed_chunks(failed, stats, checkpoint)
+                if not failed and cache is not None:
+                    cache.put("transcripts", cache_key,
+                              _transcript_to_dict(SimpleNamespace(text=full_text, segments=all_segments)))
                 
                 return full_text, all_segments
             except Exception as e:
                 st.error(f"音声分割処理中にエラーが発生しました: {str(e)}")
                 raise e
+            finally:
+                # 処理済みのチャンクを削除
+                shutil.rmtree(temp_dir, ignore_errors=True)
         else:
             # ファイルサイズが小さい場合は直接処理
-            with open(tmp_path, "rb") as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model=model,
-                    file=audio_file,
-                    language=language,
-                    response_format="verbose_json"
-                )
-            
-            # 一時ファイルを削除
-            os.unlink(tmp_path)
+            transcript = _normalize_transcript(backend.transcribe(tmp_path, language))
+            if time_map is not None:
+                _offset_segments(transcript, 0.0, time_map)
+            if on_chunk:
+                on_chunk(0, transcript)
+            if cache is not None:
+                cache.put("transcripts", cache_key, _transcript_to_dict(transcript))
             
-            return transcript.text, getattr(transcript, "segments", [])
+            return transcript.text, transcript.segments
     except Exception as e:
         st.error(f"文字起こし中にエラーが発生しました: {str(e)}")
         raise e
 
-def generate_markdown(text, segments):
+def retry_failed_chunks(checkpoint_id, api_key, max_workers=None, stats=None):
     """
-    文字起こし結果をMarkdown形式に整形します。
+    チェックポイントに記録された失敗チャンクだけを、保存しておいた音声で再度文字起こしし、
+    完了済みのチャンクとチャンクの時刻順に結合し直します（元の音声ファイルは不要）
+    :param checkpoint_id: transcribe_audio が stats["checkpoint_id"] に書き込んだID
+    :param stats: transcribe_audio と同じく、失敗したチャンク番号などを書き込む辞書（任意）
+    :return: (全体テキスト, セグメント（SegmentStore）)
     """
-    md = "# 音声文字起こし結果\n\n"
+    checkpoint = checkpoints.open_checkpoint(checkpoint_id)
+    if not checkpoint.exists():
+        raise FileNotFoundError("チェックポイントが見つかりません。期限切れの場合は最初から処理し直してください。")
+    info = checkpoint.info
+    backend = get_transcription_backend(info.get("backend", "openai"), api_key, info.get("model", "whisper-1"))
+    chunks = [
+        {"start": entry["start"], "end": entry["end"], "format": entry["format"], "path": checkpoint.audio_path(i)}
+        for i, entry in enumerate(checkpoint.chunks)
+    ]
+    time_map = TimeMap.from_dict(info["time_map"]) if info.get("time_map") else None
+    with telemetry.timer("transcribe_retry", chunks=len(checkpoint.failed())):
+        full_text, all_segments, failed = transcribe_chunks_concurrently(
+            backend, chunks, language=info.get("language", "ja"),
+            max_workers=max_workers or backend.max_workers, checkpoint=checkpoint, time_map=time_map
+        )
+    _report_failed_chunks(failed, stats, checkpoint)
+    return full_text, all_segments
+
+def iter_transcript_markdown(text, segments):
+    """
+    文字起こし結果をMarkdown形式に整形し、少しずつ返すジェネレーター（長い会議でも文字列を繰り返し連結しない）
+    """
+    yield "# 音声文字起こし結果\n\n"
     if text:
-        md += "## 全体テキスト\n\n" + text + "\n\n"
+        yield "## 全体テキスト\n\n"
+        yield text
+        yield "\n\n"
     else:
-        md += "全体の文字起こしテキストがありません。\n\n"
+        yield "全体の文字起こしテキストがありません。\n\n"
     
     if segments:
-        md += "## セグメント別文字起こし\n\n"
+        yield "## セグメント別文字起こし\n\n"
         for seg in segments:
             start = getattr(seg, "start", 0)
             end = getattr(seg, "end", 0)
-            text = getattr(seg, "text", "").strip()
-            md += f"- **[{start:.2f}秒 ～ {end:.2f}秒]**: {text}\n"
+            yield f"- **[{start:.2f}秒 ～ {end:.2f}秒]**: {_speaker_prefix(seg)}{getattr(seg, 'text', '').strip()}\n"
     else:
-        md += "セグメント情報がありません。\n"
-    return md
+        yield "セグメント情報がありません。\n"
 
-def generate_summary(text, api_key):
+def generate_markdown(text, segments):
     """
-    文字起こしテキストからサマリーを生成します。
-    :param text: 文字起こしテキスト
-    :param api_key: OpenAI APIキー
-    :return: サマリー文章
+    文字起こし結果をMarkdown形式に整形します。
     """
-    prompt = f"""
-以下は会議の文字起こしテキストです。このテキストから、重要なポイントをまとめた議事録を作成してください。
+    return "".join(iter_transcript_markdown(text, segments))
+
+def iter_minutes_markdown(meeting_title, summary_text, transcription_text):
+    """
+    議事録（サマリーと文字起こし全文）のMarkdownを少しずつ返すジェネレーター
+    """
+    yield f"# {meeting_title}\n\n"
+    yield "## 会議サマリー\n\n"
+    yield summary_text
+    yield "\n\n## 文字起こし全文\n\n"
+    yield transcription_text
+
+def write_markdown(out, pieces):
+    """
+    ジェネレーターが返すMarkdownをファイル（バイナリ）に順に書き込みます
+    :return: 書き込んだバイト数
+    """
+    size = 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        out.write(data)
+        size += len(data)
+    return size
+
+SUMMARY_SYSTEM_PROMPT = "あなたは会議の議事録を要約する専門家です。構造的で簡潔、かつ重要なポイントが明確にわかるように情報をまとめます。"
+
+# 指示文はシステムメッセージに固定の順序で置き、文字起こしは後ろのユーザーメッセージで渡す
+# （先頭部分が毎回同じになるため、OpenAIのプロンプトキャッシュが適用される）
+SUMMARY_INSTRUCTIONS = """
+次のメッセージで会議の文字起こしテキストを渡します。このテキストから、重要なポイントをまとめた議事録を作成してください。
+議事録には以下の情報を含めてください：
+1. 会議の主な議題
+2. 議論された重要なポイント
+3. 決定事項
+4. アクションアイテム（担当者と期限がわかる場合）
+5. 次回のフォローアップ項目（もしあれば）
+
+形式は以下のようにしてください：
+- 簡潔かつ明確に
+- 箇条書きでまとめる
+- 内容は会議の実質的な情報だけを含める
+"""
+
+SUMMARY_MAP_INSTRUCTIONS = """
+次のメッセージで長い会議の文字起こしの一部分を渡します（先頭に第何部かを記載します）。後で全体の議事録にまとめるため、この部分について以下を箇条書きで漏れなく抽出してください：
+- 議題・話題
+- 議論された重要なポイント
+- 決定事項
+- アクションアイテム（担当者と期限がわかる場合）
+- フォローアップ項目
+該当がない項目は省略してください。時刻の表記があれば残してください。
+"""
+
+SUMMARY_REDUCE_INSTRUCTIONS = """
+次のメッセージで、会議の文字起こしを時間順に分割し部分ごとに要約したものを渡します。これらを統合して、重複を除いた1つの議事録を作成してください。
 議事録には以下の情報を含めてください：
 1. 会議の主な議題
 2. 議論された重要なポイント
@@ -374,30 +1489,700 @@ def generate_summary(text, api_key):
 - 簡潔かつ明確に
 - 箇条書きでまとめる
 - 内容は会議の実質的な情報だけを含める
+"""
 
-文字起こしテキスト:
+SUMMARY_STRUCTURED_INSTRUCTIONS = """
+結果は指定されたJSON形式で出力してください。
+- agenda: 会議の主な議題
+- key_points: 議論された重要なポイント
+- decisions: 決定事項
+- action_items: アクションアイテム（task: 内容、owner: 担当者、due: 期限。わからない場合は null）
+- follow_ups: 次回のフォローアップ項目
+各項目は簡潔な1文にし、該当がない場合は空の配列にしてください。
 """
-    prompt += text
 
+SUMMARY_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "agenda": {"type": "array", "items": {"type": "string"}},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+        "decisions": {"type": "array", "items": {"type": "string"}},
+        "action_items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "task": {"type": "string"},
+                    "owner": {"type": ["string", "null"]},
+                    "due": {"type": ["string", "null"]},
+                },
+                "required": ["task", "owner", "due"],
+                "additionalProperties": False,
+            },
+        },
+        "follow_ups": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["agenda", "key_points", "decisions", "action_items", "follow_ups"],
+    "additionalProperties": False,
+}
+
+SUMMARY_SECTIONS = [
+    ("agenda", "議題"),
+    ("key_points", "重要なポイント"),
+    ("decisions", "決定事項"),
+    ("action_items", "アクションアイテム"),
+    ("follow_ups", "フォローアップ"),
+]
+
+_tiktoken = None
+
+def _load_tiktoken():
+    """
+    tiktoken を初めて使用するときにインポートします（インストールされていない場合はNone）
+    """
+    global _tiktoken
+    if _tiktoken is None:
+        try:
+            import tiktoken  # 任意: 正確なトークン数の計算に使用
+            _tiktoken = tiktoken
+        except ImportError:
+            _tiktoken = False
+    return _tiktoken or None
+
+def count_tokens(text, model=SUMMARY_MODEL):
+    """
+    テキストのトークン数を数えます。tiktokenがない場合は文字数から概算します。
+    """
+    tiktoken = _load_tiktoken()
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return len(encoding.encode(text))
+    # 日本語は概ね1文字1トークン、英数字は4文字1トークン程度として概算
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+def _format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def _speaker_prefix(seg):
+    # 話者（参加者ごとのトラックの名前）があれば「話者: 」を先頭に付ける
+    speaker = getattr(seg, "speaker", None)
+    return f"{speaker}: " if speaker else ""
+
+def _segment_window_line(seg):
+    return f"[{_format_timestamp(getattr(seg, 'start', 0))}] {_speaker_prefix(seg)}{getattr(seg, 'text', '').strip()}\n"
+
+def split_transcript_windows(text, segments=None, max_tokens=SUMMARY_WINDOW_TOKENS, model=SUMMARY_MODEL):
+    """
+    文字起こしをトークン数の上限に収まるウィンドウに分割します。
+    セグメントがあればセグメントの境界で（時刻付きで）、なければ文の区切りで分割します。
+    :return: ウィンドウのテキストのリスト
+    """
+    if segments:
+        units = [_segment_window_line(seg) for seg in segments]
+    else:
+        units = [u for u in re.split(r"(?<=[。！？!?\n])", text) if u]
+    
+    windows = []
+    current = []
+    current_tokens = 0
+    for unit in units:
+        tokens = count_tokens(unit, model)
+        if current and current_tokens + tokens > max_tokens:
+            windows.append("".join(current))
+            current = []
+            current_tokens = 0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        windows.append("".join(current))
+    return windows
+
+_stats_lock = threading.Lock()
+
+def _complete(client, model, instructions, content, stats, response_format=None):
+    """
+    チャット補完を1回呼び出し、トークン使用量（プロンプトキャッシュが適用された入力トークン数を含む）を stats に加算します。
+    固定の指示文をシステムメッセージに、可変の内容をユーザーメッセージに分けて送ります。
+    """
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT + "\n" + instructions},
+            {"role": "user", "content": content}
+        ],
+        "temperature": 0.3,
+    }
+    if response_format is not None:
+        request["response_format"] = response_format
+    with telemetry.timer("summary_call", model=model):
+        response = call_with_retries(lambda: client.chat.completions.create(**request))
+    usage = getattr(response, "usage", None)
+    cached_tokens = 0
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        telemetry.record_tokens(model, usage.prompt_tokens or 0, usage.completion_tokens or 0, cached_tokens)
+    # 部分要約は複数スレッドから呼ばれるため、集計はロックして行う
+    with _stats_lock:
+        if usage is not None:
+            stats["input_tokens"] = stats.get("input_tokens", 0) + (usage.prompt_tokens or 0)
+            stats["cached_input_tokens"] = stats.get("cached_input_tokens", 0) + cached_tokens
+            stats["output_tokens"] = stats.get("output_tokens", 0) + (usage.completion_tokens or 0)
+        stats["api_calls"] = stats.get("api_calls", 0) + 1
+    return response.choices[0].message.content
+
+def structured_summary_to_markdown(data):
+    """
+    JSON形式のサマリーを議事録のMarkdownに整形します。
+    アクションアイテムはチェックボックス（- [ ]）にし、Notionに保存するときにTo-doブロックにします。
+    """
+    lines = []
+    for key, label in SUMMARY_SECTIONS:
+        items = data.get(key) or []
+        if not items:
+            continue
+        lines.append(f"## {label}")
+        for item in items:
+            if key == "action_items":
+                details = "、".join(
+                    f"{name}: {item[field]}" for field, name in (("owner", "担当"), ("due", "期限")) if item.get(field)
+                )
+                lines.append(f"- [ ] {item.get('task', '')}" + (f"（{details}）" if details else ""))
+            else:
+                lines.append(f"- {item}")
+        lines.append("")
+    return "\n".join(lines).strip() or "議事録にまとめる内容がありませんでした。"
+
+def _complete_summary(client, model, instructions, content, stats, summary_format=SUMMARY_FORMAT):
+    """
+    最終的な議事録を作成します。structured の場合はJSON形式で取得してMarkdownに整形します。
+    """
+    if summary_format != "structured":
+        return _complete(client, model, instructions, content, stats)
+    raw = _complete(
+        client, model, instructions + SUMMARY_STRUCTURED_INSTRUCTIONS, content, stats,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "meeting_minutes", "strict": True, "schema": SUMMARY_JSON_SCHEMA},
+        }
+    )
     try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "あなたは会議の議事録を要約する専門家です。構造的で簡潔、かつ重要なポイントが明確にわかるように情報をまとめます。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-        )
+        return structured_summary_to_markdown(json.loads(raw))
+    except (TypeError, ValueError, AttributeError):
+        # JSONとして解釈できない場合は応答をそのまま使う
+        return raw
+
+def _map_window_content(index, window):
+    # 第何部かは可変のため、指示文ではなく内容の先頭に置く
+    return f"（第{index + 1}部）\n{window}"
+
+def _map_reduce_summary(client, model, windows, stats, max_workers=SUMMARY_MAX_WORKERS, summary_format=SUMMARY_FORMAT):
+    """
+    ウィンドウごとの部分要約を並列に作成し（map）、それらを統合して最終的な議事録にします（reduce）
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        partials = list(executor.map(
+            telemetry.bind(lambda iw: _complete(client, model, SUMMARY_MAP_INSTRUCTIONS, _map_window_content(*iw), stats)),
+            enumerate(windows)
+        ))
+    stats["map_seconds"] = stats.get("map_seconds", 0) + time.perf_counter() - started
+    return _reduce_partials(client, model, partials, stats, max_workers=max_workers, summary_format=summary_format)
+
+def _reduce_partials(client, model, partials, stats, max_workers=SUMMARY_MAX_WORKERS, summary_format=SUMMARY_FORMAT):
+    """
+    部分要約を統合して最終的な議事録にします
+    """
+    started = time.perf_counter()
+    # 部分要約の合計が上限を超える場合は、さらにまとめてから統合する
+    while len(partials) > 1 and count_tokens("\n\n".join(partials), model) > SUMMARY_WINDOW_TOKENS:
+        groups = split_transcript_windows("\n\n".join(partials) + "\n\n", max_tokens=SUMMARY_WINDOW_TOKENS, model=model)
+        if len(groups) >= len(partials):
+            break
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            partials = list(executor.map(
+                telemetry.bind(lambda g: _complete(client, model, SUMMARY_REDUCE_INSTRUCTIONS, g, stats)), groups
+            ))
+    sections = "\n\n".join(f"### 部分 {i + 1}\n{p}" for i, p in enumerate(partials))
+    summary = _complete_summary(client, model, SUMMARY_REDUCE_INSTRUCTIONS, sections, stats, summary_format)
+    stats["reduce_seconds"] = stats.get("reduce_seconds", 0) + time.perf_counter() - started
+    return summary
+
+def _summary_cache_key(text, model, summary_format=SUMMARY_FORMAT):
+    return make_cache_key(hashlib.sha256(text.encode("utf-8")).hexdigest(), model,
+                          SUMMARY_PROMPT_VERSION, SUMMARY_WINDOW_TOKENS, summary_format)
+
+def generate_summary(text, api_key, model=SUMMARY_MODEL, segments=None, stats=None, summary_format=SUMMARY_FORMAT):
+    """
+    文字起こしテキストからサマリーを生成します。
+    長い文字起こしはトークン数の上限に収まるウィンドウに分割し、部分要約を並列に作成してから統合します。
+    :param text: 文字起こしテキスト
+    :param api_key: OpenAI APIキー
+    :param model: サマリー生成に使用するモデル
+    :param segments: セグメントのリスト（あればセグメントの境界で分割する）
+    :param stats: 入出力トークン数と各段階の所要時間を書き込む辞書（任意）
+    :param summary_format: "text"（自由形式）または "structured"（JSONで取得して議題・決定事項・アクションアイテムに整形）
+    :return: サマリー文章
+    """
+    if stats is None:
+        stats = {}
+    started = time.perf_counter()
+    
+    # 同じ文字起こし・モデル・プロンプトのサマリーがキャッシュにあれば再利用する
+    cache = get_cache()
+    cache_key = _summary_cache_key(text, model, summary_format)
+    if cache is not None:
+        cached = cache.get("summaries", cache_key)
+        if cached is not None:
+            stats["cached"] = True
+            return cached["summary"]
+
+    try:
+        client = get_openai_client(api_key)
+        stats["transcript_tokens"] = count_tokens(text, model)
         
-        return response.choices[0].message.content
+        if stats["transcript_tokens"] <= SUMMARY_WINDOW_TOKENS:
+            stats["windows"] = 1
+            summary = _complete_summary(client, model, SUMMARY_INSTRUCTIONS, text, stats, summary_format)
+        else:
+            windows = split_transcript_windows(text, segments, model=model)
+            stats["windows"] = len(windows)
+            summary = _map_reduce_summary(client, model, windows, stats, summary_format=summary_format)
+        
+        stats["total_seconds"] = time.perf_counter() - started
+        if cache is not None:
+            cache.put("summaries", cache_key, {"summary": summary})
+        return summary
     except Exception as e:
         st.error(f"サマリー生成中にエラーが発生しました: {str(e)}")
         raise e
 
-def write_to_notion(api_key, database_id, title, transcription, summary, filename, file_date):
+class IncrementalSummarizer:
+    """
+    文字起こしが完了したチャンクを受け取り、チャンクの順序で文字起こしをつなげながら、
+    ウィンドウ（トークン数の上限）に達した部分から部分要約をバックグラウンドで作成します。
+    チャンク間の重なりは最終的な文字起こしと同じ方法（stitch_chunk_segments）で取り除き、
+    次のチャンクとの重なりで削られる可能性がある最新のチャンクのセグメントは、次のチャンクが届くまで取り込みません。
+    最後のチャンクが届いた時点では、残りの部分要約と統合だけを行えばよい状態になります。
+    """
+    def __init__(self, api_key, model=SUMMARY_MODEL, max_workers=SUMMARY_MAX_WORKERS,
+                 window_tokens=SUMMARY_WINDOW_TOKENS, summary_format=SUMMARY_FORMAT, language="ja"):
+        self.api_key = api_key
+        self.model = model
+        self.window_tokens = window_tokens
+        self.summary_format = summary_format
+        self.language = language
+        self.stats = {}
+        self._client = get_openai_client(api_key)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self._pending = {}
+        self._next_index = 0
+        self._received = False
+        self._buffer = []
+        self._buffer_tokens = 0
+        self._total_tokens = 0
+        self._partials = []
+        self._texts = []
+        self._segments = SegmentStore()
+        self._prev_end = None
+        self._fed = 0
+        self._map_started = None
+    
+    def add_chunk(self, index, transcript):
+        """
+        チャンクの文字起こし結果（オフセット調整済み）を追加します。失敗したチャンクは transcript=None で渡します。
+        """
+        self._received = True
+        self._pending[index] = transcript
+        # 先頭から連続して揃ったチャンクだけを順に取り込む
+        while self._next_index in self._pending:
+            transcript = self._pending.pop(self._next_index)
+            self._next_index += 1
+            if transcript is None:
+                continue
+            segments = getattr(transcript, "segments", None)
+            chunk = getattr(transcript, "chunk", None)
+            if not segments or chunk is None:
+                # 分割していない（1チャンクの）文字起こしは重なりがないため、そのまま取り込む
+                self._texts.append(getattr(transcript, "text", ""))
+                units = (
+                    [_segment_window_line(seg) for seg in segments] if segments
+                    else [getattr(transcript, "text", "") + "\n"]
+                )
+                for unit in units:
+                    self._add_unit(unit)
+                continue
+            settled = len(self._segments)
+            self._prev_end = _stitch_chunk(self._segments, self._prev_end, chunk, segments)
+            # 前のチャンクまでのセグメントは、以降のチャンクとの重なりで削られないため確定する
+            self._feed_segments(min(settled, len(self._segments)))
+    
+    def _feed_segments(self, end):
+        for i in range(self._fed, end):
+            self._add_unit(_segment_window_line(self._segments[i]))
+        self._fed = max(self._fed, end)
+    
+    def transcript_so_far(self):
+        """
+        これまでに順序どおり揃った部分の文字起こしテキスト（チャンク間の重なりは除去済み）
+        """
+        if self._segments:
+            separator = "\n" if self.language in NO_SPACE_LANGUAGES else " "
+            return self._segments.joined_text(separator)
+        return "\n".join(self._texts)
+    
+    def _add_unit(self, unit):
+        tokens = count_tokens(unit, self.model)
+        if self._buffer and self._buffer_tokens + tokens > self.window_tokens:
+            self._submit_window()
+        self._buffer.append(unit)
+        self._buffer_tokens += tokens
+        self._total_tokens += tokens
+    
+    def _submit_window(self):
+        if self._map_started is None:
+            self._map_started = time.perf_counter()
+        content = _map_window_content(len(self._partials), "".join(self._buffer))
+        self._partials.append(self._executor.submit(
+            telemetry.bind(_complete), self._client, self.model, SUMMARY_MAP_INSTRUCTIONS, content, self.stats
+        ))
+        self._buffer = []
+        self._buffer_tokens = 0
+    
+    def finish(self, text, segments=None):
+        """
+        すべてのチャンクの取り込み後に呼び出し、最終的なサマリーを返します。
+        :param text: 結合済みの文字起こしテキスト（キャッシュキーと短い会議の要約に使用）
+        :param segments: 結合済みのセグメントのリスト
+        """
+        try:
+            # チャンクを受け取っていない（キャッシュ済みなど）または1ウィンドウに収まる場合は通常の要約
+            if not self._received or not self._partials:
+                return generate_summary(text, self.api_key, model=self.model, segments=segments, stats=self.stats,
+                                        summary_format=self.summary_format)
+            
+            started = time.perf_counter()
+            # 最後のチャンクのセグメントは次のチャンクとの重なりがないため、ここで取り込む
+            self._feed_segments(len(self._segments))
+            if self._buffer:
+                self._submit_window()
+            partials = [future.result() for future in self._partials]
+            self.stats["windows"] = len(partials)
+            self.stats["map_seconds"] = time.perf_counter() - self._map_started
+            # 最後のチャンクから統合完了までの待ち時間
+            self.stats["map_wait_seconds"] = time.perf_counter() - started
+            
+            summary = _reduce_partials(self._client, self.model, partials, self.stats,
+                                       summary_format=self.summary_format)
+            self.stats["total_seconds"] = time.perf_counter() - started
+            
+            cache = get_cache()
+            if cache is not None:
+                cache.put("summaries", _summary_cache_key(text, self.model, self.summary_format), {"summary": summary})
+            return summary
+        except Exception as e:
+            st.error(f"サマリー生成中にエラーが発生しました: {str(e)}")
+            raise e
+        finally:
+            self.close()
+    
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def run_pipeline(upload, api_key, on_partial_text=None, **transcribe_kwargs):
+    """
+    文字起こしとサマリー生成をパイプラインで実行します。
+    完了したチャンクから順に部分要約を進めるため、最後のチャンクの完了後すぐにサマリーが得られます。
+    :param upload: ingest_upload で書き出したアップロードファイル
+    :param on_partial_text: 順序どおり揃った途中までの文字起こしテキストを受け取るコールバック
+    :param transcribe_kwargs: transcribe_audio に渡す引数（stats で失敗したチャンクの情報を受け取れる）
+    :return: (文字起こしテキスト, セグメントのリスト, サマリー, サマリーの統計情報)
+    """
+    summarizer = IncrementalSummarizer(api_key, language=transcribe_kwargs.get("language", "ja"))
+    try:
+        def on_chunk(index, transcript):
+            summarizer.add_chunk(index, transcript)
+            if on_partial_text:
+                on_partial_text(summarizer.transcript_so_far())
+        
+        with telemetry.timer("transcribe"):
+            text, segments = transcribe_audio(upload, api_key=api_key, on_chunk=on_chunk, **transcribe_kwargs)
+        # 文字起こし完了後に残っている要約処理（残りの部分要約の待ちと統合）の時間
+        with telemetry.timer("summary"):
+            summary = summarizer.finish(text, segments)
+        return text, segments, summary, summarizer.stats
+    finally:
+        summarizer.close()
+
+def _bind_script_context(fn):
+    """
+    呼び出し元のStreamlitのスクリプト実行コンテキストを引き継いで fn を実行する関数を返します
+    （スレッドプール内から st.info などで画面に表示するため。Streamlitの外ではそのまま実行）
+    """
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    except ImportError:
+        return fn
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return fn
+    def run(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return run
+
+def recorded_start_time(media_info):
+    """
+    ファイルのメタデータ（creation_time などのタグ）から録音開始時刻を取得します
+    :return: タイムゾーン付きのdatetime、または取得できない場合はNone
+    """
+    if media_info is None:
+        return None
+    for tag in ("creation_time", "date"):
+        value = media_info.tags.get(tag)
+        if not value:
+            continue
+        try:
+            started = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        # タイムゾーンのない時刻はUTCとみなす（ffprobeの creation_time はUTC）
+        return started if started.tzinfo else started.replace(tzinfo=timezone.utc)
+    return None
+
+def plan_multi_timeline(durations, start_times, mode=MULTI_MODE_SEQUENTIAL, order=MULTI_ORDER_FILE, ends=None):
+    """
+    複数ファイルを1つの会議のタイムラインに並べます
+    :param durations: ファイルごとの音声の長さ（秒。不明ならNone）
+    :param start_times: ファイルごとの録音開始時刻（recorded_start_time の結果。不明ならNone）
+    :param ends: ファイルごとの文字起こしの最後のセグメントの終了時刻（秒。発言がなければNone）。
+        音声の長さが不明なファイルは、この時刻までを長さとして次のファイルを置きます
+    :param mode: MULTI_MODE_SEQUENTIAL ならファイルを順につなげ、MULTI_MODE_TRACKS なら同じ時刻に重ねる
+    :param order: MULTI_ORDER_RECORDED なら録音開始時刻の順（すべてのファイルで取得できた場合のみ）
+    :return: タイムラインの順の (ファイルの番号, 会議の先頭からのオフセット秒) のリスト
+    """
+    indices = list(range(len(durations)))
+    by_recorded = order == MULTI_ORDER_RECORDED and indices and all(t is not None for t in start_times)
+    if by_recorded:
+        indices.sort(key=lambda i: start_times[i])
+        first = start_times[indices[0]]
+
+    plan = []
+    end = 0.0
+    for i in indices:
+        offset = (start_times[i] - first).total_seconds() if by_recorded else 0.0
+        if mode == MULTI_MODE_SEQUENTIAL:
+            # 連続した録音は前のファイルの終わりより前には置かない（録音開始時刻の間の空白は残す）
+            offset = max(offset, end)
+            length = durations[i] if durations[i] is not None else (ends[i] if ends else None)
+            if length is None:
+                raise ValueError(f"ファイル{i + 1}の長さが分からないため、連続した録音として並べられません。")
+            end = offset + length
+        plan.append((i, offset))
+    return plan
+
+def _failed_chunk_labels(failed_chunks):
+    # 1ファイルのジョブはチャンク番号（0始まり）、複数ファイルのジョブは表示用のラベルを保存している
+    return ", ".join(str(c + 1) if isinstance(c, int) else c for c in failed_chunks)
+
+def transcribe_multiple(uploads, api_key, mode=MULTI_MODE_SEQUENTIAL, order=MULTI_ORDER_FILE, speakers=None,
+                        max_files=MULTI_FILE_MAX_WORKERS, stats=None, **transcribe_kwargs):
+    """
+    複数の音声ファイルを並列に文字起こしし、1つの会議のタイムラインに結合します。
+    ファイルごとの解析・分割・チャンクの送信は同時に進むため、全体の所要時間は最も長いファイルの処理時間に近くなります。
+    :param uploads: ingest_upload で書き出したアップロードファイルのリスト
+    :param mode: MULTI_MODE_SEQUENTIAL（連続した録音）または MULTI_MODE_TRACKS（参加者ごとのトラック）
+    :param order: MULTI_ORDER_FILE（アップロードした順）または MULTI_ORDER_RECORDED（録音開始時刻の順）
+    :param speakers: ファイルごとの話者のラベル（トラックの場合。Noneならファイル名）
+    :param max_files: 同時に文字起こしするファイル数
+    :param stats: ファイル数・失敗したチャンク（「ファイルn のチャンクm」の形式）・音声の長さを書き込む辞書（任意）
+    :param transcribe_kwargs: ファイルごとに transcribe_audio に渡す引数
+    :return: (全体テキスト, セグメント（SegmentStore）)
+    """
+    if speakers is None and mode == MULTI_MODE_TRACKS:
+        speakers = [Path(upload.name).stem for upload in uploads]
+
+    workers = max(1, min(max_files, len(uploads)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # ffprobeでの解析もファイルごとに並列に行う（結果は IngestedUpload に保持され、分割時に再利用される）
+        probe = _bind_script_context(telemetry.bind(lambda upload: upload.media_info()))
+        media_infos = list(executor.map(probe, uploads))
+        start_times = [recorded_start_time(info) for info in media_infos]
+        durations = [info.duration if info is not None else None for info in media_infos]
+        if order == MULTI_ORDER_RECORDED and None in start_times:
+            st.warning("録音開始時刻を取得できないファイルがあるため、アップロードした順に並べます。")
+
+        def transcribe_one(upload):
+            file_stats = {}
+            text, segments = transcribe_audio(upload, api_key, stats=file_stats, **transcribe_kwargs)
+            return text, to_segment_store(segments), file_stats
+
+        run = _bind_script_context(telemetry.bind(transcribe_one))
+        futures = [executor.submit(run, upload) for upload in uploads]
+        results = [future.result() for future in futures]
+
+    # ffprobeで長さを取得できなかったファイルは、文字起こしの最後の発言の終了時刻までを長さとして並べる
+    # （発言のないファイルは長さ0として扱う。次のファイルと時刻が重なることはない）
+    ends = [store.ends[-1] if len(store) else 0.0 for _, store, _ in results]
+    plan = plan_multi_timeline(durations, start_times, mode, order, ends=ends)
+
+    stores = []
+    texts = []
+    failed = []
+    audio_seconds = sent_seconds = 0.0
+    for i, offset in plan:
+        text, store, file_stats = results[i]
+        speaker = speakers[i] if speakers else None
+        if text and not len(store):
+            # セグメントのないエンジンでも、ファイル全体を1つの発言としてタイムラインに残す
+            store.append(0.0, durations[i] or 0.0, text)
+        stores.append(store.shift(offset).set_speaker(speaker))
+        if mode == MULTI_MODE_SEQUENTIAL:
+            texts.append(text)
+        failed.extend(f"ファイル{i + 1}のチャンク{c + 1}" for c in file_stats.get("failed_chunks", []))
+        audio_seconds += file_stats.get("audio_seconds") or durations[i] or 0.0
+        sent_seconds += file_stats.get("sent_audio_seconds") or durations[i] or 0.0
+    merged = SegmentStore.merge(stores)
+
+    # トラックを重ねた場合は発言の時刻順に話者付きで並べ、連続した録音はファイルのテキストを順につなげる
+    if mode == MULTI_MODE_TRACKS:
+        full_text = "\n".join(f"{seg.speaker}: {seg.text.strip()}" if seg.speaker else seg.text.strip()
+                               for seg in merged)
+    else:
+        full_text = "\n".join(text for text in texts if text)
+
+    if stats is not None:
+        stats["files"] = len(uploads)
+        stats["failed_chunks"] = failed
+        stats["audio_seconds"] = audio_seconds
+        stats["sent_audio_seconds"] = sent_seconds
+    return full_text, merged
+
+def run_multi_pipeline(uploads, api_key, mode=MULTI_MODE_SEQUENTIAL, order=MULTI_ORDER_FILE, speakers=None,
+                       **transcribe_kwargs):
+    """
+    複数ファイルを並列に文字起こしし、1つの会議としてサマリーを生成します
+    :param transcribe_kwargs: transcribe_multiple に渡す引数
+    :return: (文字起こしテキスト, セグメント（SegmentStore）, サマリー, サマリーの統計情報)
+    """
+    with telemetry.timer("transcribe", files=len(uploads)):
+        text, segments = transcribe_multiple(uploads, api_key, mode=mode, order=order, speakers=speakers,
+                                             **transcribe_kwargs)
+    summary_stats = {}
+    with telemetry.timer("summary"):
+        summary = generate_summary(text, api_key, segments=segments, stats=summary_stats)
+    return text, segments, summary, summary_stats
+
+def multi_meeting_id(uploads, mode=MULTI_MODE_SEQUENTIAL):
+    """
+    複数ファイルから作成した会議のID（ファイルの内容と扱いから決まる）
+    """
+    return make_cache_key("multi", mode, *(upload.sha256() for upload in uploads))
+
+_notion_schema_cache = {}
+_notion_schema_lock = threading.Lock()
+
+def get_notion_schema(notion, database_id, ttl=NOTION_SCHEMA_TTL):
+    """
+    データベースのタイトル型・日付型プロパティ名を取得します（TTL付きでキャッシュ）
+    :return: (タイトルプロパティ名, 日付プロパティ名, キャッシュを使用したか)
+    """
+    with _notion_schema_lock:
+        cached = _notion_schema_cache.get(database_id)
+        if cached and time.time() - cached[0] < ttl:
+            return cached[1], cached[2], True
+    
+    db_info = call_with_retries(lambda: notion.databases.retrieve(database_id))
+    
+    # タイトルプロパティと日付プロパティを見つける
+    title_property = None
+    date_property = None
+    for prop_name, prop_info in db_info['properties'].items():
+        if prop_info['type'] == 'title' and title_property is None:
+            title_property = prop_name
+        elif prop_info['type'] == 'date' and date_property is None:
+            date_property = prop_name
+    
+    with _notion_schema_lock:
+        _notion_schema_cache[database_id] = (time.time(), title_property, date_property)
+    return title_property, date_property, False
+
+def _notion_text_block(block_type, content, **extra):
+    return {
+        "object": "block",
+        "type": block_type,
+        block_type: {
+            "rich_text": [{
+                "type": "text", 
+                "text": {"content": content}
+            }],
+            **extra
+        }
+    }
+
+_SUMMARY_LINE_PATTERNS = [
+    (re.compile(r"^#{1,6}\s+(.*)$"), "heading_3", {}),
+    (re.compile(r"^[-*]\s+\[ \]\s+(.*)$"), "to_do", {"checked": False}),
+    (re.compile(r"^[-*]\s+\[[xX]\]\s+(.*)$"), "to_do", {"checked": True}),
+    (re.compile(r"^(?:[-*]\s+|・\s*)(.*)$"), "bulleted_list_item", {}),
+    (re.compile(r"^\d+[.)]\s+(.*)$"), "numbered_list_item", {}),
+]
+
+def _summary_blocks(summary):
+    """
+    サマリー（Markdown）の行をNotionのブロックに変換します。
+    見出しは見出しブロック、チェックボックス（- [ ]）はTo-doブロック、箇条書きは箇条書きブロックにします。
+    """
+    blocks = []
+    paragraph = []
+    def flush_paragraph():
+        if paragraph:
+            blocks.extend(_notion_text_block("paragraph", chunk) for chunk in split_text_for_notion("\n".join(paragraph)))
+            paragraph.clear()
+    for line in summary.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            flush_paragraph()
+            continue
+        for pattern, block_type, extra in _SUMMARY_LINE_PATTERNS:
+            match = pattern.match(stripped)
+            if match:
+                flush_paragraph()
+                content = match.group(1).strip() or stripped
+                blocks.extend(_notion_text_block(block_type, chunk, **extra) for chunk in split_text_for_notion(content))
+                break
+        else:
+            paragraph.append(stripped)
+    flush_paragraph()
+    return blocks
+
+def _batches(items, size=NOTION_MAX_CHILDREN):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _append_children(notion, block_id, children, rate_limiter, timings):
+    """
+    ブロックに子ブロックを追加します（レート制限を守り、429などは再試行）
+    :return: 作成されたブロックのリスト
+    """
+    def request():
+        rate_limiter.wait()
+        return notion.blocks.children.append(block_id=block_id, children=children)
+    started = time.perf_counter()
+    response = call_with_retries(request)
+    timings.append({"blocks": len(children), "seconds": time.perf_counter() - started})
+    return response.get("results", [])
+
+def write_to_notion(api_key, database_id, title, transcription, summary, filename, file_date, stats=None,
+                    meeting_id=None, segments=None):
     """
     Notionデータベースに新規ページとして文字起こし結果とサマリーを書き込みます。
+    1リクエストあたりの子ブロック数の上限（100）を超える場合は、最初のバッチでページを作成し、
+    文字起こしを100ブロックずつの折りたたみ見出しに分けて、並列に追加します。
     :param api_key: Notion API キー
     :param database_id: 書き込み先のNotionデータベースID
     :param title: 議事録のタイトル
@@ -405,128 +2190,660 @@ def write_to_notion(api_key, database_id, title, transcription, summary, filenam
     :param summary: サマリーテキスト
     :param filename: 元の音声ファイル名
     :param file_date: 音声ファイルの作成日時
+    :param stats: バッチごとの所要時間などを書き込む辞書（任意）。失敗した場合は "error" にエラーの内容を書き込みます
+    :param meeting_id: 検索インデックスに登録する会議のID（音声ファイルのハッシュ。任意）
+    :param segments: 検索インデックスに登録するセグメント（任意）
     :return: 成功メッセージまたはエラーメッセージ
     """
+    if stats is None:
+        stats = {}
+    write_started = time.perf_counter()
     try:
-        notion = Client(auth=api_key)
+        notion = get_notion_client(api_key)
         
         # Notionデータベースの最初のカラム（通常はタイトル型）にページタイトルを設定
-        # Notionデータベースのプロパティを自動的に調べる
+        # Notionデータベースのプロパティを自動的に調べる（TTL付きでキャッシュ）
         try:
-            db_info = notion.databases.retrieve(database_id)
-            properties = {}
-            
-            # タイトルプロパティと日付プロパティを見つける
-            title_property = None
-            date_property = None
-            
-            for prop_name, prop_info in db_info['properties'].items():
-                if prop_info['type'] == 'title' and title_property is None:
-                    title_property = prop_name
-                elif prop_info['type'] == 'date' and date_property is None:
-                    date_property = prop_name
-            
-            # タイトルプロパティを設定（元のファイル名を使用）
-            if title_property:
-                properties[title_property] = {
-                    "title": [
-                        {
-                            "text": {
-                                "content": filename
-                            }
+            title_property, date_property, stats["schema_cached"] = get_notion_schema(notion, database_id)
+        except Exception as e:
+            stats["error"] = str(e)
+            return f"Notionデータベースのプロパティ取得中にエラーが発生しました: {str(e)}"
+        
+        properties = {}
+        
+        # タイトルプロパティを設定（元のファイル名を使用）
+        if title_property:
+            properties[title_property] = {
+                "title": [
+                    {
+                        "text": {
+                            "content": filename
                         }
-                    ]
-                }
-            else:
-                st.warning("データベースにタイトル型プロパティが見つかりませんでした。")
-            
-            # 日付プロパティがあれば設定（ファイルの作成日時を使用）
-            if date_property and file_date:
-                properties[date_property] = {
-                    "date": {
-                        "start": file_date
                     }
+                ]
+            }
+        else:
+            st.warning("データベースにタイトル型プロパティが見つかりませんでした。")
+        
+        # 日付プロパティがあれば設定（ファイルの作成日時を使用）
+        if date_property and file_date:
+            properties[date_property] = {
+                "date": {
+                    "start": file_date
                 }
-            
-            # ページの子ブロックを作成
-            children = [
+            }
+        
+        # サマリーと文字起こしの見出し・段落ブロックを作成
+        top_blocks = [_notion_text_block("heading_2", "会議要約")]
+        top_blocks += _summary_blocks(summary)
+        top_blocks.append(_notion_text_block("heading_2", "文字起こし全文"))
+        
+        # 文字起こしテキストをチャンクに分割
+        transcription_chunks = split_text_for_notion(transcription)
+        transcription_blocks = [_notion_text_block("paragraph", chunk) for chunk in transcription_chunks]
+        
+        rate_limiter = RateLimiter(NOTION_REQUESTS_PER_SECOND)
+        timings = []
+        stats["batches"] = timings
+        
+        if len(top_blocks) + len(transcription_blocks) <= NOTION_MAX_CHILDREN:
+            # 1回のリクエストに収まる場合はそのままページを作成
+            initial_blocks = top_blocks + transcription_blocks
+            part_batches = []
+        else:
+            # 文字起こしは100ブロックずつ折りたたみ見出しの中に入れ、見出しごとに並列で追加する
+            part_batches = _batches(transcription_blocks)
+            part_headings = [
                 {
                     "object": "block",
-                    "type": "heading_2", 
-                    "heading_2": {
-                        "rich_text": [{
-                            "type": "text", 
-                            "text": {"content": "会議要約"}
-                        }]
+                    "type": "heading_3",
+                    "heading_3": {
+                        "rich_text": [{"type": "text", "text": {"content": f"文字起こし（{i + 1}/{len(part_batches)}）"}}],
+                        "is_toggleable": True
                     }
                 }
+                for i in range(len(part_batches))
             ]
+            initial_blocks = top_blocks + part_headings
+        
+        # 新しいページを最初のバッチで作成
+        first_batch, *rest_batches = _batches(initial_blocks)
+        started = time.perf_counter()
+        new_page = call_with_retries(lambda: notion.pages.create(
+            parent={"database_id": database_id},
+            properties=properties,
+            children=first_batch
+        ))
+        timings.append({"blocks": len(first_batch), "seconds": time.perf_counter() - started})
+        
+        if part_batches:
+            # ページ直下の残りのブロックは順序を保つため順番に追加し、見出しのブロックIDを取得する。
+            # サマリーにも見出しブロックがあるため、種類ではなく initial_blocks 内の位置（top_blocks の後ろ）で特定する
+            heading_ids = []
+            position = len(first_batch)
+            if position > len(top_blocks):
+                page_blocks = call_with_retries(lambda: notion.blocks.children.list(block_id=new_page["id"]))
+                heading_ids += [b["id"] for b in page_blocks.get("results", [])][len(top_blocks):position]
+            for batch in rest_batches:
+                created = _append_children(notion, new_page["id"], batch, rate_limiter, timings)
+                heading_ids += [b["id"] for b in created][max(0, len(top_blocks) - position):]
+                position += len(batch)
             
-            # サマリーテキストをブロックに追加
-            summary_chunks = split_text_for_notion(summary)
-            for chunk in summary_chunks:
-                children.append({
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [{
-                            "type": "text", 
-                            "text": {"content": chunk}
-                        }]
-                    }
-                })
-            
-            # 文字起こし見出しを追加
-            children.append({
-                "object": "block",
-                "type": "heading_2",
-                "heading_2": {
-                    "rich_text": [{
-                        "type": "text", 
-                        "text": {"content": "文字起こし全文"}
-                    }]
-                }
-            })
-            
-            # 文字起こしテキストをチャンクに分割して追加
-            transcription_chunks = split_text_for_notion(transcription)
-            for chunk in transcription_chunks:
-                children.append({
-                    "object": "block", 
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [{
-                            "type": "text", 
-                            "text": {"content": chunk}
-                        }]
-                    }
-                })
+            # 各見出しへの追加は互いに独立しているため並列に実行する
+            with ThreadPoolExecutor(max_workers=NOTION_MAX_WORKERS) as executor:
+                list(executor.map(
+                    telemetry.bind(lambda args: _append_children(notion, args[0], args[1], rate_limiter, timings)),
+                    zip(heading_ids, part_batches)
+                ))
+        
+        stats["total_seconds"] = sum(t["seconds"] for t in timings)
+        telemetry.record_time("notion_write", time.perf_counter() - write_started, requests=len(timings))
+        record_meeting(meeting_id, title, summary, transcription, segments, file_date, filename,
+                       source={"notion": new_page.get("url")})
+        return (
+            f"Notionデータベースに新規ページとして議事録を作成しました。"
+            f"文字起こしテキストは{len(transcription_chunks)}個のブロックに分割されました。"
+            f"（{len(timings)}回のリクエスト、最長 {max(t['seconds'] for t in timings):.1f}秒）"
+        )
             
-            # 新しいページを作成
-            new_page = notion.pages.create(
-                parent={"database_id": database_id},
-                properties=properties,
-                children=children
+    except Exception as e:
+        stats["error"] = str(e)
+        return f"Notionへの書き込み中にエラーが発生しました: {str(e)}"
+
+def _segment_row(store, index):
+    seg = store[index]
+    return f"`{_format_timestamp(seg.start)}` {_speaker_prefix(seg)}{seg.text.strip()}"
+
+@functools.lru_cache(maxsize=8)
+def _text_pages(transcription_text):
+    """
+    セグメントがない文字起こしを文の区切りで行に分け、文字数でページに分けます
+    （同じテキストの再実行では分割し直さない）
+    """
+    rows = [line.strip() for line in re.split(r"(?<=[。．！？!?\n])", transcription_text) if line.strip()]
+    pages = []
+    page_chars = 0
+    for row in rows:
+        if not pages or page_chars + len(row) > TRANSCRIPT_PAGE_CHARS:
+            pages.append([])
+            page_chars = 0
+        pages[-1].append(row)
+        page_chars += len(row)
+    return pages, len(rows)
+
+def _transcript_pager(transcription_text, segments, query):
+    """
+    文字起こしビューアーのページを作る関数を返します。
+    検索語がない場合は、セグメントの配列から表示するページの範囲だけを取り出して整形します
+    （全セグメントを走査するのは検索語で絞り込むときだけ）。
+    :return: (ページ数, 絞り込み後の件数, ページ番号（1始まり）から表示する行のリストを返す関数)
+    """
+    if segments:
+        store = to_segment_store(segments)
+        if query:
+            lowered = query.lower()
+            indices = [
+                i for i in range(len(store))
+                if lowered in store.text(i).lower() or lowered in (store.speaker(i) or "").lower()
+            ]
+        else:
+            indices = range(len(store))
+        page_count = -(-len(indices) // TRANSCRIPT_PAGE_SIZE)
+        def get_page(page):
+            window = indices[(page - 1) * TRANSCRIPT_PAGE_SIZE:page * TRANSCRIPT_PAGE_SIZE]
+            return [_segment_row(store, i) for i in window]
+        return page_count, len(indices), get_page
+    
+    if query:
+        lowered = query.lower()
+        rows = [row for page in _text_pages(transcription_text)[0] for row in page if lowered in row.lower()]
+        pages = [rows[i:i + TRANSCRIPT_PAGE_SIZE] for i in range(0, len(rows), TRANSCRIPT_PAGE_SIZE)]
+        return len(pages), len(rows), lambda page: pages[page - 1]
+    pages, count = _text_pages(transcription_text)
+    return len(pages), count, lambda page: pages[page - 1]
+
+def render_transcript_viewer(transcription_text, segments=None, key=""):
+    """
+    文字起こし全文をページ単位で表示します（タイムスタンプ付き、検索可能）。
+    全文ではなく表示中のページだけを整形・描画するため、長い会議でも操作ごとの処理とブラウザに送るデータが増えません。
+    :param segments: セグメントのリスト（時刻とテキストを持つオブジェクト）またはSegmentStore
+    """
+    query = st.text_input("文字起こしを検索", key=f"transcript_query_{key}").strip()
+    page_count, matched, get_page = _transcript_pager(transcription_text, segments, query)
+    if not page_count:
+        st.info("該当する発言が見つかりませんでした。" if query else "文字起こしテキストがありません。")
+        return
+    
+    if page_count > 1:
+        page = st.number_input(
+            f"ページ（全{page_count}ページ）", min_value=1, max_value=page_count, value=1, step=1,
+            key=f"transcript_page_{key}_{query}"
+        )
+    else:
+        page = 1
+    if query:
+        st.caption(f"「{query}」を含む発言: {matched}件")
+    st.markdown("  \n".join(get_page(page)))
+
+def record_meeting(meeting_id, title, summary, transcription, segments, file_date, filename, source=None):
+    """
+    会議を検索インデックスに登録します（同じ会議は置き換え）。
+    インデックスへの登録に失敗しても処理全体は失敗させず、警告の表示にとどめます。
+    :param source: 保存先の情報（{"notion": ページURL} など）
+    """
+    if not meeting_id or not meeting_index.is_available():
+        return
+    try:
+        meeting_index.index_meeting(
+            meeting_id, title, summary, transcription, segments,
+            meeting_date=file_date, filename=filename, source=source
+        )
+    except sqlite3.Error as e:
+        st.warning(f"検索インデックスへの登録に失敗しました: {str(e)}")
+
+# 字幕のダウンロード形式（ラベル、拡張子、MIMEタイプ、ジェネレーター）
+SUBTITLE_FORMATS = [
+    ("字幕（SRT）としてダウンロード", "srt", "application/x-subrip", iter_srt),
+    ("字幕（WebVTT）としてダウンロード", "vtt", "text/vtt", iter_vtt),
+]
+
+def _download_data(state_key, identity, make_pieces):
+    """
+    ダウンロードするファイルの内容をジェネレーターから組み立て、同じ結果の再実行では作り直さずに返します
+    :param identity: 内容が同じかどうかを判定する値
+    :param make_pieces: 内容を少しずつ返すジェネレーターを作成する関数
+    """
+    cached = st.session_state.get(state_key)
+    if cached is None or cached[0] != identity:
+        buffer = io.BytesIO()
+        write_markdown(buffer, make_pieces())
+        cached = st.session_state[state_key] = (identity, buffer.getvalue())
+    return cached[1]
+
+def render_results(meeting_title, transcription_text, summary_text, filename, file_date,
+                   notion_api_key, notion_database_id, key="", segments=None, meeting_id=None):
+    """
+    サマリーと文字起こし結果、ダウンロードボタン、Notionへの保存ボタンを表示します
+    :param key: 同じページに複数の結果を表示する場合のウィジェットキーの接尾辞
+    :param segments: 文字起こしのセグメント（全文表示で時刻を表示するために使用）
+    :param meeting_id: 検索インデックスに登録する会議のID（音声ファイルのハッシュ）
+    """
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("### 会議サマリー")
+        st.markdown(summary_text)
+        
+    with col2:
+        st.markdown("### 文字起こし結果")
+        st.markdown(transcription_text[:1000] + "..." if len(transcription_text) > 1000 else transcription_text)
+    
+    if len(transcription_text) > 1000 or segments:
+        with st.expander("全文を表示"):
+            render_transcript_viewer(transcription_text, segments, key=key)
+    
+    # Markdown・字幕はジェネレーターで組み立て、同じ結果の再実行では作り直さない
+    identity = (meeting_title, hash(summary_text), hash(transcription_text))
+    st.download_button(
+        label="Markdownファイルとしてダウンロード",
+        data=_download_data(f"markdown_{key}", identity,
+                            lambda: iter_minutes_markdown(meeting_title, summary_text, transcription_text)),
+        file_name=f"{meeting_title}_{datetime.now().strftime('%Y%m%d')}.md",
+        mime="text/markdown",
+        key=f"download_{key}",
+        on_click=record_meeting,
+        args=(meeting_id, meeting_title, summary_text, transcription_text, segments, file_date, filename),
+        kwargs={"source": {"markdown": datetime.now().isoformat(timespec="seconds")}}
+    )
+    
+    # セグメントがあれば時刻付きの字幕としてもダウンロードできるようにする
+    if segments:
+        for column, (label, extension, mime, render) in zip(st.columns(2), SUBTITLE_FORMATS):
+            with column:
+                st.download_button(
+                    label=label,
+                    data=_download_data(f"{extension}_{key}", identity, lambda render=render: render(segments)),
+                    file_name=f"{meeting_title}_{datetime.now().strftime('%Y%m%d')}.{extension}",
+                    mime=mime,
+                    key=f"download_{extension}_{key}",
+                )
+    
+    # Notionへの書き込みオプション
+    if notion_api_key and notion_database_id:
+        if st.button("Notionに議事録を保存", key=f"notion_{key}"):
+            with st.spinner("Notionに保存中..."):
+                result = write_to_notion(
+                    notion_api_key, 
+                    notion_database_id, 
+                    meeting_title, 
+                    transcription_text, 
+                    summary_text,
+                    filename,
+                    file_date,
+                    meeting_id=meeting_id,
+                    segments=segments
+                )
+                st.success(result)
+    else:
+        st.warning("Notionへの保存機能を使用するには、Streamlit Secretsに Notionの設定情報を入力してください。")
+
+STAGE_LABELS = {
+    "upload_write": "アップロードの書き出し",
+    "ffprobe": "音声の解析（ffprobe）",
+    "preprocess": "無音区間の除去・速度変更（ffmpeg）",
+    "ffmpeg_split": "音声の分割（ffmpeg）",
+    "whisper_api": "Whisper API呼び出し",
+    "whisper_local": "ローカル文字起こし",
+    "transcribe": "文字起こし全体",
+    "transcribe_retry": "失敗したチャンクの再試行",
+    "summary_call": "要約API呼び出し",
+    "summary": "要約（文字起こし完了後）",
+    "notion_write": "Notionへの書き込み",
+}
+
+COUNTER_LABELS = {
+    "bytes_uploaded": "送信バイト数",
+    "input_tokens": "入力トークン",
+    "cached_input_tokens": "うちキャッシュ済み入力トークン",
+    "output_tokens": "出力トークン",
+    "retries": "再試行",
+    "cache_hits": "キャッシュヒット",
+    "cache_misses": "キャッシュミス",
+    "audio_seconds": "元の音声（秒）",
+    "sent_audio_seconds": "送信した音声（秒）",
+}
+
+def render_telemetry(breakdown):
+    """
+    ジョブの段階ごとの所要時間とカウンター（telemetry.JobMetrics.snapshot() の結果）を折りたたみ表示します
+    """
+    if not breakdown:
+        return
+    with st.expander(f"処理時間の内訳（全体 {breakdown.get('wall_seconds', 0):.1f}秒）"):
+        rows = [
+            {
+                "段階": STAGE_LABELS.get(stage, stage),
+                "回数": entry["count"],
+                "合計（秒）": round(entry["seconds"], 2),
+                "最大（秒）": round(entry["max_seconds"], 2),
+            }
+            for stage, entry in breakdown.get("stages", {}).items()
+        ]
+        if rows:
+            st.table(rows)
+            st.caption("並列に実行される段階（チャンクの文字起こし・部分要約）は各呼び出しの所要時間の合計です。")
+        counters = breakdown.get("counters", {})
+        if counters.get("audio_seconds"):
+            st.caption(
+                f"送信した音声: {counters.get('sent_audio_seconds', 0) / 60:.1f}分 / 元の音声: {counters['audio_seconds'] / 60:.1f}分"
+                f"（{1 - counters.get('sent_audio_seconds', 0) / counters['audio_seconds']:.0%}削減）"
             )
+        if counters:
+            st.caption(" / ".join(f"{COUNTER_LABELS.get(name, name)}: {value:,}" for name, value in counters.items()))
+
+def render_job(job_id, notion_api_key, notion_database_id):
+    """
+    バックグラウンドジョブの状態を表示します。処理中の場合は一定間隔で再読み込みします。
+    完了したジョブの結果はセッションに保持し、操作による再実行ではファイルを読み込み直しません。
+    """
+    job = job_queue.get_job(job_id, with_result=False)
+    if job is None:
+        st.warning(f"ジョブが見つかりません: {job_id}")
+        return
+    
+    status = job["status"]
+    st.markdown(f"### ジョブ: {job['filename']}（{job_queue.STATUS_LABELS.get(status, status)}）")
+    st.caption(f"ジョブID: {job_id} / 試行回数: {job['attempts']}")
+    
+    if status in (job_queue.STATUS_QUEUED, job_queue.STATUS_RUNNING):
+        st.info(job["progress"] or "処理の開始を待っています...")
+        if job["error"]:
+            st.warning(f"前回の試行でエラーが発生したため再実行しています: {job['error']}")
+        # ワーカーが停止していれば起動し、状態をポーリングする
+        job_queue.ensure_workers()
+        time.sleep(job_queue.JOB_POLL_INTERVAL)
+        st.rerun()
+    elif status == job_queue.STATUS_FAILED:
+        st.error(f"処理中にエラーが発生しました: {job['error']}")
+        if st.button("再実行", key=f"retry_{job_id}"):
+            job_queue.retry_job(job_id)
+            job_queue.ensure_workers()
+            st.rerun()
+    else:
+        result = _session_job_result(job)
+        if result.get("notion_result"):
+            st.success(result["notion_result"])
+        if result.get("failed_chunks"):
+            st.warning(
+                f"{len(result['failed_chunks'])}個のチャンクの文字起こしに失敗したため、文字起こしに欠落があります"
+                f"（チャンク {_failed_chunk_labels(result['failed_chunks'])}）。"
+                "再試行すると失敗したチャンクだけを送信し、サマリーを作り直します。"
+            )
+            if st.button("失敗したチャンクを再試行", key=f"retry_chunks_{job_id}"):
+                job_queue.retry_failed_chunks(job_id)
+                job_queue.ensure_workers()
+                st.rerun()
+        render_results(
+            job["title"], result.get("transcription", ""), result.get("summary", ""),
+            job["filename"], job["file_date"], notion_api_key, notion_database_id, key=job_id,
+            segments=result["segments"], meeting_id=result.get("meeting_id")
+        )
+        render_telemetry(result.get("telemetry"))
+
+def _session_job_result(job):
+    """
+    完了したジョブの結果を返します。ジョブの更新時刻が同じ間はセッションに保持したものを使います。
+    """
+    cache_key = (job["id"], job["updated_at"])
+    cached = st.session_state.get("job_result")
+    if cached is None or cached[0] != cache_key:
+        result = job_queue.read_result(job["id"]) or {}
+        result["segments"] = segments_from_dicts(result.get("segments"))
+        cached = st.session_state["job_result"] = (cache_key, result)
+    return cached[1]
+
+def _retry_chunks_inline(checkpoint_id, api_key):
+    # ボタンのコールバックとして実行し、続く再実行でチェックポイントから結果を組み立てる
+    try:
+        retry_failed_chunks(checkpoint_id, api_key)
+    except Exception as e:
+        st.error(f"チャンクの再試行中にエラーが発生しました: {str(e)}")
+    # セッションに保持した結果を破棄し、続く再実行で処理し直す（キャッシュが無効でも再試行したチャンクを読み込む）
+    st.session_state.pop("inline_result", None)
+    st.session_state["resume_checkpoints"] = True
+
+def _retry_multi_inline():
+    # 複数ファイルは保持している音声で処理し直す（完了済みのチャンクはチェックポイントから読み込む）
+    st.session_state.pop("inline_result", None)
+    st.session_state["resume_checkpoints"] = True
+
+def _run_inline(uploads, meeting_title, filename, file_date, api_key, backend, trim_silence, multi=None):
+    """
+    文字起こしとサマリー生成を実行し、表示に必要な結果を辞書で返します（失敗した場合はNone）
+    :param multi: 複数ファイルの扱い（transcribe_multiple の mode, order, speakers の辞書。1ファイルならNone）
+    """
+    upload = uploads[0]
+    with st.spinner("文字起こし・サマリー生成中..."):
+        try:
+            # 文字起こしが完了したチャンクから順に表示し、並行して部分要約を進める
+            with st.expander("文字起こし（処理中）", expanded=True):
+                partial_placeholder = st.empty()
             
-            return f"Notionデータベースに新規ページとして議事録を作成しました。文字起こしテキストは{len(transcription_chunks)}個のブロックに分割されました。"
+            def show_partial_text(text):
+                partial_placeholder.text(text[-2000:])
             
-        except Exception as e:
-            return f"Notionデータベースのプロパティ取得中にエラーが発生しました: {str(e)}"
+            transcribe_stats = {}
+            with telemetry.job() as metrics:
+                metrics.add_time("upload_write", sum(u.ingest_seconds for u in uploads))
+                if multi is not None:
+                    transcription_text, segments, summary_text, summary_stats = run_multi_pipeline(
+                        uploads, api_key, backend=backend, stats=transcribe_stats, trim_silence=trim_silence,
+                        resume=st.session_state.pop("resume_checkpoints", None), **multi
+                    )
+                    meeting_id = multi_meeting_id(uploads, multi["mode"])
+                else:
+                    transcription_text, segments, summary_text, summary_stats = run_pipeline(
+                        upload, api_key, on_partial_text=show_partial_text, backend=backend, stats=transcribe_stats,
+                        trim_silence=trim_silence, resume=st.session_state.pop("resume_checkpoints", None)
+                    )
+                    meeting_id = upload.sha256()
+            partial_placeholder.empty()
             
-    except Exception as e:
-        return f"Notionへの書き込み中にエラーが発生しました: {str(e)}"
+            # 処理が完了した会議は検索インデックスに登録する
+            record_meeting(meeting_id, meeting_title, summary_text, transcription_text, segments,
+                           file_date, filename)
+        except Exception as e:
+            st.error(f"処理中にエラーが発生しました: {str(e)}")
+            return None
+    return {
+        "transcription": transcription_text,
+        "segments": segments,
+        "summary": summary_text,
+        "summary_stats": summary_stats,
+        "transcribe_stats": transcribe_stats,
+        "telemetry": metrics.snapshot(),
+        "meeting_id": meeting_id,
+    }
+
+def process_inline(uploads, meeting_title, filename, file_date, api_key, notion_api_key, notion_database_id,
+                   backend="openai", trim_silence=TRIM_SILENCE, multi=None):
+    """
+    Streamlitのスクリプト内で文字起こしとサマリー生成を行い、結果を表示します。
+    結果はセッションに保持し、ボタンなどの操作による再実行では処理し直さずに表示だけを行います。
+    :param uploads: アップロードファイルのリスト（2つ以上の場合は multi の設定で1つの会議として処理）
+    """
+    run_key = (tuple(u.sha256() for u in uploads), backend, bool(trim_silence),
+               json.dumps(multi, sort_keys=True, ensure_ascii=False))
+    result = st.session_state.get("inline_result")
+    if result is None or result["key"] != run_key:
+        result = _run_inline(uploads, meeting_title, filename, file_date, api_key, backend, trim_silence, multi)
+        if result is None:
+            return
+        result["key"] = run_key
+        st.session_state["inline_result"] = result
+    
+    transcribe_stats = result["transcribe_stats"]
+    if transcribe_stats.get("failed_chunks"):
+        if multi is not None:
+            st.button("失敗したチャンクを再試行", key="retry_chunks", on_click=_retry_multi_inline)
+        else:
+            # 再試行後の再実行では、チェックポイントから全チャンクを読み込んでサマリーを作り直す
+            st.button("失敗したチャンクを再試行", key="retry_chunks", on_click=_retry_chunks_inline,
+                      args=(transcribe_stats["checkpoint_id"], api_key))
+    
+    summary_stats = result["summary_stats"]
+    if not summary_stats.get("cached"):
+        st.caption(
+            f"サマリー: {summary_stats.get('windows', 1)}ウィンドウ、"
+            f"入力 {summary_stats.get('input_tokens', 0)}（うちキャッシュ {summary_stats.get('cached_input_tokens', 0)}）"
+            f" / 出力 {summary_stats.get('output_tokens', 0)} トークン、"
+            f"map {summary_stats.get('map_seconds', 0):.1f}秒 / reduce {summary_stats.get('reduce_seconds', 0):.1f}秒 / "
+            f"文字起こし完了後 {summary_stats.get('total_seconds', 0):.1f}秒"
+        )
+    
+    render_results(meeting_title, result["transcription"], result["summary"], filename, file_date,
+                   notion_api_key, notion_database_id, segments=result["segments"], meeting_id=result["meeting_id"])
+    render_telemetry(result["telemetry"])
+
+PAGE_CREATE = "議事録作成"
+PAGE_SEARCH = "議事録検索"
+
+SEARCH_KIND_LABELS = {
+    meeting_index.KIND_SEGMENT: "発言",
+    meeting_index.KIND_SUMMARY: "サマリー",
+    meeting_index.KIND_TITLE: "タイトル",
+}
+
+def _open_job(job_id):
+    # ウィジェットの状態はコールバック内でだけ変更できる
+    st.query_params["job"] = job_id
+    st.session_state["page"] = PAGE_CREATE
+
+def render_search_page():
+    """
+    処理済みの全会議から発言・サマリー・タイトルを検索する画面を表示します
+    """
+    st.markdown("### 議事録検索")
+    if not meeting_index.is_available():
+        st.error("このPython環境のSQLiteは全文検索（FTS5のtrigram）に対応していません（SQLite 3.34以降が必要です）。")
+        return
+    
+    counts = meeting_index.stats()
+    st.caption(f"{counts['meetings']}件の会議・{counts['segments']}件の発言を検索できます。"
+               "空白で区切った語をすべて含むものを検索します（2文字以下の語も索引で検索）。")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("検索語", key="search_query", placeholder="例: 予算 決定")
+    with col2:
+        kinds = st.multiselect("対象", list(SEARCH_KIND_LABELS), default=list(SEARCH_KIND_LABELS),
+                               format_func=SEARCH_KIND_LABELS.get, key="search_kinds")
+    if not query.strip():
+        return
+    
+    started = time.perf_counter()
+    results = meeting_index.search(query, kinds=kinds or None)
+    st.caption(f"{len(results)}件（{(time.perf_counter() - started) * 1000:.0f}ミリ秒）")
+    for i, result in enumerate(results):
+        at = f" `{_format_timestamp(result['start'])}`" if result["start"] is not None else ""
+        st.markdown(
+            f"**{result['title']}**（{result['meeting_date'] or '日付不明'}）{at} "
+            f"{SEARCH_KIND_LABELS.get(result['kind'], result['kind'])}\n\n{result['snippet']}"
+        )
+        sources = result["sources"]
+        if sources.get("notion"):
+            st.markdown(f"[Notionで開く]({sources['notion']})")
+        if sources.get("job"):
+            st.button("結果を開く", key=f"search_open_{i}", on_click=_open_job, args=(sources["job"],))
+        st.divider()
+
+def session_uploads(uploaded_files):
+    """
+    アップロードファイルをセッションごとに一度だけディスクに書き出して返します。
+    同じファイルのままの再実行（ボタン・チェックボックスなどの操作）では書き出し・ハッシュ計算・ffprobeを繰り返しません。
+    外されたファイルは作業ディレクトリを削除します。
+    :return: アップロードした順の IngestedUpload のリスト
+    """
+    held = st.session_state.get("ingested_uploads", {})
+    current = {}
+    for uploaded_file in uploaded_files:
+        file_id = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+        upload = held.get(file_id)
+        if upload is None or not os.path.exists(upload.path):
+            upload = ingest_upload(uploaded_file)
+        current[file_id] = upload
+    for file_id, upload in held.items():
+        if current.get(file_id) is not upload:
+            upload.cleanup()
+    if set(current) != set(held):
+        st.session_state.pop("inline_result", None)
+    st.session_state["ingested_uploads"] = current
+    return list(current.values())
+
+def discard_session_uploads():
+    """
+    セッションに保持したアップロードファイルと、その処理結果を破棄します
+    """
+    held = st.session_state.pop("ingested_uploads", None) or {}
+    st.session_state.pop("inline_result", None)
+    for upload in held.values():
+        upload.cleanup()
+
+def render_multi_options(uploads):
+    """
+    複数ファイルを1つの会議として処理する方法（並べ方・順序・トラックごとの話者）を選択する欄を表示します
+    :return: transcribe_multiple に渡す mode, order, speakers の辞書
+    """
+    mode = st.radio("複数ファイルの扱い", list(MULTI_MODES), format_func=MULTI_MODES.get, key="multi_mode")
+    order = st.radio("ファイルの順序", list(MULTI_ORDERS), format_func=MULTI_ORDERS.get, key="multi_order")
+    speakers = None
+    if mode == MULTI_MODE_TRACKS:
+        # トラックごとの話者の名前（発言の前に表示し、サマリーにも渡す）
+        speakers = [
+            st.text_input(f"話者（{upload.name}）", Path(upload.name).stem, key=f"speaker_{i}_{upload.name}").strip()
+            or Path(upload.name).stem
+            for i, upload in enumerate(uploads)
+        ]
+    return {"mode": mode, "order": order, "speakers": speakers}
+
+def render_run_timings(tools):
+    """
+    このプロセスでの起動・再実行の所要時間と、検出したツールを表示します
+    """
+    summary = telemetry.app_run_summary()
+    with st.expander("起動・再実行の所要時間"):
+        if summary["cold_start"] is not None:
+            st.caption(f"起動時の初回実行: {summary['cold_start']:.2f}秒（うちインポート {summary['import_seconds']:.2f}秒）")
+        if summary["reruns"]:
+            st.caption(
+                f"再実行: {summary['reruns']}回 / 直前 {summary['last_rerun'] * 1000:.0f}ms / "
+                f"平均 {summary['avg_rerun'] * 1000:.0f}ms / 最大 {summary['max_rerun'] * 1000:.0f}ms"
+            )
+        st.caption(" / ".join(
+            f"{name}: {'あり' if available else 'なし'}"
+            for name, available in (("FFmpeg", tools["ffmpeg"]), ("FFprobe", tools["ffprobe"]),
+                                    ("faster-whisper", tools["local_whisper"]))
+        ))
 
 def main():
     st.set_page_config(page_title="会議録作成アプリ", page_icon="📝", layout="wide")
     st.title("会議録作成アプリ")
     
+    # 設定とツールの有無はプロセスごとに一度だけ確認し、再実行ではキャッシュを使う
+    try:
+        config = load_app_config()
+    except Exception as e:
+        st.error(f"設定の読み込みエラー: {e}")
+        return
+    tools = detect_tools()
+    
     # パスワード認証を確認
-    if not check_password():
+    if not check_password(config["app"]["password"]):
         st.stop()  # 認証が通らなければここで処理を中断
     
+    # MINUTES_METRICS_PORT が設定されていれば /metrics を公開する（プロセスごとに一度だけ起動）
+    telemetry.start_metrics_server()
+    
     try:
-        config = load_config()
         api_key = config.get("openai", {}).get("api_key")
         notion_api_key = config.get("notion", {}).get("api_key")
         notion_database_id = config.get("notion", {}).get("database_id")
@@ -540,68 +2857,87 @@ def main():
     except Exception as e:
         st.error(f"設定の読み込みエラー: {e}")
         return
+    
+    # 最近のジョブ一覧（ページを再読み込みしてもジョブの結果を開ける）
+    with st.sidebar:
+        page = st.radio("画面", [PAGE_CREATE, PAGE_SEARCH], key="page", horizontal=True)
+        st.markdown("### 最近のジョブ")
+        for job in job_queue.list_jobs():
+            label = f"{job_queue.STATUS_LABELS.get(job['status'], job['status'])}: {job['filename']}"
+            st.button(label, key=f"open_{job['id']}", on_click=_open_job, args=(job["id"],))
+        
+        # API接続の再利用状況（このプロセス内の累計）
+        with st.expander("API接続統計"):
+            for service, stats in get_client_stats().items():
+                st.caption(
+                    f"{service}: {stats['requests']}リクエスト / 新規接続 {stats['new_connections']} / "
+                    f"再利用 {stats['reused_connections']} / 平均 {stats['avg_latency']:.2f}秒 / "
+                    f"最大 {stats['max_latency']:.2f}秒 / エラー {stats['errors']}"
+                )
+        
+        render_run_timings(tools)
 
-    uploaded_file = st.file_uploader("音声ファイルをドラッグ＆ドロップしてください (mp4, m4a, wav)", type=["mp4", "m4a", "wav"])
+    if page == PAGE_SEARCH:
+        render_search_page()
+        return
+    
+    # ジョブ登録後はアップローダーのキーを変えてファイルを外し、ポーリング中の再実行で書き出し直さないようにする
+    uploader_key = st.session_state.setdefault("uploader_key", 0)
+    # 複数ファイルは連続した録音または参加者ごとのトラックとして、並列に文字起こしして1つの会議にまとめる
+    uploaded_files = st.file_uploader("音声ファイルをドラッグ＆ドロップしてください (mp4, m4a, wav。複数可)",
+                                      type=["mp4", "m4a", "wav"], accept_multiple_files=True,
+                                      key=f"uploader_{uploader_key}")
     meeting_title = st.text_input("会議タイトル", "議事録")
+    # faster-whisper がインストールされている場合はローカルの文字起こしを選択できる
+    backend = "openai"
+    if tools["local_whisper"]:
+        backend = st.selectbox("文字起こしエンジン", list(TRANSCRIPTION_BACKENDS),
+                               format_func=TRANSCRIPTION_BACKENDS.get)
+    trim_silence = st.checkbox("長い無音区間を除去して送信する（送信する音声を短縮。時刻は元の録音の時刻で表示）",
+                               value=TRIM_SILENCE)
+    background = st.checkbox("バックグラウンドで処理する（ページを再読み込み・終了しても処理を継続）", value=True)
+    save_to_notion = bool(notion_configured) and background and st.checkbox("処理完了後にNotionへ自動保存する", value=False)
     
-    if uploaded_file is not None:
-        st.info("ファイルをアップロードしました。文字起こしを開始します...")
-        
-        # ファイルのメタデータを取得
-        filename, file_date = get_file_metadata(uploaded_file)
+    if not uploaded_files:
+        # ファイルが外されたら、書き出したファイルと処理結果を削除する
+        discard_session_uploads()
+    else:
+        # アップロードファイルはセッションごとに一度だけディスクに書き出し、再実行では同じファイルを使う
+        uploads = session_uploads(uploaded_files)
+        # ファイルのメタデータを取得（ffprobeの結果はファイルごとに一度だけ取得）。会議の日付は最初のファイルから取る
+        filename, file_date = get_file_metadata(uploads[0])
+        multi = None
+        if len(uploads) > 1:
+            filename = f"{filename} 他{len(uploads) - 1}件"
+            multi = render_multi_options(uploads)
         st.info(f"ファイル名: {filename}, 会議日付: {file_date}")
         
-        with st.spinner("文字起こし中..."):
-            try:
-                # 直接Whisper APIを使用して文字起こし
-                transcription_text, segments = transcribe_audio(uploaded_file, api_key=api_key)
-                
-                # サマリー生成
-                with st.spinner("会議内容のサマリーを生成中..."):
-                    summary_text = generate_summary(transcription_text, api_key=api_key)
-                
-                # 結果の表示
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("### 会議サマリー")
-                    st.markdown(summary_text)
-                    
-                with col2:
-                    st.markdown("### 文字起こし結果")
-                    st.markdown(transcription_text[:1000] + "..." if len(transcription_text) > 1000 else transcription_text)
-                    if len(transcription_text) > 1000:
-                        with st.expander("全文を表示"):
-                            st.markdown(transcription_text)
-                
-                # Markdownテキストをダウンロードできるボタン
-                full_markdown = f"# {meeting_title}\n\n## 会議サマリー\n\n{summary_text}\n\n## 文字起こし全文\n\n{transcription_text}"
-                st.download_button(
-                    label="Markdownファイルとしてダウンロード",
-                    data=full_markdown,
-                    file_name=f"{meeting_title}_{datetime.now().strftime('%Y%m%d')}.md",
-                    mime="text/markdown"
-                )
-                
-                # Notionへの書き込みオプション
-                if notion_configured:
-                    if st.button("Notionに議事録を保存"):
-                        with st.spinner("Notionに保存中..."):
-                            result = write_to_notion(
-                                notion_api_key, 
-                                notion_database_id, 
-                                meeting_title, 
-                                transcription_text, 
-                                summary_text,
-                                filename,
-                                file_date
-                            )
-                            st.success(result)
-                else:
-                    st.warning("Notionへの保存機能を使用するには、Streamlit Secretsに Notionの設定情報を入力してください。")
-                    
-            except Exception as e:
-                st.error(f"処理中にエラーが発生しました: {str(e)}")
+        if background:
+            if st.button("処理を開始"):
+                # 音声ファイルはジョブ用ディレクトリに移動し、ワーカーが処理する
+                job_id = job_queue.submit_job(uploads[0].path, filename, meeting_title, file_date, save_to_notion,
+                                              backend=backend, upload_seconds=sum(u.ingest_seconds for u in uploads),
+                                              trim_silence=trim_silence,
+                                              extra_files=[(u.path, u.name) for u in uploads[1:]], multi=multi)
+                job_queue.ensure_workers()
+                discard_session_uploads()
+                st.query_params["job"] = job_id
+                st.session_state["uploader_key"] = uploader_key + 1
+                st.rerun()
+        else:
+            st.info("ファイルをアップロードしました。文字起こしを開始します...")
+            process_inline(uploads, meeting_title, filename, file_date,
+                           api_key, notion_api_key, notion_database_id, backend=backend,
+                           trim_silence=trim_silence, multi=multi)
+    
+    # 選択中のジョブ（URLのクエリパラメータに保持）の状態と結果を表示
+    job_id = st.query_params.get("job")
+    if job_id:
+        render_job(job_id, notion_api_key, notion_database_id)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # 起動（プロセスで最初の実行）と操作ごとの再実行の所要時間を記録する
+        telemetry.record_app_run(time.perf_counter() - _RUN_STARTED, _IMPORT_SECONDS)
@@ -0,0 +1,368 @@
+"""
+ベンチマーク用のOpenAI・Notion APIの代替サーバー（ローカルで動作するHTTPサーバー）。
+
+Whisper（/v1/audio/transcriptions）、チャット補完（/v1/chat/completions）、
+Notion（データベース取得・ページ作成・子ブロックの追加と取得）のエンドポイントを模倣し、
+レイテンシ・レート制限（429とRetry-After）・エラー（500）を設定に応じて発生させます。
+チャット補完はプロンプトの先頭部分が以前のリクエストと一致する場合、キャッシュ済みの入力トークン数を返します。
+アプリ側は OPENAI_BASE_URL と NOTION_BASE_URL をこのサーバーに向けて使用します。
+
+単独で起動する場合:
+    python mock_api_server.py --port 8765 --whisper-latency 1.0 --rate-limit 5 --error-rate 0.02
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NOTION_MAX_CHILDREN = 100
+WHISPER_BYTES_PER_SEGMENT = 40000  # 1セグメントとみなす音声のバイト数（32kbpsで約10秒）
+WHISPER_SEGMENT_SECONDS = 10.0
+PROMPT_CACHE_BLOCK = 128  # プロンプトキャッシュが一致を判定する単位（トークン）
+PROMPT_CACHE_MIN_TOKENS = 1024  # プロンプトキャッシュが適用される最小のトークン数
+
+# response_format で JSON スキーマを指定された場合の応答
+STRUCTURED_SUMMARY = {
+    "agenda": ["ベンチマーク"],
+    "key_points": [],
+    "decisions": ["なし"],
+    "action_items": [{"task": "結果を確認する", "owner": None, "due": None}],
+    "follow_ups": [],
+}
+
+class MockConfig:
+    """
+    代替サーバーの応答時間・レート制限・エラー発生率の設定
+    """
+    def __init__(self, whisper_latency=0.5, whisper_seconds_per_mb=0.5, chat_latency=0.5,
+                 chat_seconds_per_1k_tokens=0.2, notion_latency=0.2, rate_limit=0, error_rate=0.0, seed=None):
+        self.whisper_latency = whisper_latency
+        self.whisper_seconds_per_mb = whisper_seconds_per_mb
+        self.chat_latency = chat_latency
+        self.chat_seconds_per_1k_tokens = chat_seconds_per_1k_tokens
+        self.notion_latency = notion_latency
+        self.rate_limit = rate_limit  # サービスごとの1秒あたりのリクエスト数の上限（0で無制限）
+        self.error_rate = error_rate  # 500エラーを返す確率
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+class MockState:
+    """
+    リクエスト数の集計、レート制限の状態、作成されたNotionのブロック
+    """
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.rate_limited = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self._windows = {}
+        self.blocks = {}
+        self._prompt_prefixes = set()
+        self.cached_tokens = 0
+
+    def count(self, endpoint, size):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes_received += size
+
+    def check_rate_limit(self, service):
+        """
+        直近1秒のリクエスト数が上限に達していれば True（429を返す）
+        """
+        if not self.config.rate_limit:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            window = self._windows.setdefault(service, deque())
+            while window and now - window[0] > 1.0:
+                window.popleft()
+            if len(window) >= self.config.rate_limit:
+                self.rate_limited += 1
+                return True
+            window.append(now)
+            return False
+
+    def inject_error(self):
+        with self.lock:
+            if self.config.error_rate and self.random.random() < self.config.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+    def cached_prefix_tokens(self, prompt):
+        """
+        OpenAIのプロンプトキャッシュを模して、以前のリクエストと一致する先頭部分のトークン数を返します
+        （PROMPT_CACHE_BLOCK トークン単位、PROMPT_CACHE_MIN_TOKENS 未満はキャッシュされない）
+        """
+        block_chars = PROMPT_CACHE_BLOCK * 2
+        prefixes = [hashlib.sha256(prompt[:end].encode("utf-8")).digest()
+                    for end in range(block_chars, len(prompt) + 1, block_chars)]
+        with self.lock:
+            matched = 0
+            for i, prefix in enumerate(prefixes):
+                if prefix not in self._prompt_prefixes:
+                    break
+                matched = i + 1
+            self._prompt_prefixes.update(prefixes)
+            cached = matched * PROMPT_CACHE_BLOCK
+            cached = cached if cached >= PROMPT_CACHE_MIN_TOKENS else 0
+            self.cached_tokens += cached
+            return cached
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "total_requests": sum(self.requests.values()),
+                "rate_limited": self.rate_limited,
+                "errors": self.errors,
+                "bytes_received": self.bytes_received,
+                "cached_tokens": self.cached_tokens,
+                "notion_blocks": sum(len(children) for children in self.blocks.values()),
+            }
+
+def _approx_tokens(text):
+    # 日本語は概ね1文字1トークン前後のため、文字数の半分程度で近似する
+    return max(1, len(text) // 2)
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # キープアライブ接続の再利用を計測できるようにする
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reject(self, service):
+        """
+        レート制限・エラー注入の対象なら応答して True を返します
+        """
+        if self.state.check_rate_limit(service):
+            if service == "notion":
+                payload = {"object": "error", "status": 429, "code": "rate_limited", "message": "Rate limited"}
+            else:
+                payload = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            self._send_json(429, payload, {"Retry-After": "1"})
+            return True
+        if self.state.inject_error():
+            if service == "notion":
+                payload = {"object": "error", "status": 500, "code": "internal_server_error", "message": "Injected error"}
+            else:
+                payload = {"error": {"message": "Injected error", "type": "server_error", "code": None}}
+            self._send_json(500, payload)
+            return True
+        return False
+
+    def do_GET(self):
+        body = self._read_body()
+        self.state.count(f"GET {self._endpoint()}", len(body))
+        if self.path == "/_stats":
+            self._send_json(200, self.state.snapshot())
+            return
+        if self._reject("notion"):
+            return
+        time.sleep(self.state.config.notion_latency)
+        match = re.match(r"^/v1/databases/([^/?]+)", self.path)
+        if match:
+            self._send_json(200, {
+                "object": "database",
+                "id": match.group(1),
+                "properties": {
+                    "名前": {"id": "title", "type": "title", "title": {}},
+                    "日付": {"id": "date", "type": "date", "date": {}},
+                },
+            })
+            return
+        match = re.match(r"^/v1/blocks/([^/?]+)/children", self.path)
+        if match:
+            with self.state.lock:
+                children = list(self.state.blocks.get(match.group(1), []))
+            self._send_json(200, {"object": "list", "results": children[:NOTION_MAX_CHILDREN], "has_more": False})
+            return
+        self._send_json(404, {"object": "error", "status": 404, "code": "object_not_found", "message": self.path})
+
+    def do_POST(self):
+        body = self._read_body()
+        endpoint = self._endpoint()
+        self.state.count(f"POST {endpoint}", len(body))
+        if endpoint == "/v1/audio/transcriptions":
+            self._transcription(body)
+        elif endpoint == "/v1/chat/completions":
+            self._chat_completion(body)
+        elif endpoint == "/v1/pages":
+            self._create_page(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint: {endpoint}"}})
+
+    def do_PATCH(self):
+        body = self._read_body()
+        self.state.count(f"PATCH {self._endpoint()}", len(body))
+        match = re.match(r"^/v1/blocks/([^/?]+)/children", self.path)
+        if not match:
+            self._send_json(404, {"object": "error", "status": 404, "code": "object_not_found", "message": self.path})
+            return
+        if self._reject("notion"):
+            return
+        children = json.loads(body or b"{}").get("children", [])
+        if len(children) > NOTION_MAX_CHILDREN:
+            self._send_json(400, {"object": "error", "status": 400, "code": "validation_error",
+                                  "message": f"body.children.length should be ≤ {NOTION_MAX_CHILDREN}"})
+            return
+        time.sleep(self.state.config.notion_latency)
+        self._send_json(200, {"object": "list", "results": self._store_children(match.group(1), children)})
+
+    def _endpoint(self):
+        path = self.path.split("?")[0]
+        # IDを含むパスは種類ごとにまとめて集計する
+        return re.sub(r"/(databases|blocks|pages)/[^/]+", r"/\1/{id}", path)
+
+    def _transcription(self, body):
+        if self._reject("openai"):
+            return
+        config = self.state.config
+        time.sleep(config.whisper_latency + config.whisper_seconds_per_mb * len(body) / (1024 * 1024))
+        count = max(1, len(body) // WHISPER_BYTES_PER_SEGMENT)
+        segments = [
+            {
+                "id": i,
+                "seek": 0,
+                "start": i * WHISPER_SEGMENT_SECONDS,
+                "end": (i + 1) * WHISPER_SEGMENT_SECONDS,
+                "text": f"これはベンチマーク用の文字起こしです。セグメント{i + 1}の発言内容をここに記録します。",
+                "tokens": [],
+                "temperature": 0.0,
+                "avg_logprob": -0.2,
+                "compression_ratio": 1.0,
+                "no_speech_prob": 0.01,
+            }
+            for i in range(count)
+        ]
+        self._send_json(200, {
+            "task": "transcribe",
+            "language": "japanese",
+            "duration": count * WHISPER_SEGMENT_SECONDS,
+            "text": "".join(seg["text"] for seg in segments),
+            "segments": segments,
+        })
+
+    def _chat_completion(self, body):
+        if self._reject("openai"):
+            return
+        request = json.loads(body or b"{}")
+        prompt = "".join(m.get("content") or "" for m in request.get("messages", []))
+        prompt_tokens = _approx_tokens(prompt)
+        cached_tokens = self.state.cached_prefix_tokens(prompt)
+        if (request.get("response_format") or {}).get("type") == "json_schema":
+            content = json.dumps(STRUCTURED_SUMMARY, ensure_ascii=False)
+        else:
+            content = "## 会議の主な議題\n- ベンチマーク\n\n## 決定事項\n- なし\n\n## アクションアイテム\n- なし\n"
+        completion_tokens = _approx_tokens(content) + min(1000, prompt_tokens // 20)
+        config = self.state.config
+        time.sleep(config.chat_latency + config.chat_seconds_per_1k_tokens * (prompt_tokens + completion_tokens) / 1000)
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        })
+
+    def _create_page(self, body):
+        if self._reject("notion"):
+            return
+        request = json.loads(body or b"{}")
+        children = request.get("children", [])
+        if len(children) > NOTION_MAX_CHILDREN:
+            self._send_json(400, {"object": "error", "status": 400, "code": "validation_error",
+                                  "message": f"body.children.length should be ≤ {NOTION_MAX_CHILDREN}"})
+            return
+        time.sleep(self.state.config.notion_latency)
+        page_id = str(uuid.uuid4())
+        self._store_children(page_id, children)
+        self._send_json(200, {"object": "page", "id": page_id, "properties": request.get("properties", {})})
+
+    def _store_children(self, parent_id, children):
+        created = [{**child, "object": "block", "id": str(uuid.uuid4())} for child in children]
+        with self.state.lock:
+            self.state.blocks.setdefault(parent_id, []).extend(created)
+        return created
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """
+    代替サーバーをバックグラウンドのスレッドで起動します
+    :param port: 待ち受けるポート（0なら空いているポートを使用）
+    :return: (サーバー, MockState)。URLは f"http://{host}:{server.server_address[1]}"
+    """
+    state = MockState(config or MockConfig())
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-api-server", daemon=True).start()
+    return server, state
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用のOpenAI・Notion API代替サーバーを起動します")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--whisper-latency", type=float, default=0.5, help="Whisperの基本応答時間（秒）")
+    parser.add_argument("--whisper-seconds-per-mb", type=float, default=0.5, help="音声1MBあたりの追加応答時間（秒）")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="チャット補完の基本応答時間（秒）")
+    parser.add_argument("--notion-latency", type=float, default=0.2, help="Notion APIの応答時間（秒）")
+    parser.add_argument("--rate-limit", type=int, default=0, help="サービスごとの1秒あたりのリクエスト数の上限（0で無制限）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500エラーを返す確率")
+    parser.add_argument("--seed", type=int, help="エラー注入の乱数シード")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        whisper_latency=args.whisper_latency,
+        whisper_seconds_per_mb=args.whisper_seconds_per_mb,
+        chat_latency=args.chat_latency,
+        notion_latency=args.notion_latency,
+        rate_limit=args.rate_limit,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    server, _ = start_server(config, port=args.port)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"OPENAI_BASE_URL={url}/v1")
+    print(f"NOTION_BASE_URL={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+文字起こしのセグメントを列ごとに保持するコンテナ。
+
+APIのレスポンスのセグメント（1件ごとのオブジェクト）の代わりに、開始・終了時刻を float の配列で、
+テキストを1つの文字列とその区切り位置の配列で保持します。数時間の会議で数千件のセグメントがあっても
+オブジェクトを保持せず、時刻のずらし・結合・保存（JSON・バイナリ）を配列単位で行えます。
+要素を取り出すと start / end / text / speaker 属性を持つ Segment を返すため、セグメントのリストと同じように扱えます。
+話者（参加者ごとのトラックの名前など）は、ラベルの一覧とセグメントごとのラベル番号の配列で保持します。
+
+字幕（SRT・WebVTT）はジェネレーターで少しずつ出力します。
+"""
+import json
+import struct
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np  # 任意: 時刻の一括変換に使用（Streamlitの依存パッケージとして通常はインストール済み）
+except ImportError:
+    np = None
+
+Segment = namedtuple("Segment", ["start", "end", "text", "speaker"], defaults=(None,))
+
+_BINARY_MAGIC = b"MSEG"
+_BINARY_VERSION = 1  # 話者なし
+_BINARY_VERSION_SPEAKERS = 2  # 末尾に話者のラベル（JSON）とラベル番号の配列を追加
+_HEADER = struct.Struct("<4sHIQ")  # マジック、バージョン、セグメント数、テキストのバイト数
+_SPEAKER_HEADER = struct.Struct("<Q")  # 話者のラベル（JSON）のバイト数
+_NO_SPEAKER = -1
+
+def _segment_fields(seg):
+    if isinstance(seg, dict):
+        return seg.get("start", 0), seg.get("end", 0), seg.get("text", ""), seg.get("speaker")
+    return getattr(seg, "start", 0), getattr(seg, "end", 0), getattr(seg, "text", ""), getattr(seg, "speaker", None)
+
+class SegmentStore:
+    """
+    セグメントの開始時刻・終了時刻・テキスト・話者を列ごとに保持します。
+    テキストは追加された順に連結して保持し、各セグメントのテキストは区切り位置（offsets）から切り出します。
+    話者は、話者のあるセグメントが追加されたときに初めてラベル番号の配列（speaker_ids）を作成します。
+    """
+    def __init__(self):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.offsets = array("q", [0])
+        self.speaker_ids = None
+        self.speaker_labels = []
+        self._text = ""
+        self._pending = []
+
+    @classmethod
+    def from_segments(cls, segments):
+        """
+        start / end / text（と任意の speaker）を持つオブジェクトまたは辞書のリストから作成します
+        """
+        store = cls()
+        for seg in segments or []:
+            store.append(*_segment_fields(seg))
+        return store
+
+    @classmethod
+    def from_value(cls, value):
+        """
+        保存された形式（to_dict の辞書、セグメントの辞書のリスト、SegmentStore）から作成します
+        """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict):
+            return cls.from_dict(value)
+        return cls.from_segments(value)
+
+    @classmethod
+    def merge(cls, stores):
+        """
+        複数の SegmentStore を1つのタイムラインに結合します（開始時刻の順。同じ時刻は渡した順）
+        """
+        merged = cls()
+        for store in stores:
+            merged.extend(store)
+        starts = merged.starts
+        if all(starts[i] <= starts[i + 1] for i in range(len(starts) - 1)):
+            return merged
+        if np is not None:
+            order = np.argsort(np.frombuffer(starts, dtype=np.float64), kind="stable").tolist()
+        else:
+            order = sorted(range(len(starts)), key=starts.__getitem__)
+        return merged.select(order)
+
+    def _speaker_id(self, speaker):
+        if speaker is None:
+            return _NO_SPEAKER
+        self._speaker_id_column()
+        try:
+            return self.speaker_labels.index(speaker)
+        except ValueError:
+            self.speaker_labels.append(speaker)
+            return len(self.speaker_labels) - 1
+
+    def _speaker_id_column(self):
+        if self.speaker_ids is None:
+            self.speaker_ids = array("i", [_NO_SPEAKER]) * len(self.starts)
+        return self.speaker_ids
+
+    def append(self, start, end, text, speaker=None):
+        text = text or ""
+        speaker_id = self._speaker_id(speaker)
+        self.starts.append(float(start or 0))
+        self.ends.append(float(end or 0))
+        if self.speaker_ids is not None:
+            self.speaker_ids.append(speaker_id)
+        self._pending.append(text)
+        self.offsets.append(self.offsets[-1] + len(text))
+
+    def extend(self, other):
+        """
+        別の SegmentStore のセグメントを末尾に追加します
+        """
+        if not len(other):
+            return
+        if other.speaker_ids is not None:
+            # 追加するセグメントの話者のラベル番号を、こちらのラベルの番号に付け替える
+            mapping = [self._speaker_id(label) for label in other.speaker_labels]
+            self._speaker_id_column().extend(
+                array("i", (mapping[i] if i != _NO_SPEAKER else _NO_SPEAKER for i in other.speaker_ids))
+            )
+        elif self.speaker_ids is not None:
+            self.speaker_ids.extend(array("i", [_NO_SPEAKER]) * len(other))
+        base = self.offsets[-1]
+        self.starts.extend(other.starts)
+        self.ends.extend(other.ends)
+        self.offsets.extend(array("q", (offset + base for offset in other.offsets[1:])))
+        self._pending.append(other.text_buffer())
+
+    def set_speaker(self, speaker):
+        """
+        すべてのセグメントの話者を speaker にします（その場で変更。Noneなら話者なし）
+        """
+        self.speaker_ids = None
+        self.speaker_labels = []
+        if speaker is not None:
+            self.speaker_labels = [speaker]
+            self.speaker_ids = array("i", [0]) * len(self.starts)
+        return self
+
+    def truncate(self, count):
+        """
+        先頭の count 件だけを残します（その場で変更）
+        """
+        if count >= len(self):
+            return self
+        buffer = self.text_buffer()
+        self._text = buffer[:self.offsets[count]]
+        del self.starts[count:]
+        del self.ends[count:]
+        del self.offsets[count + 1:]
+        if self.speaker_ids is not None:
+            del self.speaker_ids[count:]
+        return self
+
+    def text_buffer(self):
+        """
+        全セグメントのテキストを連結した文字列（区切り位置は offsets）
+        """
+        if self._pending:
+            self._text = "".join([self._text, *self._pending])
+            self._pending = []
+        return self._text
+
+    def text(self, index):
+        return self.text_buffer()[self.offsets[index]:self.offsets[index + 1]]
+
+    def speaker(self, index):
+        if self.speaker_ids is None or self.speaker_ids[index] == _NO_SPEAKER:
+            return None
+        return self.speaker_labels[self.speaker_ids[index]]
+
+    def has_speakers(self):
+        return self.speaker_ids is not None and any(i != _NO_SPEAKER for i in self.speaker_ids)
+
+    def joined_text(self, separator="\n"):
+        """
+        各セグメントのテキストの前後の空白を除き、separator で区切って連結した文字列（空のセグメントは除く）
+        """
+        buffer = self.text_buffer()
+        offsets = self.offsets
+        texts = (buffer[offsets[i]:offsets[i + 1]].strip() for i in range(len(self.starts)))
+        return separator.join(text for text in texts if text)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __bool__(self):
+        return len(self.starts) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.select(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return Segment(self.starts[index], self.ends[index], self.text(index), self.speaker(index))
+
+    def __iter__(self):
+        buffer = self.text_buffer()
+        offsets = self.offsets
+        if self.speaker_ids is None:
+            for i, (start, end) in enumerate(zip(self.starts, self.ends)):
+                yield Segment(start, end, buffer[offsets[i]:offsets[i + 1]])
+            return
+        labels = self.speaker_labels + [None]  # ラベル番号 -1（話者なし）は末尾の None を参照する
+        for i, (start, end, speaker_id) in enumerate(zip(self.starts, self.ends, self.speaker_ids)):
+            yield Segment(start, end, buffer[offsets[i]:offsets[i + 1]], labels[speaker_id])
+
+    def select(self, indices):
+        """
+        指定した番号のセグメントだけを持つ SegmentStore を返します
+        """
+        store = SegmentStore()
+        buffer = self.text_buffer()
+        parts = []
+        for i in indices:
+            store.starts.append(self.starts[i])
+            store.ends.append(self.ends[i])
+            text = buffer[self.offsets[i]:self.offsets[i + 1]]
+            parts.append(text)
+            store.offsets.append(store.offsets[-1] + len(text))
+        store._text = "".join(parts)
+        if self.speaker_ids is not None:
+            store.speaker_labels = list(self.speaker_labels)
+            store.speaker_ids = array("i", (self.speaker_ids[i] for i in indices))
+        return store
+
+    def shift(self, offset):
+        """
+        すべてのセグメントの時刻を offset 秒ずらします（その場で変更）
+        """
+        if not offset or not len(self):
+            return self
+        if np is not None:
+            np.frombuffer(self.starts, dtype=np.float64)[:] += offset
+            np.frombuffer(self.ends, dtype=np.float64)[:] += offset
+        else:
+            self.starts = array("d", (t + offset for t in self.starts))
+            self.ends = array("d", (t + offset for t in self.ends))
+        return self
+
+    def map_times(self, start_fn, end_fn=None):
+        """
+        開始時刻と終了時刻をそれぞれ関数で変換します（その場で変更）
+        """
+        end_fn = end_fn or start_fn
+        self.starts = array("d", (start_fn(t) for t in self.starts))
+        self.ends = array("d", (end_fn(t) for t in self.ends))
+        return self
+
+    def to_dict(self):
+        """
+        JSONで保存できる列ごとの辞書に変換します
+        """
+        data = {
+            "start": self.starts.tolist(),
+            "end": self.ends.tolist(),
+            "offsets": self.offsets.tolist(),
+            "text": self.text_buffer(),
+        }
+        if self.speaker_ids is not None:
+            data["speakers"] = list(self.speaker_labels)
+            data["speaker_ids"] = self.speaker_ids.tolist()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        store = cls()
+        store.starts = array("d", data.get("start", []))
+        store.ends = array("d", data.get("end", []))
+        store.offsets = array("q", data.get("offsets") or [0])
+        store._text = data.get("text", "")
+        if data.get("speaker_ids") is not None:
+            store.speaker_labels = list(data.get("speakers", []))
+            store.speaker_ids = array("i", data["speaker_ids"])
+        return store
+
+    def to_bytes(self):
+        """
+        バイナリ形式に変換します（ヘッダー、開始・終了時刻、テキストの区切り位置、UTF-8のテキスト、話者）
+        """
+        text = self.text_buffer().encode("utf-8")
+        version = _BINARY_VERSION if self.speaker_ids is None else _BINARY_VERSION_SPEAKERS
+        parts = [
+            _HEADER.pack(_BINARY_MAGIC, version, len(self), len(text)),
+            self.starts.tobytes(),
+            self.ends.tobytes(),
+            self.offsets.tobytes(),
+            text,
+        ]
+        if self.speaker_ids is not None:
+            labels = json.dumps(self.speaker_labels, ensure_ascii=False).encode("utf-8")
+            parts += [_SPEAKER_HEADER.pack(len(labels)), labels, self.speaker_ids.tobytes()]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, count, text_length = _HEADER.unpack_from(data, 0)
+        if magic != _BINARY_MAGIC or version not in (_BINARY_VERSION, _BINARY_VERSION_SPEAKERS):
+            raise ValueError("セグメントのバイナリ形式が正しくありません。")
+        store = cls()
+        position = _HEADER.size
+        store.starts = array("d")
+        store.starts.frombytes(data[position:position + 8 * count])
+        position += 8 * count
+        store.ends = array("d")
+        store.ends.frombytes(data[position:position + 8 * count])
+        position += 8 * count
+        store.offsets = array("q")
+        store.offsets.frombytes(data[position:position + 8 * (count + 1)])
+        position += 8 * (count + 1)
+        store._text = bytes(data[position:position + text_length]).decode("utf-8")
+        position += text_length
+        if version == _BINARY_VERSION_SPEAKERS:
+            (labels_length,) = _SPEAKER_HEADER.unpack_from(data, position)
+            position += _SPEAKER_HEADER.size
+            store.speaker_labels = json.loads(bytes(data[position:position + labels_length]).decode("utf-8"))
+            position += labels_length
+            store.speaker_ids = array("i")
+            store.speaker_ids.frombytes(data[position:position + store.speaker_ids.itemsize * count])
+        return store
+
+def _format_subtitle_time(seconds, separator):
+    milliseconds = int(round(max(0.0, seconds) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{milliseconds:03d}"
+
+def iter_srt(segments):
+    """
+    セグメントをSRT形式の字幕として少しずつ返すジェネレーター（話者があれば「話者: 」を付ける）
+    """
+    number = 0
+    for seg in segments:
+        text = seg.text.strip()
+        if not text:
+            continue
+        number += 1
+        speaker = getattr(seg, "speaker", None)
+        if speaker:
+            text = f"{speaker}: {text}"
+        yield (f"{number}\n{_format_subtitle_time(seg.start, ',')} --> {_format_subtitle_time(seg.end, ',')}\n"
+               f"{text}\n\n")
+
+def iter_vtt(segments):
+    """
+    セグメントをWebVTT形式の字幕として少しずつ返すジェネレーター（話者があれば声タグ <v 話者> を付ける）
+    """
+    yield "WEBVTT\n\n"
+    for seg in segments:
+        text = seg.text.strip()
+        if not text:
+            continue
+        # "-->" は字幕の本文に含められないため置き換える
+        text = text.replace("-->", "→")
+        speaker = getattr(seg, "speaker", None)
+        if speaker:
+            text = f"<v {speaker.replace('>', '')}>{text}"
+        yield (f"{_format_subtitle_time(seg.start, '.')} --> {_format_subtitle_time(seg.end, '.')}\n"
+               f"{text}\n\n")
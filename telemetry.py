@@ -0,0 +1,334 @@
+"""
+処理パイプラインの計測（段階ごとの所要時間・送信バイト数・トークン数・再試行・キャッシュヒット）。
+
+計測値はプロセス全体の集計と、実行中のジョブごとの内訳の両方に記録します。
+- プロセス全体の集計は MINUTES_METRICS_PORT を指定すると /metrics でPrometheusのテキスト形式で公開します
+- ジョブごとの内訳は contextvars で現在のジョブに紐づけます。スレッドプールで実行する処理には bind() で引き継ぎます
+- MINUTES_METRICS_LOG を指定すると、計測イベントを1行1件のJSONとしてファイルに追記します
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get("MINUTES_METRICS_PORT", "0"))  # /metrics を公開するポート（0で無効）
+METRICS_LOG = os.environ.get("MINUTES_METRICS_LOG", "")  # 計測イベントを追記するJSONLファイル（空なら出力しない）
+HISTOGRAM_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)  # 所要時間のヒストグラムの区切り（秒）
+
+METRIC_HELP = {
+    "minutes_stage_seconds": ("histogram", "処理段階ごとの所要時間（秒）"),
+    "minutes_bytes_uploaded_total": ("counter", "APIに送信した音声のバイト数"),
+    "minutes_tokens_total": ("counter", "要約で使用したトークン数"),
+    "minutes_audio_seconds_total": ("counter", "文字起こしした音声の長さ（秒）。original は元の録音、sent は前処理後に送信した音声"),
+    "minutes_retries_total": ("counter", "API呼び出しの再試行回数"),
+    "minutes_cache_requests_total": ("counter", "キャッシュの参照回数"),
+    "minutes_jobs_total": ("counter", "処理したジョブ数"),
+    "minutes_app_run_seconds": ("histogram", "Streamlitのスクリプト実行1回の所要時間（秒）。cold_start はプロセスで最初の実行、rerun は操作による再実行"),
+}
+
+logger = logging.getLogger("minutes.telemetry")
+if METRICS_LOG:
+    _handler = logging.FileHandler(os.path.expanduser(METRICS_LOG), encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+class _Registry:
+    """
+    プロセス全体のカウンターとヒストグラム
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(HISTOGRAM_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self):
+        """
+        Prometheusのテキスト形式（exposition format 0.0.4）で出力します
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {**h, "buckets": list(h["buckets"])} for key, h in self._histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text) in METRIC_HELP.items():
+            if metric_type == "histogram":
+                series = sorted((k, v) for k, v in histograms.items() if k[0] == name)
+            else:
+                series = sorted((k, v) for k, v in counters.items() if k[0] == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (_, labels), value in series:
+                if metric_type == "histogram":
+                    for bound, count in zip(HISTOGRAM_BUCKETS, value["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+_registry = _Registry()
+
+class JobMetrics:
+    """
+    1つのジョブの段階ごとの所要時間とカウンターの内訳。
+    チャンクの文字起こしなど並列に実行される段階は、所要時間を合計して記録します（ジョブ全体の経過時間は wall_seconds）。
+    """
+    def __init__(self, job_id=None):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._finished = None
+        self.stages = {}
+        self.counters = {}
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"seconds": 0.0, "count": 0, "max_seconds": 0.0})
+            entry["seconds"] += seconds
+            entry["count"] += 1
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        if self._finished is None:
+            self._finished = time.perf_counter()
+
+    def snapshot(self):
+        """
+        JSONで保存できる辞書として内訳を返します
+        """
+        with self._lock:
+            end = self._finished if self._finished is not None else time.perf_counter()
+            return {
+                "job_id": self.job_id,
+                "wall_seconds": end - self._started,
+                "stages": {stage: dict(entry) for stage, entry in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+_current_job = contextvars.ContextVar("minutes_job_metrics", default=None)
+
+def current_job():
+    """
+    実行中のジョブの JobMetrics（ジョブの外ではNone）
+    """
+    return _current_job.get()
+
+@contextmanager
+def job(job_id=None):
+    """
+    ブロック内の計測を1つのジョブの内訳として集計します
+    :return: JobMetrics
+    """
+    metrics = JobMetrics(job_id)
+    token = _current_job.set(metrics)
+    status = "error"
+    try:
+        yield metrics
+        status = "ok"
+    finally:
+        metrics.finish()
+        _current_job.reset(token)
+        _registry.inc("minutes_jobs_total", 1, {"status": status})
+        _log("job", job_id=metrics.job_id, status=status, wall_seconds=round(metrics.snapshot()["wall_seconds"], 3))
+
+def bind(fn):
+    """
+    現在のジョブを引き継いで fn を実行する関数を返します（スレッドプールに渡す処理に使用）
+    """
+    metrics = _current_job.get()
+    def run(*args, **kwargs):
+        token = _current_job.set(metrics)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_job.reset(token)
+    return run
+
+class _Timer:
+    def __init__(self):
+        self.seconds = 0.0
+
+@contextmanager
+def timer(stage, **fields):
+    """
+    ブロックの所要時間を段階 stage として記録します。終了後は yield したオブジェクトの seconds で参照できます。
+    :param fields: 構造化ログに追加で出力する値
+    """
+    result = _Timer()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield result
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        result.seconds = time.perf_counter() - started
+        record_time(stage, result.seconds, error=error, **fields)
+
+def record_time(stage, seconds, **fields):
+    """
+    計測済みの所要時間を段階 stage として記録します
+    """
+    _registry.observe("minutes_stage_seconds", seconds, {"stage": stage})
+    metrics = _current_job.get()
+    if metrics is not None:
+        metrics.add_time(stage, seconds)
+    _log("stage", stage=stage, seconds=round(seconds, 4), **fields)
+
+def record_bytes_uploaded(service, size):
+    _count("minutes_bytes_uploaded_total", size, {"service": service}, "bytes_uploaded")
+
+def record_tokens(model, input_tokens=0, output_tokens=0, cached_input_tokens=0):
+    """
+    トークン使用量を記録します。cached_input_tokens は入力のうちプロンプトキャッシュが適用された分です。
+    """
+    _count("minutes_tokens_total", input_tokens, {"model": model, "kind": "input"}, "input_tokens")
+    _count("minutes_tokens_total", cached_input_tokens, {"model": model, "kind": "cached_input"}, "cached_input_tokens")
+    _count("minutes_tokens_total", output_tokens, {"model": model, "kind": "output"}, "output_tokens")
+
+def record_audio_seconds(original_seconds, sent_seconds):
+    """
+    前処理（無音区間の除去・速度変更）前後の音声の長さを記録します
+    """
+    _count("minutes_audio_seconds_total", round(original_seconds), {"kind": "original"}, "audio_seconds")
+    _count("minutes_audio_seconds_total", round(sent_seconds), {"kind": "sent"}, "sent_audio_seconds")
+
+def record_retry(reason):
+    _count("minutes_retries_total", 1, {"reason": reason}, "retries")
+
+def record_cache(namespace, hit):
+    result = "hit" if hit else "miss"
+    _count("minutes_cache_requests_total", 1, {"namespace": namespace, "result": result}, f"cache_{result}s")
+
+def _count(name, value, labels, job_counter):
+    if not value:
+        return
+    _registry.inc(name, value, labels)
+    metrics = _current_job.get()
+    if metrics is not None:
+        metrics.add(job_counter, value)
+    _log("count", metric=name, value=value, **labels)
+
+def _log(event, **fields):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    metrics = _current_job.get()
+    record = {"ts": round(time.time(), 3), "event": event, "pid": os.getpid()}
+    if metrics is not None and "job_id" not in fields:
+        record["job_id"] = metrics.job_id
+    record.update({k: v for k, v in fields.items() if v is not None})
+    logger.info(json.dumps(record, ensure_ascii=False))
+
+_app_runs = {"cold_start": None, "import_seconds": None, "reruns": 0, "rerun_total": 0.0, "last_rerun": None, "max_rerun": 0.0}
+_app_runs_lock = threading.Lock()
+
+def record_app_run(seconds, import_seconds=0.0):
+    """
+    Streamlitのスクリプト実行1回の所要時間を記録します。プロセスで最初の実行を起動（cold_start）、以降を再実行（rerun）とします。
+    :param import_seconds: そのうちスクリプト冒頭のインポートにかかった時間
+    """
+    with _app_runs_lock:
+        kind = "cold_start" if _app_runs["cold_start"] is None else "rerun"
+        if kind == "cold_start":
+            _app_runs["cold_start"] = seconds
+            _app_runs["import_seconds"] = import_seconds
+        else:
+            _app_runs["reruns"] += 1
+            _app_runs["rerun_total"] += seconds
+            _app_runs["last_rerun"] = seconds
+            _app_runs["max_rerun"] = max(_app_runs["max_rerun"], seconds)
+    _registry.observe("minutes_app_run_seconds", seconds, {"kind": kind})
+    _log("app_run", kind=kind, seconds=round(seconds, 4), import_seconds=round(import_seconds, 4))
+
+def app_run_summary():
+    """
+    このプロセスでの起動と再実行の所要時間の集計を返します
+    """
+    with _app_runs_lock:
+        summary = dict(_app_runs)
+    summary["avg_rerun"] = summary.pop("rerun_total") / summary["reruns"] if summary["reruns"] else None
+    return summary
+
+def render_prometheus():
+    """
+    このプロセスの計測値をPrometheusのテキスト形式で返します
+    """
+    return _registry.render()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    """
+    /metrics を公開するHTTPサーバーをバックグラウンドのスレッドで起動します（プロセスごとに一度だけ）。
+    :param port: 待ち受けるポート（0なら起動しない）
+    :return: 待ち受けているポート、または起動しなかった場合はNone
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logging.getLogger(__name__).warning("メトリクスサーバーを起動できませんでした（ポート %s）: %s", port, e)
+                return None
+            threading.Thread(target=_server.serve_forever, name="minutes-metrics", daemon=True).start()
+        return _server.server_address[1]
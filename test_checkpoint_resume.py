@@ -0,0 +1,73 @@
+"""
+キャッシュを無効にした場合のチェックポイントからの再開（transcribe_audio の resume）のテスト
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import checkpoints
+import minutes_webapp as app
+
+SAVED = {"text": "保存済み", "segments": [{"start": 0.0, "end": 5.0, "text": "保存済み"}]}
+
+class FakeBackend:
+    name = "openai"
+    model_id = "fake-model"
+    max_workers = 1
+    max_upload_bytes = app.MAX_SIZE
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, path, language):
+        self.calls.append(path)
+        return SimpleNamespace(text="新しい結果", segments=[{"start": 0.0, "end": 3.0, "text": "新しい結果"}])
+
+class FakeUpload:
+    path = "/tmp/meeting.m4a"
+    size = 1024
+
+    def sha256(self):
+        return "0" * 64
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "CACHE_ENABLED", False)
+    monkeypatch.setattr(app, "get_cache", lambda: None)
+    monkeypatch.setattr(app.checkpoints, "open_checkpoint",
+                        lambda checkpoint_id: checkpoints.ChunkCheckpoint(checkpoint_id, str(tmp_path)))
+    key = app.make_cache_key(FakeUpload().sha256(), FakeBackend.model_id, "ja", app.CHUNK_CODEC)
+    saved = checkpoints.ChunkCheckpoint(key, str(tmp_path))
+    saved.begin([{"start": 0.0, "end": 5.0, "format": "opus"}], backend="openai", model="whisper-1", language="ja")
+    saved.mark_done(0, SAVED)
+    return saved
+
+def _transcribe(backend, resume):
+    return app.transcribe_audio(FakeUpload(), "key", backend=backend, trim_silence=False, tempo=1.0, resume=resume)
+
+def test_retry_resumes_from_checkpoint_with_cache_disabled(checkpoint):
+    backend = FakeBackend()
+    text, segments = _transcribe(backend, resume=True)
+    assert backend.calls == []
+    assert text == "保存済み\n"
+    assert [seg.text for seg in segments] == ["保存済み"]
+
+def test_fresh_run_ignores_checkpoint_with_cache_disabled(checkpoint, tmp_path):
+    backend = FakeBackend()
+    text, _ = _transcribe(backend, resume=None)
+    assert backend.calls == [FakeUpload.path]
+    assert text == "新しい結果"
+    # 以前の記録は削除され、次の再試行で使われない
+    assert not checkpoints.ChunkCheckpoint(checkpoint.checkpoint_id, str(tmp_path)).exists()
+
+def test_begin_keeps_done_chunks_and_reset_clears_them(checkpoint):
+    chunks = [{"start": 0.0, "end": 5.0, "format": "opus"}, {"start": 5.0, "end": 9.0, "format": "opus"}]
+    checkpoint.begin(chunks)
+    assert checkpoint.result(0) == SAVED
+    assert checkpoint.failed() == [1]
+    checkpoint.mark_failed(1, RuntimeError("timeout"))
+    assert checkpoint.chunks[1]["error"] == "timeout"
+    checkpoint.reset()
+    assert not checkpoint.exists()
+    checkpoint.begin(chunks)
+    assert checkpoint.failed() == [0, 1]
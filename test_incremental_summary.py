@@ -0,0 +1,44 @@
+"""
+チャンクごとの部分要約（IncrementalSummarizer）が、重なりを除いた文字起こしを要約することのテスト
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import minutes_webapp as app
+from segment_store import SegmentStore
+
+def _chunk(start, end, segments):
+    store = SegmentStore()
+    for seg_start, seg_end, text in segments:
+        store.append(seg_start, seg_end, text)
+    return {"start": start, "end": end}, SimpleNamespace(text="", segments=store, chunk={"start": start, "end": end})
+
+# 2秒ずつ重ねて分割した3チャンク（重なり区間の発言は両方のチャンクに含まれる）
+CHUNKS = [
+    _chunk(0.0, 10.0, [(0.0, 4.0, "おはようございます"), (4.0, 8.5, "議題は予算です"), (8.5, 10.0, "まず")]),
+    _chunk(8.0, 18.0, [(8.0, 8.6, "す"), (8.6, 10.0, "まず"), (10.0, 16.5, "前年度の実績から"), (16.5, 18.0, "次に")]),
+    _chunk(16.0, 25.0, [(16.5, 18.0, "次に"), (18.0, 25.0, "今年度の計画です")]),
+]
+
+@pytest.fixture
+def windows(monkeypatch):
+    contents = []
+    monkeypatch.setattr(app, "get_openai_client", lambda api_key: object())
+    monkeypatch.setattr(app, "_complete", lambda client, model, instructions, content, stats: contents.append(content) or "部分要約")
+    monkeypatch.setattr(app, "_reduce_partials", lambda client, model, partials, stats, summary_format: "要約")
+    monkeypatch.setattr(app, "get_cache", lambda: None)
+    return contents
+
+@pytest.mark.parametrize("order", [[0, 1, 2], [2, 0, 1], [1, 2, 0]])
+def test_windows_contain_stitched_segments_only(windows, order):
+    summarizer = app.IncrementalSummarizer("key", window_tokens=20)
+    for index in order:
+        summarizer.add_chunk(index, CHUNKS[index][1])
+    stitched = app.stitch_chunk_segments([(chunk, transcript.segments) for chunk, transcript in CHUNKS])
+    assert summarizer.transcript_so_far() == stitched.joined_text("\n")
+    assert summarizer.finish(stitched.joined_text("\n"), stitched) == "要約"
+    lines = [line for content in windows for line in content.splitlines()[1:]]
+    assert lines == [app._segment_window_line(seg).rstrip("\n") for seg in stitched]
+    assert sum("まず" in line for line in lines) == 1
+    assert sum("次に" in line for line in lines) == 1
@@ -0,0 +1,28 @@
+"""
+ワーカープロセスの起動（ensure_workers）のテスト
+"""
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import job_queue
+
+def test_concurrent_sessions_start_a_single_worker_pool(tmp_path, monkeypatch):
+    started = []
+
+    def fake_popen(*args, **kwargs):
+        # 起動に時間がかかる間に、別のセッションが pid ファイルを確認する状況を作る
+        time.sleep(0.05)
+        started.append(args)
+        return SimpleNamespace(pid=os.getpid())
+
+    monkeypatch.setattr(job_queue, "JOBS_DIR", str(tmp_path))
+    monkeypatch.setattr(job_queue.subprocess, "Popen", fake_popen)
+    threads = [threading.Thread(target=job_queue.ensure_workers) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(started) == 1
+    assert (tmp_path / "workers.pid").read_text() == str(os.getpid())
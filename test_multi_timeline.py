@@ -0,0 +1,36 @@
+"""
+複数ファイルを1つの会議のタイムラインに並べる処理（plan_multi_timeline）のテスト
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from minutes_webapp import (
+    MULTI_MODE_SEQUENTIAL, MULTI_MODE_TRACKS, MULTI_ORDER_FILE, MULTI_ORDER_RECORDED, plan_multi_timeline,
+)
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def test_sequential_places_files_back_to_back():
+    plan = plan_multi_timeline([60.0, 30.0, 40.0], [None, None, None], MULTI_MODE_SEQUENTIAL, MULTI_ORDER_FILE)
+    assert plan == [(0, 0.0), (1, 60.0), (2, 90.0)]
+
+def test_sequential_unknown_duration_uses_transcribed_end():
+    # ffprobeで長さを取得できなかったファイルは、最後の発言の終了時刻までを長さとして次のファイルを置く
+    plan = plan_multi_timeline([60.0, None, 40.0], [None, None, None], MULTI_MODE_SEQUENTIAL, MULTI_ORDER_FILE,
+                               ends=[58.0, 25.5, 39.0])
+    assert plan == [(0, 0.0), (1, 60.0), (2, 85.5)]
+
+def test_sequential_unknown_duration_without_transcript_end_is_refused():
+    with pytest.raises(ValueError):
+        plan_multi_timeline([60.0, None], [None, None], MULTI_MODE_SEQUENTIAL, MULTI_ORDER_FILE)
+
+def test_sequential_recorded_order_keeps_gaps_but_never_overlaps():
+    starts = [START + timedelta(seconds=100), START, START + timedelta(seconds=10)]
+    plan = plan_multi_timeline([60.0, 30.0, 40.0], starts, MULTI_MODE_SEQUENTIAL, MULTI_ORDER_RECORDED)
+    assert plan == [(1, 0.0), (2, 30.0), (0, 100.0)]
+
+def test_tracks_overlay_by_recorded_start():
+    starts = [START + timedelta(seconds=5), START]
+    plan = plan_multi_timeline([None, None], starts, MULTI_MODE_TRACKS, MULTI_ORDER_RECORDED)
+    assert plan == [(1, 0.0), (0, 5.0)]
@@ -0,0 +1,84 @@
+"""
+Notionへの書き込み（write_to_notion）の100ブロック単位の分割のテスト
+"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+import minutes_webapp as app
+
+class FakeNotion:
+    """
+    Notion APIの代わりに、ページ・ブロックの親子関係をメモリに保持するクライアント
+    （子ブロックは100個まで、子ブロックを追加できる見出しは折りたたみ見出しだけ）
+    """
+    def __init__(self):
+        self.block_by_id = {}
+        self.children_of = {}
+        self.databases = SimpleNamespace(retrieve=lambda database_id: {
+            "properties": {"名前": {"type": "title"}, "日付": {"type": "date"}}
+        })
+        self.pages = SimpleNamespace(create=self._create_page)
+        self.blocks = SimpleNamespace(children=SimpleNamespace(
+            append=lambda block_id, children: {"results": self._store(block_id, children)},
+            list=lambda block_id: {"results": self.children_of.get(block_id, [])[:app.NOTION_MAX_CHILDREN]},
+        ))
+
+    def _store(self, parent_id, children):
+        if len(children) > app.NOTION_MAX_CHILDREN:
+            raise ValueError("body.children.length should be ≤ 100")
+        parent = self.block_by_id.get(parent_id)
+        if parent is not None and not parent[parent["type"]].get("is_toggleable"):
+            raise ValueError("折りたたみでないブロックには子ブロックを追加できません")
+        created = [{**child, "id": str(uuid.uuid4())} for child in children]
+        for block in created:
+            self.block_by_id[block["id"]] = block
+        self.children_of.setdefault(parent_id, []).extend(created)
+        return created
+
+    def _create_page(self, parent, properties, children):
+        self.page_id = str(uuid.uuid4())
+        self._store(self.page_id, children)
+        return {"id": self.page_id, "url": f"https://notion.so/{self.page_id}"}
+
+    def page_blocks(self):
+        return self.children_of[self.page_id]
+
+    def text_of(self, block):
+        return block[block["type"]]["rich_text"][0]["text"]["content"]
+
+@pytest.fixture
+def notion(monkeypatch):
+    fake = FakeNotion()
+    monkeypatch.setattr(app, "get_notion_client", lambda api_key: fake)
+    monkeypatch.setattr(app, "NOTION_REQUESTS_PER_SECOND", 1000)
+    app._notion_schema_cache.clear()
+    return fake
+
+def _transcript_parts(notion):
+    return [block for block in notion.page_blocks()
+            if block["type"] == "heading_3" and block["heading_3"].get("is_toggleable")]
+
+def test_long_transcript_goes_under_part_toggles(notion):
+    transcription = "\n".join(f"発言{i}" + "あ" * 1990 for i in range(250))
+    stats = {}
+    result = app.write_to_notion("key", "db", "会議", transcription, "要約", "a.m4a", "2024-01-01", stats=stats)
+    assert "error" not in stats, result
+    parts = _transcript_parts(notion)
+    assert len(parts) == 3
+    assert [len(notion.children_of[p["id"]]) for p in parts] == [100, 100, 50]
+
+def test_summary_headings_past_first_batch_are_not_used_as_toggles(notion):
+    # サマリーの見出しが100ブロックを超え、文字起こしの見出しが2回目以降のバッチに入る場合
+    summary = "\n".join(f"# 見出し{i}\n- 項目{i}" for i in range(60))
+    transcription = "\n".join("い" * 1990 for _ in range(125))
+    stats = {}
+    result = app.write_to_notion("key", "db", "会議", transcription, summary, "a.m4a", "2024-01-01", stats=stats)
+    assert "error" not in stats, result
+    parts = _transcript_parts(notion)
+    assert [notion.text_of(p) for p in parts] == ["文字起こし（1/2）", "文字起こし（2/2）"]
+    assert [len(notion.children_of[p["id"]]) for p in parts] == [100, 25]
+    summary_headings = [b for b in notion.page_blocks() if b["type"] == "heading_3" and b not in parts]
+    assert len(summary_headings) == 60
+    assert not any(notion.children_of.get(b["id"]) for b in summary_headings)
@@ -0,0 +1,20 @@
+"""
+音声の分割計画（plan_chunks）のテスト
+"""
+import pytest
+
+from minutes_webapp import plan_chunks
+
+def test_cuts_at_latest_silence_before_target():
+    plan = plan_chunks(250.0, [(80.0, 82.0), (95.0, 97.0), (190.0, 192.0)], 100.0, search_window=30, overlap=2.0)
+    assert plan == [(0.0, 96.0), (96.0, 191.0), (191.0, 250.0)]
+
+def test_overlaps_when_no_silence_is_found():
+    plan = plan_chunks(250.0, [], 100.0, overlap=2.0)
+    assert plan == [(0.0, 100.0), (98.0, 198.0), (196.0, 250.0)]
+
+@pytest.mark.parametrize("target_duration", [2.0, 1.0])
+def test_target_not_longer_than_overlap_is_refused(target_duration):
+    # 開始時刻が進まず無限ループになるため、計画を立てずにエラーにする
+    with pytest.raises(ValueError):
+        plan_chunks(250.0, [], target_duration, overlap=2.0)
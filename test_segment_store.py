@@ -0,0 +1,49 @@
+"""
+セグメントの列形式の保存（SegmentStore）と前処理の時刻の対応（TimeMap）の保存・復元のテスト
+"""
+import json
+
+import pytest
+
+from minutes_webapp import TimeMap
+from segment_store import SegmentStore
+
+def _store(speakers=False):
+    store = SegmentStore()
+    store.append(0.0, 2.5, "おはようございます")
+    store.append(2.5, 6.25, "Budget review 🎉")
+    store.append(6.25, 9.0, "")
+    if speakers:
+        store.set_speaker("話者A")
+    return store
+
+def _rows(store):
+    return [(seg.start, seg.end, seg.text, store.speaker(i)) for i, seg in enumerate(store)]
+
+@pytest.mark.parametrize("speakers", [False, True])
+def test_bytes_round_trip(speakers):
+    store = _store(speakers)
+    restored = SegmentStore.from_bytes(store.to_bytes())
+    assert _rows(restored) == _rows(store)
+    assert restored.joined_text() == store.joined_text()
+
+@pytest.mark.parametrize("speakers", [False, True])
+def test_dict_round_trip_through_json(speakers):
+    store = _store(speakers)
+    restored = SegmentStore.from_dict(json.loads(json.dumps(store.to_dict(), ensure_ascii=False)))
+    assert _rows(restored) == _rows(store)
+
+def test_from_bytes_rejects_other_data():
+    with pytest.raises(ValueError):
+        SegmentStore.from_bytes(b"\0" * 64)
+
+def test_time_map_round_trip_maps_times_back_to_recording():
+    time_map = TimeMap([(0.0, 10.0), (20.0, 30.0)], tempo=2.0, original_seconds=35.0)
+    restored = TimeMap.from_dict(json.loads(json.dumps(time_map.to_dict())))
+    assert restored.sent_seconds == time_map.sent_seconds == 10.0
+    assert restored.original_seconds == 35.0
+    # 送信した音声の7.5秒は、詰めた音声の15秒（2つ目の区間の5秒目）
+    assert restored.to_original(7.5) == time_map.to_original(7.5) == 25.0
+    # 除去した無音区間の境界は、開始時刻なら次の区間の始まり、終了時刻なら前の区間の終わり
+    assert restored.to_original(5.0) == 20.0
+    assert restored.to_original(5.0, is_end=True) == 10.0